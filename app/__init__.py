@@ -5,10 +5,11 @@ from flask_dance.contrib.github import make_github_blueprint
 from flask_dance.contrib.google import make_google_blueprint
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from app.sharding import ShardedSession
 from config import config
 
-# Initialize extensions
-db = SQLAlchemy()
+# Initialize extensions; the session routes post tables to their shard
+db = SQLAlchemy(session_options={'class_': ShardedSession})
 login_manager = LoginManager()
 jwt = JWTManager()
 
@@ -27,6 +28,27 @@ def create_app(config_name='default'):
     # Configure CORS
     CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
     
+    # Structured JSON logs written by a background thread, with request ids
+    from app import logs
+    logs.init_app(app)
+    
+    # Per-request profiling on demand; registered first so it wraps the
+    # other request hooks
+    from app.profiling import request_profiler
+    request_profiler.init_app(app)
+    
+    # Memory diagnostics: tracemalloc snapshots and sampled per-endpoint RSS
+    from app.memory import memory_diagnostics
+    memory_diagnostics.init_app(app)
+    
+    # Compiled-statement cache hits and misses, for the diagnostics API
+    from app.statements import statement_cache
+    statement_cache.init_app(app)
+    
+    # Cached dependency checks behind /api/health/ready
+    from app.health import readiness
+    readiness.init_app(app)
+    
     # OAuth Blueprints
     github_bp = make_github_blueprint(
         client_id=app.config.get('GITHUB_CLIENT_ID'),
@@ -42,6 +64,54 @@ def create_app(config_name='default'):
     )
     app.register_blueprint(google_bp, url_prefix='/api/auth')
     
+    # Revoked JWTs, mirrored in memory for the per-request check
+    from app.token_blocklist import TokenBlocklist
+    TokenBlocklist(app)
+    
+    # Posts partitioned by author across POST_SHARD_URLS
+    from app.sharding import post_shards
+    post_shards.init_app(app)
+    
+    # Post bodies compressed at rest; existing rows converted in the background
+    from app.compression import compression_backfill
+    compression_backfill.init_app(app)
+    
+    # Buffered post view counts
+    from app.view_counter import view_counter
+    view_counter.init_app(app)
+    
+    # Trending scores, recomputed in the background for recently changed posts
+    from app.trending import trending_scorer
+    trending_scorer.init_app(app)
+    
+    # Daily site stats: rollups bumped on writes, recent days recounted in the background
+    from app.daily_stats import daily_stats
+    daily_stats.init_app(app)
+    
+    # Change log behind the delta sync endpoint
+    from app.change_log import register_change_listeners
+    register_change_listeners()
+    
+    # Home timelines, fanned out when posts are published
+    from app.timeline import register_timeline_listeners
+    register_timeline_listeners()
+    
+    # Per-tag published counts, kept in step with post writes
+    from app.tags import register_tag_listeners
+    register_tag_listeners()
+    
+    # Live post events for SSE clients, fed from the change log
+    from app.post_events import post_events
+    post_events.init_app(app)
+    
+    # Image uploads: spooled to disk while parsing, thumbnails in a process pool
+    from app import media
+    media.init_app(app)
+    
+    # CLI commands (flask <command>)
+    from app.commands import register_commands
+    register_commands(app)
+    
     # Register API blueprints
     from app.api.health import bp as health_bp
     app.register_blueprint(health_bp, url_prefix='/api')
@@ -55,6 +125,22 @@ def create_app(config_name='default'):
     from app.api.users import bp as users_bp
     app.register_blueprint(users_bp, url_prefix='/api/users')
     
+    # Crawler-facing feeds and sitemaps live at the site root
+    from app.api.feeds import bp as feeds_bp
+    app.register_blueprint(feeds_bp)
+    
+    from app.api.media import bp as media_bp
+    app.register_blueprint(media_bp, url_prefix='/api/media')
+    
+    from app.api.batch import bp as batch_bp
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+    
+    from app.api.admin import bp as admin_bp
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    
+    from app.api.diagnostics import bp as diagnostics_bp
+    app.register_blueprint(diagnostics_bp, url_prefix='/api/diagnostics')
+    
     # Set up OAuth signal handlers
     from flask_dance.consumer import oauth_authorized
     
@@ -73,22 +159,72 @@ def create_app(config_name='default'):
     # Create database tables if they don't exist
     with app.app_context():
         db.create_all()
-        # Ensure new columns exist (SQLite simple runtime migration)
+        from app.models import User
+        # "user" is a reserved word on PostgreSQL; let the dialect quote table names
+        preparer = db.engine.dialect.identifier_preparer
+        user_table = preparer.format_table(User.__table__)
+        # Ensure new columns and indexes exist (SQLite simple runtime migration)
         try:
             from sqlalchemy import inspect, text
             insp = inspect(db.engine)
-            cols = [c['name'] for c in insp.get_columns('user')]
+            new_columns = {
+                'user': [('email_verified', 'BOOLEAN'), ('email_verified_at', 'DATETIME'),
+                         ('follower_count', 'INTEGER NOT NULL DEFAULT 0'),
+                         ('fanout_on_read', 'BOOLEAN NOT NULL DEFAULT 0'),
+                         ('avatar', 'VARCHAR(80)'), ('post_shard', 'INTEGER')],
+                'post': [('version', 'INTEGER NOT NULL DEFAULT 1')],
+                'post_stats': [('trending_score', 'FLOAT')],
+            }
             stmts = []
-            if 'email_verified' not in cols:
-                stmts.append("ALTER TABLE user ADD COLUMN email_verified BOOLEAN")
-            if 'email_verified_at' not in cols:
-                stmts.append("ALTER TABLE user ADD COLUMN email_verified_at DATETIME")
+            for table, columns in new_columns.items():
+                cols = [c['name'] for c in insp.get_columns(table)]
+                for name, ddl in columns:
+                    if name not in cols:
+                        stmts.append(f"ALTER TABLE {preparer.quote(table)} ADD COLUMN {name} {ddl}")
+            stmts += [
+                "CREATE INDEX IF NOT EXISTS ix_post_updated_at ON post (updated_at)",
+                "CREATE INDEX IF NOT EXISTS ix_post_stats_updated_at ON post_stats (updated_at)",
+                "CREATE INDEX IF NOT EXISTS ix_post_stats_trending_score ON post_stats (trending_score)",
+                "CREATE INDEX IF NOT EXISTS ix_post_user_created ON post (user_id, created_at)",
+                "CREATE INDEX IF NOT EXISTS ix_post_published_created ON post (published, created_at, id)",
+                f"CREATE INDEX IF NOT EXISTS ix_user_created_at ON {user_table} (created_at)",
+                f"CREATE INDEX IF NOT EXISTS ix_user_email_verified_at ON {user_table} (email_verified_at)",
+            ]
             for s in stmts:
                 db.session.execute(text(s))
-            if stmts:
-                db.session.commit()
+            db.session.commit()
         except Exception:
             db.session.rollback()
+        # Provider accounts: index pre-existing oauth tables and copy links
+        # that only live in the legacy user.github_id / user.google_id columns.
+        # Separate transactions, so a failed backfill cannot undo the index
+        from sqlalchemy import text
+        from app.models import OAuth
+        oauth_table = OAuth.__tablename__
+        try:
+            db.session.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS uq_oauth_provider_account "
+                f"ON {oauth_table} (provider, provider_user_id)"))
+            db.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_oauth_provider_user "
+                f"ON {oauth_table} (provider, user_id)"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"OAuth account indexes not created: {e}")
+        try:
+            for provider in ('github', 'google'):
+                db.session.execute(text(
+                    f"INSERT INTO {oauth_table} (provider, provider_user_id, token, user_id) "
+                    f"SELECT '{provider}', u.{provider}_id, '{{}}', u.id FROM {user_table} u "
+                    f"WHERE u.{provider}_id IS NOT NULL AND NOT EXISTS ("
+                    f"SELECT 1 FROM {oauth_table} o WHERE o.provider = '{provider}' "
+                    f"AND o.provider_user_id = u.{provider}_id)"))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"OAuth account backfill failed: {e}")
+        post_shards.create_all()
         print("✅ Database tables created successfully!")
     
     return app
@@ -0,0 +1,41 @@
+import hmac
+from datetime import date, datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request
+
+from app.daily_stats import METRICS, stats_between
+
+bp = Blueprint('admin', __name__)
+
+@bp.before_request
+def require_token():
+    """Admin endpoints are only served to callers holding ADMIN_TOKEN."""
+    token = current_app.config.get('ADMIN_TOKEN')
+    value = request.headers.get('X-Admin-Token')
+    if not (token and value and hmac.compare_digest(value.encode(), token.encode())):
+        return jsonify({'error': 'Not found'}), 404
+
+@bp.route('/stats', methods=['GET'])
+def get_stats():
+    """Daily posts, sign-ups, verified emails and OAuth logins from the rollups.
+
+    ``?from=YYYY-MM-DD&to=YYYY-MM-DD``, both inclusive; the last 30 days by default.
+    """
+    try:
+        end = date.fromisoformat(request.args['to']) if 'to' in request.args else datetime.utcnow().date()
+        start = date.fromisoformat(request.args['from']) if 'from' in request.args else end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'error': 'Validation error', 'details': 'from and to must be YYYY-MM-DD dates'}), 400
+    limit = current_app.config['STATS_MAX_DAYS']
+    if start > end:
+        return jsonify({'error': 'Validation error', 'details': 'from must not be after to'}), 400
+    if (end - start).days + 1 > limit:
+        return jsonify({'error': 'Validation error', 'details': f'At most {limit} days per query'}), 400
+
+    days = stats_between(start, end)
+    return jsonify({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'days': days,
+        'totals': {name: sum(day[name] for day in days) for name in METRICS},
+    })
@@ -1,15 +1,15 @@
 from flask import Blueprint, request, jsonify, redirect, url_for, current_app
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity, get_jwt
 from flask_dance.contrib.github import github
 from flask_dance.contrib.google import google
 from werkzeug.security import check_password_hash
-import json
-import pdb
 
-from app import db, login_manager
+from app import db, login_manager, jwt
 from app.models import User, OAuth
 from app.schemas import LoginSchema, RegisterSchema, TokenSchema, UserSchema
+from app.statements import user_by_email, user_by_username
 from app.utils import create_timed_token, verify_timed_token, send_email
+from app.token_blocklist import get_token_blocklist, issue_time_claims
 
 bp = Blueprint('auth_api', __name__)
 
@@ -22,7 +22,17 @@ user_schema = UserSchema()
 @login_manager.user_loader
 def load_user(user_id):
     """Load user by ID for Flask-Login."""
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    """Reject revoked tokens; answered from memory, not the database."""
+    return get_token_blocklist().is_revoked(jwt_payload)
+
+@jwt.additional_claims_loader
+def add_issue_time(identity):
+    """Stamp tokens to the millisecond, so revoke-all spares only later ones."""
+    return issue_time_claims()
 
 @bp.route('/login', methods=['POST'])
 def login():
@@ -31,9 +41,7 @@ def login():
         data = login_schema.load(request.json)
     except Exception as e:
         return jsonify({'error': 'Validation error', 'details': str(e)}), 400
-    pdb.set_trace()
-    user = User.query.filter_by(email=data['email']).first()
-    pdb.set_trace()
+    user = db.session.scalars(user_by_email, {'email': data['email']}).first()
     if user and user.check_password(data['password']):
         if not user.email_verified:
             return jsonify({'error': 'Email not verified'}), 403
@@ -53,10 +61,10 @@ def register():
         return jsonify({'error': 'Validation error', 'details': str(e)}), 400
     
     # Check if user exists
-    if User.query.filter_by(email=data['email']).first():
+    if db.session.scalars(user_by_email, {'email': data['email']}).first():
         return jsonify({'error': 'Email already registered'}), 400
     
-    if User.query.filter_by(username=data['username']).first():
+    if db.session.scalars(user_by_username, {'username': data['username']}).first():
         return jsonify({'error': 'Username already taken'}), 400
     
     # Create user
@@ -87,7 +95,7 @@ def verify_email():
     frontend_base = 'http://localhost:3000'
     if not data or data.get('sub') != 'verify_email':
         return redirect(f"{frontend_base}/verify-email?status=failed&reason=invalid_or_expired")
-    user = User.query.get(int(data['uid']))
+    user = db.session.get(User, int(data['uid']))
     if not user:
         return redirect(f"{frontend_base}/verify-email?status=failed&reason=user_not_found")
     if not user.email_verified:
@@ -104,7 +112,7 @@ def resend_verification():
     email = body.get('email')
     if not email:
         return jsonify({'error': 'Email is required'}), 400
-    user = User.query.filter_by(email=email).first()
+    user = db.session.scalars(user_by_email, {'email': email}).first()
     # Do not leak whether account exists or verified
     if user and not user.email_verified:
         secret = current_app.config.get('SECRET_KEY', 'dev-secret-key')
@@ -116,12 +124,11 @@ def resend_verification():
 
 @bp.route('/forgot-password', methods=['POST'])
 def forgot_password():
-    pdb.set_trace()
     body = request.get_json(force=True) or {}
     email = body.get('email')
     if not email:
         return jsonify({'error': 'Email is required'}), 400
-    user = User.query.filter_by(email=email).first()
+    user = db.session.scalars(user_by_email, {'email': email}).first()
     # Do not leak account existence
     if user:
         secret = current_app.config.get('SECRET_KEY', 'dev-secret-key')
@@ -133,7 +140,6 @@ def forgot_password():
 
 @bp.route('/reset-password', methods=['POST'])
 def reset_password():
-    pdb.set_trace()
     body = request.get_json(force=True) or {}
     token = body.get('token')
     new_password = body.get('password')
@@ -143,19 +149,33 @@ def reset_password():
     data = verify_timed_token(token, secret)
     if not data or data.get('sub') != 'reset_password':
         return jsonify({'error': 'Invalid or expired token'}), 400
-    user = User.query.get(int(data['uid']))
+    user = db.session.get(User, int(data['uid']))
     if not user:
         return jsonify({'error': 'User not found'}), 404
     user.set_password(new_password)
     db.session.commit()
     return jsonify({'message': 'Password reset successful'})
 
+@bp.route('/logout', methods=['POST'])
+@jwt_required()
+def logout():
+    """Revoke the access token used for this request."""
+    get_token_blocklist().revoke(get_jwt())
+    return jsonify({'message': 'Successfully logged out'})
+
+@bp.route('/revoke-all', methods=['POST'])
+@jwt_required()
+def revoke_all():
+    """Revoke every access token issued to the current user."""
+    get_token_blocklist().revoke_all(get_jwt_identity())
+    return jsonify({'message': 'All sessions have been logged out'})
+
 @bp.route('/me', methods=['GET'])
 @jwt_required()
 def get_current_user():
     """Get current user info."""
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
@@ -189,34 +209,21 @@ def github_login():
         return jsonify({'error': 'Could not get email from GitHub'}), 400
     
     # Find or create user
-    user = User.query.filter_by(github_id=github_user_id).first()
+    user = OAuth.find_user('github', github_user_id)
     
     if not user:
-        existing_user = User.query.filter_by(email=primary_email).first()
+        existing_user = db.session.scalars(user_by_email, {'email': primary_email}).first()
         if existing_user:
-            existing_user.github_id = github_user_id
             user = existing_user
         else:
             user = User(
                 username=github_info.get('login', ''),
-                email=primary_email,
-                github_id=github_user_id
+                email=primary_email
             )
             db.session.add(user)
     
-    # Store OAuth token
-    token = github.token
-    oauth = OAuth.query.filter_by(provider='github', user=user).first()
-    if oauth:
-        oauth.token = json.dumps(token)
-    else:
-        oauth = OAuth(
-            provider='github',
-            provider_user_id=github_user_id,
-            token=json.dumps(token),
-            user=user
-        )
-        db.session.add(oauth)
+    # Link account and store OAuth token
+    OAuth.link(user, 'github', github_user_id, github.token)
     
     db.session.commit()
     
@@ -241,34 +248,21 @@ def google_login():
     google_user_id = google_info['id']
     
     # Find or create user
-    user = User.query.filter_by(google_id=google_user_id).first()
+    user = OAuth.find_user('google', google_user_id)
     
     if not user:
-        existing_user = User.query.filter_by(email=google_info['email']).first()
+        existing_user = db.session.scalars(user_by_email, {'email': google_info['email']}).first()
         if existing_user:
-            existing_user.google_id = google_user_id
             user = existing_user
         else:
             user = User(
                 username=google_info.get('name', '').replace(' ', '_').lower(),
-                email=google_info['email'],
-                google_id=google_user_id
+                email=google_info['email']
             )
             db.session.add(user)
     
-    # Store OAuth token
-    token = google.token
-    oauth = OAuth.query.filter_by(provider='google', user=user).first()
-    if oauth:
-        oauth.token = json.dumps(token)
-    else:
-        oauth = OAuth(
-            provider='google',
-            provider_user_id=google_user_id,
-            token=json.dumps(token),
-            user=user
-        )
-        db.session.add(oauth)
+    # Link account and store OAuth token
+    OAuth.link(user, 'google', google_user_id, google.token)
     
     db.session.commit()
     
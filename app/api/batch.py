@@ -0,0 +1,94 @@
+"""Several read requests in one HTTP round-trip.
+
+``POST /api/batch`` with ``{"requests": [{"path": "/api/posts/1"}, ...]}``
+runs each ``GET`` sub-request through the app's own routes and answers
+``{"responses": [{"path", "status", "body"}, ...]}`` in the same order.
+
+Sub-requests run one after another with the app's usual request hooks
+and error handlers, all on the batch request's database session: a user
+or post loaded by one is served to the next from the session's identity
+map rather than queried again. The caller's token is verified once for the whole batch, so an
+invalid or revoked token fails the batch instead of every sub-request, and
+is then passed on to each sub-request the same as a direct call.
+"""
+import logging
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from sqlalchemy import event
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.test import EnvironBuilder
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('batch_api', __name__)
+
+# Sub-requests get the batch request's headers, minus those about its body
+SKIPPED_HEADERS = {'content-type', 'content-length', 'transfer-encoding'}
+
+
+@bp.route('', methods=['POST'])
+def batch():
+    """Run up to ``BATCH_MAX_REQUESTS`` read sub-requests and return their responses."""
+    subrequests = (request.get_json(silent=True) or {}).get('requests')
+    limit = current_app.config['BATCH_MAX_REQUESTS']
+    if not isinstance(subrequests, list) or not subrequests:
+        return jsonify({'error': 'Validation error', 'details': 'requests must be a non-empty list'}), 400
+    if len(subrequests) > limit:
+        return jsonify({'error': 'Validation error', 'details': f'At most {limit} requests per batch'}), 400
+
+    # Rejects a bad token up front; no token is fine for public reads
+    verify_jwt_in_request(optional=True)
+
+    headers = [(name, value) for name, value in request.headers
+               if name.lower() not in SKIPPED_HEADERS]
+    # The identity map holds objects weakly: keep what each sub-request
+    # loads alive for the ones after it
+    session, loaded = db.session(), []
+    keep = lambda session, instance: loaded.append(instance)
+    event.listen(session, 'loaded_as_persistent', keep)
+    try:
+        responses = [_run(subrequest, headers, session) for subrequest in subrequests]
+    finally:
+        event.remove(session, 'loaded_as_persistent', keep)
+    return jsonify({'responses': responses})
+
+
+def _run(subrequest, headers, session):
+    if not isinstance(subrequest, dict) or not isinstance(subrequest.get('path'), str):
+        return {'path': None, 'status': 400, 'body': {'error': 'Each request needs a path'}}
+    path = subrequest['path']
+    method = str(subrequest.get('method', 'GET')).upper()
+    if method != 'GET' or not path.startswith('/api/') or path.split('?')[0].rstrip('/') == request.path:
+        return {'path': path, 'status': 400,
+                'body': {'error': 'Only GET requests to other /api/ endpoints can be batched'}}
+
+    app = current_app._get_current_object()
+    environ = EnvironBuilder(path=path, base_url=request.host_url, headers=headers).get_environ()
+    # A context of its own keeps request hooks' state in ``g`` apart from the
+    # batch's; the session is the batch's, and is left open on the way out
+    with app.app_context():
+        db.session.registry.set(session)
+        try:
+            with app.request_context(environ):
+                response = app.full_dispatch_request()
+                if response.mimetype == 'text/event-stream':
+                    response.close()
+                    return {'path': path, 'status': 400,
+                            'body': {'error': 'Streaming endpoints cannot be batched'}}
+        except Exception:
+            logger.exception('Batched request failed', extra={'path': path})
+            session.rollback()
+            return {'path': path, 'status': 500, 'body': {'error': 'Internal server error'}}
+        finally:
+            db.session.registry.clear()
+
+    if response.is_json:
+        body = response.get_json()
+    elif response.status_code >= 400:
+        body = {'error': HTTP_STATUS_CODES.get(response.status_code, 'Error')}
+    else:
+        body = response.get_data(as_text=True)
+    return {'path': path, 'status': response.status_code, 'body': body}
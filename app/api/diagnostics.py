@@ -0,0 +1,104 @@
+import os
+import re
+
+from flask import Blueprint, request, jsonify, send_from_directory
+
+from app import db
+from app.memory import memory_diagnostics
+from app.profiling import list_profiles, profile_dir, token_matches
+from app.statements import statement_cache
+
+bp = Blueprint('diagnostics', __name__)
+
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+\.(prof|collapsed)$')
+
+@bp.before_request
+def require_token():
+    """Diagnostics are only served to callers holding DIAGNOSTICS_TOKEN."""
+    if not token_matches(request.headers.get('X-Diagnostics-Token')):
+        return jsonify({'error': 'Not found'}), 404
+
+@bp.route('/profiles', methods=['GET'])
+def get_profiles():
+    """Saved request profiles, newest first."""
+    directory = profile_dir()
+    names = sorted(list_profiles(directory), reverse=True)
+    return jsonify({'profiles': [
+        {'name': name, 'size': os.path.getsize(os.path.join(directory, name))}
+        for name in names if os.path.exists(os.path.join(directory, name))
+    ]})
+
+@bp.route('/profiles/<name>', methods=['GET'])
+def get_profile(name):
+    """Download one profile: pstats (.prof) or collapsed stacks (.collapsed)."""
+    if not PROFILE_NAME_RE.match(name):
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_from_directory(profile_dir(), name, as_attachment=True)
+
+@bp.route('/memory', methods=['GET'])
+def get_memory():
+    """This worker's RSS, tracemalloc state, snapshots and RSS timeline."""
+    return jsonify({**memory_diagnostics.status(), 'timeline': memory_diagnostics.timeline()})
+
+@bp.route('/memory/endpoints', methods=['GET'])
+def get_memory_endpoints():
+    """Per-endpoint RSS growth and peak allocation of sampled requests."""
+    return jsonify({'endpoints': memory_diagnostics.endpoint_stats()})
+
+@bp.route('/memory/sampling', methods=['PUT'])
+def set_memory_sampling():
+    """Change the fraction of requests measured: ``{"rate": 0.01}``."""
+    rate = (request.json or {}).get('rate')
+    if not isinstance(rate, (int, float)) or not 0 <= rate <= 1:
+        return jsonify({'error': 'rate must be a number between 0 and 1'}), 400
+    memory_diagnostics.sample_rate = float(rate)
+    return jsonify(memory_diagnostics.status())
+
+@bp.route('/memory/tracing', methods=['POST'])
+def start_tracing():
+    """Start tracemalloc, keeping ``frames`` frames per allocation (default 1)."""
+    frames = (request.get_json(silent=True) or {}).get('frames', 1)
+    if not isinstance(frames, int) or not 1 <= frames <= 50:
+        return jsonify({'error': 'frames must be an integer between 1 and 50'}), 400
+    memory_diagnostics.start_tracing(frames)
+    return jsonify(memory_diagnostics.status())
+
+@bp.route('/memory/tracing', methods=['DELETE'])
+def stop_tracing():
+    """Stop tracemalloc and drop its snapshots."""
+    memory_diagnostics.stop_tracing()
+    return jsonify(memory_diagnostics.status())
+
+@bp.route('/memory/snapshots', methods=['POST'])
+def take_snapshot():
+    """Snapshot the traced allocations."""
+    try:
+        snapshot_id = memory_diagnostics.take_snapshot()
+    except RuntimeError:
+        return jsonify({'error': 'tracemalloc is not tracing'}), 409
+    return jsonify({'id': snapshot_id}), 201
+
+@bp.route('/memory/snapshots/<int:base_id>/diff/<int:other_id>', methods=['GET'])
+def diff_snapshots(base_id, other_id):
+    """Largest allocation changes between two snapshots (``?group_by=lineno|filename``)."""
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename'):
+        return jsonify({'error': 'group_by must be lineno or filename'}), 400
+    limit = min(max(request.args.get('limit', 25, type=int), 1), 500)
+    try:
+        stats = memory_diagnostics.diff(base_id, other_id, group_by, limit)
+    except KeyError:
+        return jsonify({'error': 'Snapshot not found'}), 404
+    return jsonify({'group_by': group_by, 'stats': stats})
+
+@bp.route('/statement-cache', methods=['GET'])
+def get_statement_cache():
+    """Compiled SQL cache hits and misses in this worker, and each engine's cache fill."""
+    engines = [(key or 'default', engine) for key, engine in db.engines.items()]
+    return jsonify(statement_cache.status(engines))
+
+@bp.route('/statement-cache', methods=['DELETE'])
+def reset_statement_cache_stats():
+    """Zero the hit and miss counters (the cached SQL itself is kept)."""
+    statement_cache.reset()
+    return jsonify(statement_cache.status())
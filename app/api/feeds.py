@@ -0,0 +1,39 @@
+from flask import Blueprint, abort, current_app, request, url_for
+
+from app.feeds import build_atom, build_rss, feed_cache
+
+bp = Blueprint('feeds', __name__)
+
+def _respond(doc):
+    """Serve a cached document, honouring If-None-Match / If-Modified-Since."""
+    response = current_app.response_class(doc.body, mimetype=doc.mimetype)
+    response.set_etag(doc.etag)
+    response.last_modified = doc.last_modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['FEED_MAX_AGE']
+    return response.make_conditional(request)
+
+@bp.route('/feed.rss', methods=['GET'])
+def rss_feed():
+    """RSS 2.0 feed of the latest published posts."""
+    return _respond(feed_cache.get('rss', build_rss))
+
+@bp.route('/feed.atom', methods=['GET'])
+def atom_feed():
+    """Atom feed of the latest published posts."""
+    return _respond(feed_cache.get('atom', build_atom))
+
+@bp.route('/sitemap.xml', methods=['GET'])
+def sitemap_index():
+    """Sitemap index pointing at one sitemap per shard of post ids."""
+    return _respond(feed_cache.sitemap_index(
+        lambda shard: url_for('feeds.sitemap_shard', shard=shard, _external=True)
+    ))
+
+@bp.route('/sitemaps/posts-<int:shard>.xml', methods=['GET'])
+def sitemap_shard(shard):
+    """Sitemap of the published posts in one shard of post ids; 404 if it has none."""
+    doc = feed_cache.sitemap_shard(shard)
+    if doc is None:
+        abort(404)
+    return _respond(doc)
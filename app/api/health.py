@@ -1,5 +1,7 @@
 from flask import Blueprint, jsonify
 
+from app.health import readiness
+
 bp = Blueprint('health', __name__)
 
 @bp.route('/health', methods=['GET'])
@@ -9,3 +11,17 @@ def health_check():
         'status': 'healthy',
         'message': 'Flask Blog API is running'
     })
+
+@bp.route('/health/live', methods=['GET'])
+def liveness():
+    """Liveness probe: the process serves requests; touches no dependencies."""
+    return jsonify({'status': 'alive'})
+
+@bp.route('/health/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 503 while the database is unreachable or behind the models."""
+    ready, report = readiness.status()
+    response = jsonify(report)
+    response.status_code = 200 if ready else 503
+    response.headers['Cache-Control'] = 'no-store'
+    return response
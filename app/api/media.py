@@ -0,0 +1,18 @@
+import re
+
+from flask import Blueprint, request, jsonify
+
+from app.media import send_media
+
+bp = Blueprint('media_api', __name__)
+
+NAME_RE = re.compile(r'^[0-9a-f]{64}\.(jpg|png|gif|webp)$')
+
+@bp.route('/<name>', methods=['GET'])
+def get_media(name):
+    """Serve an uploaded image or one of its thumbnails (``?size=``)."""
+    size = request.args.get('size', type=int)
+    response = send_media(name, size) if NAME_RE.match(name) else None
+    if response is None:
+        return jsonify({'error': 'File not found'}), 404
+    return response
@@ -1,9 +1,25 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, Response, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
 from app import db
-from app.models import Post, User
+from app.archive import (find_post, find_post_or_404, find_posts, history_page, is_archived, remove_post,
+                         restore_post)
+from app.change_log import CursorExpired, changes_since, current_cursor
+from app.duplicates import attach_signature, check_duplicate
+from app.media import InvalidImage, media_url, store_upload
+from app.models import Post, RelatedPost, User
+from app.post_events import post_events
+from app.revisions import (apply_delta, apply_edit, get_revision, latest_version, list_revisions,
+                           record_revision)
 from app.schemas import PostSchema
+from app.sharding import paginate_author, paginate_newest, posts_by_ids, scatter_merge
+from app.statements import before_params, tag_by_name, tagged_post_ids, tagged_post_ids_before, trending_posts
+from app.tags import bulk_tag, normalize_tags, set_post_tags, tag_cloud
+from app.timeline import timeline_page
+from app.utils import decode_cursor, encode_cursor, parse_ids
+from app.view_counter import view_counter
 
 bp = Blueprint('posts_api', __name__)
 
@@ -13,15 +29,18 @@ posts_schema = PostSchema(many=True)
 
 @bp.route('', methods=['GET'])
 def get_posts():
-    """Get all published posts."""
+    """Get all published posts, those with a tag (``?tag=``, keyset paginated)
+    or several given by id (``?ids=1,2,3``)."""
+    if request.args.get('ids'):
+        return get_posts_by_ids(request.args['ids'])
+    if request.args.get('tag'):
+        return get_tagged_posts(request.args['tag'])
+    
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
-    posts = Post.query.filter_by(published=True).order_by(
-        Post.created_at.desc()
-    ).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # Merged newest first from every post shard
+    posts = paginate_newest(page=page, per_page=per_page)
     
     return jsonify({
         'posts': posts_schema.dump(posts.items),
@@ -35,25 +54,256 @@ def get_posts():
         }
     })
 
-@bp.route('/<int:post_id>', methods=['GET'])
-def get_post(post_id):
-    """Get a specific post."""
-    post = Post.query.get_or_404(post_id)
+def get_posts_by_ids(ids):
+    """Several posts, hot or archived, in the order asked; unknown or hidden ids are ``missing``.
+
+    One IN query per post shard (plus the archive for ids not found there)
+    and one for their authors, instead of a request per post.
+    """
+    try:
+        post_ids = parse_ids(ids, current_app.config['MULTI_GET_MAX_IDS'])
+    except ValueError as e:
+        return jsonify({'error': 'Validation error', 'details': str(e)}), 400
+    
+    current_user_id = _optional_identity()
+    found = {post.id: post for post in find_posts(post_ids)
+             if post.published or post.user_id == current_user_id}
+    posts = [found[post_id] for post_id in post_ids if post_id in found]
+    # Held until dumped: the identity map only keeps objects referenced elsewhere
+    authors = User.get_many({post.user_id for post in posts})
+    for post in posts:
+        if not is_archived(post):
+            view_counter.record(post.id)
+    
+    return jsonify({
+        'posts': posts_schema.dump(posts),
+        'missing': [post_id for post_id in post_ids if post_id not in found]
+    })
+
+def get_tagged_posts(name):
+    """Published posts with a tag, newest first, walking ix_post_tag_tag_created."""
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
+    tag = db.session.scalars(tag_by_name, {'name': name.strip().lower()}).first()
+    if tag is None:
+        return jsonify({'posts': [], 'next_cursor': None})
+    
+    before = None
+    if request.args.get('cursor'):
+        try:
+            before = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Assignments are in the main database and posts on their shards: page
+    # through the assignments, keeping the posts that are published
+    posts = []
+    while len(posts) <= per_page:
+        params = {'tag_id': tag.id, 'limit': per_page + 1}
+        if before is None:
+            rows = db.session.execute(tagged_post_ids, params).all()
+        else:
+            rows = db.session.execute(tagged_post_ids_before, {**params, **before_params(before)}).all()
+        found = {post.id: post for post in posts_by_ids([row.post_id for row in rows], published_only=True)}
+        posts += [found[row.post_id] for row in rows if row.post_id in found]
+        if len(rows) <= per_page:
+            break
+        before = (rows[-1].created_at, rows[-1].post_id)
+    
+    return jsonify({
+        'posts': posts_schema.dump(posts[:per_page]),
+        'next_cursor': (encode_cursor(posts[per_page - 1].created_at, posts[per_page - 1].id)
+                        if len(posts) > per_page else None)
+    })
+
+@bp.route('/history', methods=['GET'])
+def get_post_history():
+    """All published posts newest first, archived ones included (keyset paginated)."""
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
+    before = None
+    if request.args.get('cursor'):
+        try:
+            before = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    posts = history_page(before, per_page)
+    
+    return jsonify({
+        'posts': posts_schema.dump(posts[:per_page]),
+        'next_cursor': (encode_cursor(posts[per_page - 1].created_at, posts[per_page - 1].id)
+                        if len(posts) > per_page else None)
+    })
+
+@bp.route('/tags', methods=['GET'])
+def get_tag_cloud():
+    """Get the most used tags with their published post counts."""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    
+    return jsonify({'tags': [{'name': name, 'count': count} for name, count in tag_cloud(limit)]})
+
+@bp.route('/tags/bulk', methods=['POST'])
+@jwt_required()
+def bulk_tag_posts():
+    """Add and/or remove tags on several of the current user's posts."""
+    data = request.json or {}
+    post_ids = data.get('post_ids')
+    if not isinstance(post_ids, list) or not post_ids or len(post_ids) > 500 \
+            or not all(isinstance(i, int) for i in post_ids):
+        return jsonify({'error': 'post_ids must be a list of up to 500 post ids'}), 400
+    
+    posts = posts_by_ids(post_ids)
+    if len(posts) != len(set(post_ids)):
+        return jsonify({'error': 'Post not found'}), 404
+    if any(post.user_id != get_jwt_identity() for post in posts):
+        return jsonify({'error': 'Unauthorized'}), 403
     
-    # Check if post is published or user is the author
-    current_user_id = None
     try:
-        from flask_jwt_extended import verify_jwt_in_request
+        changed = bulk_tag(posts, data.get('add', []), data.get('remove', []))
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': 'Validation error', 'details': str(e)}), 400
+    db.session.commit()
+    if changed:
+        post_events.notify()
+    
+    return jsonify({'changed': changed})
+
+@bp.route('/trending', methods=['GET'])
+def get_trending_posts():
+    """Get published posts ranked by trending score."""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 10, type=int), 1), 100)
+    
+    # Walks the trending_score index of each shard; one extra row tells
+    # whether there is a next page
+    posts = scatter_merge(trending_posts, lambda post: post.stats.trending_score,
+                          per_page + 1, offset=(page - 1) * per_page)
+    
+    return jsonify({
+        'posts': posts_schema.dump(posts[:per_page]),
+        'pagination': {
+            'page': page,
+            'per_page': per_page,
+            'has_next': len(posts) > per_page,
+            'has_prev': page > 1
+        }
+    })
+
+@bp.route('/timeline', methods=['GET'])
+@jwt_required()
+def get_timeline():
+    """Get the current user's home timeline: posts by followed authors, newest first."""
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    before = None
+    if request.args.get('cursor'):
+        try:
+            before = decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    rows = timeline_page(get_jwt_identity(), before, per_page)
+    page = rows[:per_page]
+    posts = {post.id: post for post in posts_by_ids([row.post_id for row in page])}
+    
+    return jsonify({
+        'posts': posts_schema.dump([posts[row.post_id] for row in page if row.post_id in posts]),
+        'next_cursor': encode_cursor(page[-1].created_at, page[-1].post_id) if len(rows) > per_page else None
+    })
+
+@bp.route('/changes', methods=['GET'])
+def get_post_changes():
+    """Get published posts changed since a sync cursor, plus deleted ids.
+    
+    Without ``since`` only the current cursor is returned, for clients that
+    have just done a full load.
+    """
+    since = request.args.get('since', type=int)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 1000)
+    
+    if since is None:
+        return jsonify({'posts': [], 'deleted': [], 'cursor': current_cursor(), 'has_more': False})
+    
+    try:
+        posts, deleted, cursor, has_more = changes_since(since, limit)
+    except CursorExpired:
+        return jsonify({'error': 'Cursor is too old, full resync required'}), 410
+    
+    return jsonify({
+        'posts': posts_schema.dump(posts),
+        'deleted': deleted,
+        'cursor': cursor,
+        'has_more': has_more
+    })
+
+@bp.route('/stream', methods=['GET'])
+def stream_posts():
+    """Stream created, updated and deleted published posts as Server-Sent Events.
+    
+    Event ids are delta sync cursors; a reconnect with ``Last-Event-ID`` (or
+    ``?last_event_id=``) replays what was missed, or sends a ``reset`` event
+    when the client has to resync from ``GET /api/posts`` instead.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+    
+    subscription = post_events.subscribe()
+    if subscription is None:
+        # Each stream holds a worker thread; keep the rest for other requests
+        response = jsonify({'error': 'Too many live connections, try again later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    replay, after_seq = [], None
+    if last_event_id is not None:
+        try:
+            replay, after_seq = post_events.replay(last_event_id)
+        except CursorExpired:
+            replay = [(None, 'event: reset\ndata: {}\n\n')]
+    
+    # The body is produced outside the request context and holds no DB session
+    return Response(
+        post_events.stream(subscription, replay, after_seq,
+                           heartbeat=current_app.config['SSE_HEARTBEAT_SECONDS']),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def _optional_identity():
+    """The caller's user id when a valid token is sent, else None."""
+    try:
         verify_jwt_in_request(optional=True)
-        current_user_id = get_jwt_identity()
-    except:
-        pass
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+@bp.route('/<int:post_id>', methods=['GET'])
+def get_post(post_id):
+    """Get a specific post, whether still hot or archived."""
+    post = find_post_or_404(post_id)
     
+    # Check if post is published or user is the author
+    current_user_id = _optional_identity()
     if not post.published and (not current_user_id or post.user_id != current_user_id):
         return jsonify({'error': 'Post not found'}), 404
     
+    # Archived posts keep the count they were archived with
+    if not is_archived(post):
+        view_counter.record(post.id)
     return jsonify(post_schema.dump(post))
 
+@bp.route('/<int:post_id>/related', methods=['GET'])
+def get_related_posts(post_id):
+    """Get published posts similar to a post, from the precomputed index."""
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    
+    related_ids = db.session.scalars(
+        db.select(RelatedPost.related_id).where(RelatedPost.post_id == post_id).order_by(RelatedPost.rank)
+    ).all()
+    found = {post.id: post for post in posts_by_ids(related_ids, published_only=True)}
+    posts = [found[related_id] for related_id in related_ids if related_id in found][:limit]
+    
+    return jsonify({'posts': posts_schema.dump(posts)})
+
 @bp.route('', methods=['POST'])
 @jwt_required()
 def create_post():
@@ -64,60 +314,204 @@ def create_post():
         return jsonify({'error': 'Validation error', 'details': str(e)}), 400
     
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = db.session.get(User, user_id)
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
+    try:
+        tags = normalize_tags(data.get('tag_names', []))
+    except ValueError as e:
+        return jsonify({'error': 'Validation error', 'details': str(e)}), 400
+    
+    duplicate = check_duplicate(data['title'], data['content'])
+    if duplicate.duplicate_of and current_app.config['DUPLICATE_POLICY'] == 'reject':
+        return jsonify({
+            'error': 'Post is a near-duplicate of an existing post',
+            'duplicate_of': duplicate.duplicate_of
+        }), 409
+    
     post = Post(
         title=data['title'],
         content=data['content'],
         published=data.get('published', False),
         user_id=user_id
     )
+    attach_signature(post, duplicate)
     
     db.session.add(post)
+    db.session.flush()
+    if tags:
+        set_post_tags(post, tags)
+    record_revision(post, user_id=user_id)
     db.session.commit()
+    post_events.notify()
     
     return jsonify(post_schema.dump(post)), 201
 
+@bp.route('/images', methods=['POST'])
+@jwt_required()
+def upload_post_image():
+    """Upload an image to embed in a post body (multipart field ``image``)."""
+    if 'image' not in request.files:
+        return jsonify({'error': 'No image file provided'}), 400
+    
+    try:
+        media = store_upload(request.files['image'], get_jwt_identity())
+    except InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    
+    return jsonify({
+        'url': media_url(media.name),
+        'thumbnails': {size: media_url(media.name, size)
+                       for size in current_app.config['THUMBNAIL_SIZES']},
+        'width': media.width,
+        'height': media.height
+    }), 201
+
 @bp.route('/<int:post_id>', methods=['PUT'])
 @jwt_required()
 def update_post(post_id):
-    """Update a post."""
-    post = Post.query.get_or_404(post_id)
+    """Update a post, restoring it from the archive first if needed.
+
+    Checked against the version in ``If-Match`` or the body's ``version``
+    when one is given (409 if the post has moved on); last write wins otherwise.
+    """
+    return _save_post(post_id, patch=False)
+
+@bp.route('/<int:post_id>', methods=['PATCH'])
+@jwt_required()
+def patch_post(post_id):
+    """Partially update a post: ``content_delta`` edits the body in place.
+
+    The version being edited is required (``If-Match`` or ``version``);
+    a stale one gets 409 with the current version.
+    """
+    return _save_post(post_id, patch=True)
+
+def _requested_version(payload):
+    """The version the client edited, from ``If-Match`` or the body, or None."""
+    version = payload.pop('version', None)
+    if request.headers.get('If-Match'):
+        version = request.headers['If-Match'].strip().removeprefix('W/').strip('"')
+    if version is None:
+        return None
+    if isinstance(version, bool):
+        raise ValueError('version must be an integer')
+    return int(version)
+
+def _version_conflict(post_id):
+    post = find_post(post_id)
+    return jsonify({
+        'error': 'Post was changed since this version',
+        'version': getattr(post, 'version', None) or latest_version(post_id)
+    }), 409
+
+def _save_post(post_id, patch):
+    post = find_post_or_404(post_id)
     user_id = get_jwt_identity()
     
     if post.user_id != user_id:
         return jsonify({'error': 'Unauthorized'}), 403
     
+    payload = dict(request.json or {})
+    content_delta = payload.pop('content_delta', None) if patch else None
     try:
-        data = post_schema.load(request.json, partial=True)
+        expected_version = _requested_version(payload)
+        data = post_schema.load(payload, partial=True)
     except Exception as e:
         return jsonify({'error': 'Validation error', 'details': str(e)}), 400
+    if patch and expected_version is None:
+        return jsonify({'error': 'The version being edited is required (If-Match or version)'}), 428
+    if content_delta is not None and 'content' in data:
+        return jsonify({'error': 'Validation error',
+                        'details': 'Send either content or content_delta'}), 400
     
-    post.title = data.get('title', post.title)
-    post.content = data.get('content', post.content)
-    post.published = data.get('published', post.published)
+    if is_archived(post):
+        post = restore_post(post)
+    if expected_version is not None and expected_version != post.version:
+        return _version_conflict(post_id)
     
-    from datetime import datetime
-    post.updated_at = datetime.utcnow()
+    if content_delta is not None:
+        try:
+            data['content'] = apply_delta(post.content, content_delta)
+        except ValueError as e:
+            return jsonify({'error': 'Validation error', 'details': str(e)}), 400
     
-    db.session.commit()
+    if 'tag_names' in data:
+        try:
+            tags = normalize_tags(data['tag_names'])
+        except ValueError as e:
+            return jsonify({'error': 'Validation error', 'details': str(e)}), 400
+    
+    if 'title' in data or 'content' in data:
+        duplicate = check_duplicate(
+            data.get('title', post.title), data.get('content', post.content),
+            exclude_post_id=post.id
+        )
+        if duplicate.duplicate_of and current_app.config['DUPLICATE_POLICY'] == 'reject':
+            return jsonify({
+                'error': 'Post is a near-duplicate of an existing post',
+                'duplicate_of': duplicate.duplicate_of
+            }), 409
+        attach_signature(post, duplicate)
+    
+    try:
+        if 'tag_names' in data:
+            set_post_tags(post, tags)
+        apply_edit(post, data.get('title', post.title), data.get('content', post.content),
+                   data.get('published', post.published), user_id)
+        db.session.commit()
+    except (StaleDataError, IntegrityError):
+        # A concurrent edit of the same version was flushed first
+        db.session.rollback()
+        return _version_conflict(post_id)
+    post_events.notify()
     
     return jsonify(post_schema.dump(post))
 
+@bp.route('/<int:post_id>/revisions', methods=['GET'])
+@jwt_required()
+def get_post_revisions(post_id):
+    """List a post's revisions, newest first (author only)."""
+    post = find_post_or_404(post_id)
+    if post.user_id != get_jwt_identity():
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({'revisions': [{
+        'version': row.version,
+        'snapshot': row.version == row.base_version,
+        'stored_bytes': row.stored_bytes,
+        'user_id': row.user_id,
+        'created_at': row.created_at.isoformat()
+    } for row in list_revisions(post_id)]})
+
+@bp.route('/<int:post_id>/revisions/<int:version>', methods=['GET'])
+@jwt_required()
+def get_post_revision(post_id, version):
+    """The title and content of one version of a post (author only)."""
+    post = find_post_or_404(post_id)
+    if post.user_id != get_jwt_identity():
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    revision = get_revision(post_id, version)
+    if revision is None:
+        return jsonify({'error': 'Revision not found'}), 404
+    revision['created_at'] = revision['created_at'].isoformat()
+    return jsonify(revision)
+
 @bp.route('/<int:post_id>', methods=['DELETE'])
 @jwt_required()
 def delete_post(post_id):
     """Delete a post."""
-    post = Post.query.get_or_404(post_id)
+    post = find_post_or_404(post_id)
     user_id = get_jwt_identity()
     
     if post.user_id != user_id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    db.session.delete(post)
-    db.session.commit()
+    remove_post(post)
+    post_events.notify()
     
     return jsonify({'message': 'Post deleted successfully'}), 200
 
@@ -129,11 +523,8 @@ def get_my_posts():
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
     
-    posts = Post.query.filter_by(user_id=user_id).order_by(
-        Post.created_at.desc()
-    ).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # An author's posts all live on their home shard
+    posts = paginate_author(user_id, page=page, per_page=per_page)
     
     return jsonify({
         'posts': posts_schema.dump(posts.items),
@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from app import db
+from app.media import InvalidImage, store_upload
 from app.models import User
 from app.schemas import UserSchema
+from app.statements import user_by_email, user_by_username
+from app.timeline import follow, unfollow
+from app.utils import parse_ids
 
 bp = Blueprint('users_api', __name__)
 
@@ -16,7 +20,7 @@ users_schema = UserSchema(many=True)
 def get_profile():
     """Get current user's profile."""
     user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = db.get_or_404(User, user_id)
     
     return jsonify(user_schema.dump(user))
 
@@ -25,7 +29,7 @@ def get_profile():
 def update_profile():
     """Update current user's profile."""
     user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = db.get_or_404(User, user_id)
     
     try:
         data = user_schema.load(request.json, partial=True)
@@ -34,14 +38,14 @@ def update_profile():
     
     # Check if username is already taken by another user
     if 'username' in data and data['username'] != user.username:
-        existing_user = User.query.filter_by(username=data['username']).first()
+        existing_user = db.session.scalars(user_by_username, {'username': data['username']}).first()
         if existing_user:
             return jsonify({'error': 'Username already taken'}), 400
         user.username = data['username']
     
     # Check if email is already taken by another user
     if 'email' in data and data['email'] != user.email:
-        existing_user = User.query.filter_by(email=data['email']).first()
+        existing_user = db.session.scalars(user_by_email, {'email': data['email']}).first()
         if existing_user:
             return jsonify({'error': 'Email already registered'}), 400
         user.email = data['email']
@@ -56,14 +60,77 @@ def update_profile():
     
     return jsonify(user_schema.dump(user))
 
-@bp.route('/<int:user_id>', methods=['GET'])
-def get_user(user_id):
-    """Get public user info."""
-    user = User.query.get_or_404(user_id)
+@bp.route('/avatar', methods=['POST'])
+@jwt_required()
+def upload_avatar():
+    """Upload a new avatar image (multipart field ``avatar``)."""
+    user = db.get_or_404(User, get_jwt_identity())
+    if 'avatar' not in request.files:
+        return jsonify({'error': 'No avatar file provided'}), 400
+    
+    try:
+        media = store_upload(request.files['avatar'], user.id)
+    except InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
+    
+    user.avatar = media.name
+    db.session.commit()
     
+    return jsonify(user_schema.dump(user))
+
+def _public_user(user):
     # Return only public information
-    return jsonify({
+    return {
         'id': user.id,
         'username': user.username,
         'created_at': user.created_at
+    }
+
+@bp.route('', methods=['GET'])
+def get_users():
+    """Public info of several users (``?ids=1,2,3``) in one query, in the order asked."""
+    try:
+        user_ids = parse_ids(request.args.get('ids', ''), current_app.config['MULTI_GET_MAX_IDS'])
+    except ValueError as e:
+        return jsonify({'error': 'Validation error', 'details': str(e)}), 400
+    
+    found = User.get_many(user_ids)
+    return jsonify({
+        'users': [_public_user(found[user_id]) for user_id in user_ids if user_id in found],
+        'missing': [user_id for user_id in user_ids if user_id not in found]
     })
+
+@bp.route('/<int:user_id>', methods=['GET'])
+def get_user(user_id):
+    """Get public user info."""
+    user = db.get_or_404(User, user_id)
+    
+    return jsonify(_public_user(user))
+
+@bp.route('/<int:user_id>/follow', methods=['POST'])
+@jwt_required()
+def follow_user(user_id):
+    """Follow a user."""
+    followee = db.get_or_404(User, user_id)
+    follower = db.get_or_404(User, get_jwt_identity())
+    
+    if follower.id == followee.id:
+        return jsonify({'error': 'You cannot follow yourself'}), 400
+    
+    follow(follower, followee)
+    db.session.commit()
+    
+    return jsonify({'message': f'Following {followee.username}'}), 200
+
+@bp.route('/<int:user_id>/follow', methods=['DELETE'])
+@jwt_required()
+def unfollow_user(user_id):
+    """Unfollow a user."""
+    followee = db.get_or_404(User, user_id)
+    follower = db.get_or_404(User, get_jwt_identity())
+    
+    if not unfollow(follower, followee):
+        return jsonify({'error': 'Not following this user'}), 404
+    db.session.commit()
+    
+    return jsonify({'message': f'Unfollowed {followee.username}'}), 200
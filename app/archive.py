@@ -0,0 +1,228 @@
+"""Hot/cold archival of old posts.
+
+``flask archive-posts`` moves posts neither created nor updated within
+``ARCHIVE_AFTER_DAYS`` out of ``post`` into ``archived_post`` on the
+``archive`` bind (the main database unless ``ARCHIVE_DATABASE_URL`` points
+elsewhere), in batches. The hot table and its indexes then only hold what is
+still being read and written.
+
+Archived posts keep their ids, so single-post reads look in the archive when
+the hot table misses, and anything that wants to change an archived post
+restores it first. The two databases are written in separate transactions,
+archive first: a run interrupted in between leaves a post in both places,
+where the hot copy wins and the next run finishes the move.
+"""
+import heapq
+import json
+from datetime import datetime, timedelta
+
+from flask import abort
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import (ArchivedPost, Follow, Post, PostChange, PostLshBucket, PostSignature,
+                        PostStats, RelatedPost, Tag, TimelineEntry, post_tag)
+from app.sharding import get_post, newest_posts, post_shards, posts_by_ids
+from app.utils import upsert_statement
+
+ARCHIVED_COLUMNS = ['title', 'content', 'created_at', 'updated_at', 'published', 'user_id',
+                    'views', 'tags']
+
+
+def find_post(post_id):
+    """The ``Post`` or, failing that, the ``ArchivedPost`` with this id, or None."""
+    return get_post(post_id) or db.session.get(ArchivedPost, post_id)
+
+
+def find_posts(post_ids):
+    """The posts with these ids, hot or archived, in no particular order.
+
+    One IN query per post shard, plus one on the archive for ids missing there.
+    """
+    posts = posts_by_ids(post_ids)
+    missing = set(post_ids) - {post.id for post in posts}
+    if missing:
+        posts += db.session.scalars(db.select(ArchivedPost).where(ArchivedPost.id.in_(missing))).all()
+    return posts
+
+
+def find_post_or_404(post_id):
+    post = find_post(post_id)
+    if post is None:
+        abort(404)
+    return post
+
+
+def is_archived(post):
+    return isinstance(post, ArchivedPost)
+
+
+def _tag_names(post_ids):
+    names = {}
+    for post_id, name in db.session.execute(
+        db.select(post_tag.c.post_id, Tag.name)
+        .join(Tag, Tag.id == post_tag.c.tag_id)
+        .where(post_tag.c.post_id.in_(post_ids))
+        .order_by(Tag.name)
+    ):
+        names.setdefault(post_id, []).append(name)
+    return names
+
+
+def _remove_hot(posts):
+    """Delete archived ``posts`` and their dependent rows from the hot side.
+
+    Bulk statements rather than ORM deletes, so no change-log entries or
+    delete events are produced: the posts still exist. The post rows go to
+    the shard currently selected, everything else to the main database.
+    """
+    post_ids = [post.id for post in posts]
+
+    # Keep tag counts exact: the posts no longer show up on tag pages
+    published = [post.id for post in posts if post.published]
+    if published:
+        counts = db.session.execute(
+            db.select(post_tag.c.tag_id, db.func.count())
+            .where(post_tag.c.post_id.in_(published))
+            .group_by(post_tag.c.tag_id)
+        ).all()
+        if counts:
+            tags = Tag.__table__
+            db.session.execute(
+                tags.update().where(tags.c.id == db.bindparam('tag_id'))
+                .values(published_count=tags.c.published_count - db.bindparam('n')),
+                [{'tag_id': tag_id, 'n': n} for tag_id, n in counts]
+            )
+    db.session.execute(post_tag.delete().where(post_tag.c.post_id.in_(post_ids)))
+
+    for post in posts:
+        db.session.execute(TimelineEntry.__table__.delete().where(
+            TimelineEntry.user_id.in_(db.select(Follow.follower_id).where(Follow.followee_id == post.user_id)),
+            TimelineEntry.created_at == post.created_at,
+            TimelineEntry.post_id == post.id
+        ))
+    # Lists of other posts pointing here are dropped by the next related-index run
+    for model, column in ((RelatedPost, RelatedPost.post_id),
+                          (PostLshBucket, PostLshBucket.post_id),
+                          (PostSignature, PostSignature.post_id),
+                          (PostStats, PostStats.post_id),
+                          (Post, Post.id)):
+        db.session.execute(model.__table__.delete().where(column.in_(post_ids)))
+
+
+def archive_posts(older_than_days, batch_size=500):
+    """Move posts untouched for ``older_than_days`` to the archive; returns posts moved."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = 0
+    for shard in range(post_shards.count):
+        with post_shards.using(shard):
+            moved += _archive_shard(cutoff, batch_size)
+    return moved
+
+
+def _archive_shard(cutoff, batch_size):
+    moved = 0
+    while True:
+        posts = db.session.scalars(
+            db.select(Post).where(
+                Post.created_at < cutoff,
+                db.func.coalesce(Post.updated_at, Post.created_at) < cutoff
+            ).order_by(Post.id).limit(batch_size)
+        ).all()
+        if not posts:
+            return moved
+        tags = _tag_names([post.id for post in posts])
+        rows = [{
+            'id': post.id, 'title': post.title, 'content': post.content,
+            'created_at': post.created_at, 'updated_at': post.updated_at,
+            'published': post.published, 'user_id': post.user_id,
+            'views': post.stats.views if post.stats else 0,
+            'tags': json.dumps(tags.get(post.id, [])), 'archived_at': datetime.utcnow(),
+        } for post in posts]
+        db.session.execute(upsert_statement(
+            ArchivedPost, ArchivedPost.id,
+            lambda excluded: {name: getattr(excluded, name) for name in ARCHIVED_COLUMNS}
+        ), rows)
+        db.session.commit()
+
+        _remove_hot(posts)
+        db.session.commit()
+        for post in posts:
+            db.session.expunge(post)
+        moved += len(posts)
+
+
+def restore_post(archived):
+    """Move an ``ArchivedPost`` back into the hot table; returns the new ``Post``.
+
+    Its signature is not restored; ``flask duplicates-backfill`` recomputes it.
+    The version continues from the post's revision history.
+    """
+    from app.revisions import latest_version
+    from app.tags import set_post_tags
+
+    post = Post(id=archived.id, title=archived.title, content=archived.content,
+                created_at=archived.created_at, updated_at=archived.updated_at,
+                published=archived.published, user_id=archived.user_id,
+                version=latest_version(archived.id) or 1)
+    if archived.views:
+        post.stats = PostStats(views=archived.views)
+    db.session.add(post)
+    db.session.flush()
+    if archived.tag_names:
+        set_post_tags(post, archived.tag_names)
+    db.session.commit()
+
+    db.session.delete(archived)
+    db.session.commit()
+    return post
+
+
+def delete_archived(archived):
+    """Delete an archived post for good and tell sync clients it is gone."""
+    post_id = archived.id
+    db.session.delete(archived)
+    db.session.commit()
+    db.session.add(PostChange(post_id=post_id, op='delete', changed_at=datetime.utcnow()))
+    db.session.commit()
+
+
+def remove_post(post):
+    """Delete a hot or archived post for good, then its edit history.
+
+    The history goes in its own transaction once the post's is committed:
+    the archive may be the main database file under another engine, and an
+    open write on one would lock the other out.
+    """
+    from app.revisions import delete_revisions
+
+    post_id = post.id
+    if is_archived(post):
+        delete_archived(post)
+    else:
+        db.session.delete(post)
+        db.session.commit()
+    delete_revisions(post_id)
+    db.session.commit()
+
+
+def history_page(before=None, limit=20):
+    """Published posts newest first across the hot table and the archive.
+
+    ``before`` is the ``(created_at, id)`` of the last post of the previous
+    page. Each side (every post shard, and the archive) is read with a
+    keyset query on its ``(published, created_at, id)`` index and they are
+    merged here, so deep pages cost
+    the same as the first. Returns up to ``limit + 1`` posts.
+    """
+    cold = db.select(ArchivedPost).options(selectinload(ArchivedPost.author)).where(
+        ArchivedPost.published.is_(True)
+    )
+    if before is not None:
+        cold = cold.where(db.tuple_(ArchivedPost.created_at, ArchivedPost.id) < before)
+    hot = newest_posts(before, limit + 1)
+    cold = db.session.scalars(
+        cold.order_by(ArchivedPost.created_at.desc(), ArchivedPost.id.desc()).limit(limit + 1)
+    ).all()
+    merged = heapq.merge(hot, cold, key=lambda post: (post.created_at, post.id), reverse=True)
+    return list(merged)[:limit + 1]
@@ -0,0 +1,219 @@
+"""ASGI serving mode.
+
+The read-heavy endpoints (health, post feed, single post, public user) are
+served by native coroutines on an async SQLAlchemy engine, so an in-flight
+database round-trip no longer pins a worker thread. Every other request is
+handed to the regular Flask app through a WSGI adapter running on a thread
+pool, so the rest of the API works unchanged.
+
+Run with:
+    uvicorn asgi:app --workers 4
+"""
+import asyncio
+import math
+import re
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import configure_mappers, selectinload
+
+from app import create_app, db
+from app.models import Post, User
+from app.schemas import PostSchema
+from app.sharding import post_shards
+from app.token_blocklist import get_token_blocklist
+from app.view_counter import view_counter
+
+# Async driver used for each sync backend when ASYNC_DATABASE_URL is not set
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+posts_schema = PostSchema(many=True)
+post_schema = PostSchema()
+
+
+def async_database_url(app):
+    """Return the async engine URL matching the app's database."""
+    if app.config.get('ASYNC_DATABASE_URL'):
+        return app.config['ASYNC_DATABASE_URL']
+    with app.app_context():
+        url = db.engine.url
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {backend}; set ASYNC_DATABASE_URL')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def _int_arg(query, name, default):
+    """Mirror ``request.args.get(name, default, type=int)``."""
+    try:
+        return int(query[name][0])
+    except (KeyError, IndexError, ValueError):
+        return default
+
+
+class AsyncReadApp:
+    """ASGI app serving the hot read endpoints, falling back to Flask."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WSGIMiddleware(flask_app, workers=flask_app.config['ASGI_WSGI_THREADS'])
+        self.engine = create_async_engine(async_database_url(flask_app))
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+        # Set up backrefs such as Post.author before they are used in queries
+        configure_mappers()
+        self.cors_origins = set(flask_app.config['CORS_ORIGINS'])
+        self.routes = [
+            (re.compile(r'^/api/health$'), self.health),
+            (re.compile(r'^/api/posts$'), self.get_posts),
+            (re.compile(r'^/api/posts/(\d+)$'), self.get_post),
+            (re.compile(r'^/api/users/(\d+)$'), self.get_user),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            for pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    headers = {k.decode('latin-1'): v.decode('latin-1') for k, v in scope['headers']}
+                    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+                    result = await handler(headers, query, *match.groups())
+                    # None hands variants the fast path does not cover to Flask
+                    if result is not None:
+                        return await self.respond(send, scope, headers, *result)
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, send, scope, headers, status, body):
+        # Flask's JSON provider, so bodies match the routes they shadow byte for byte
+        payload = self.flask_app.json.response(body).get_data()
+        response_headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(payload)).encode()),
+        ]
+        # flask-cors does not see these requests, so apply the same policy here
+        origin = headers.get('origin')
+        if origin in self.cors_origins:
+            response_headers += [
+                (b'access-control-allow-origin', origin.encode('latin-1')),
+                (b'access-control-allow-credentials', b'true'),
+                (b'vary', b'Origin'),
+            ]
+        await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+        await send({'type': 'http.response.body',
+                    'body': b'' if scope['method'] == 'HEAD' else payload})
+
+    async def current_user_id(self, headers):
+        """Identity from an optional ``Authorization: Bearer`` header."""
+        auth = headers.get('authorization', '')
+        if not auth.startswith('Bearer '):
+            return None
+        # The blocklist check may refresh from the database: keep that
+        # blocking query off the event loop
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._token_identity, auth[len('Bearer '):])
+
+    def _token_identity(self, token):
+        try:
+            with self.flask_app.app_context():
+                claims = decode_token(token)
+                # decode_token skips the blocklist that @jwt_required applies
+                if get_token_blocklist().is_revoked(claims):
+                    return None
+            return claims[self.flask_app.config.get('JWT_IDENTITY_CLAIM', 'sub')]
+        except Exception:
+            return None
+
+    async def health(self, headers, query):
+        return 200, {
+            'status': 'healthy',
+            'message': 'Flask Blog API is running'
+        }
+
+    async def get_posts(self, headers, query):
+        # The async engine only reaches the main database; sharded post
+        # reads are routed by the Flask session
+        if query.get('tag') or query.get('ids') or post_shards.count > 1:
+            return None
+        page = max(_int_arg(query, 'page', 1), 1)
+        per_page = _int_arg(query, 'per_page', 10)
+        if per_page <= 0:
+            per_page = 20
+
+        async with self.session() as session:
+            items = (await session.scalars(
+                select(Post).options(selectinload(Post.author))
+                .filter_by(published=True)
+                .order_by(Post.created_at.desc())
+                .limit(per_page).offset((page - 1) * per_page)
+            )).all()
+            total = await session.scalar(
+                select(func.count()).select_from(Post).filter_by(published=True)
+            )
+
+        pages = math.ceil(total / per_page) if total else 0
+        return 200, {
+            'posts': posts_schema.dump(items),
+            'pagination': {
+                'page': page,
+                'pages': pages,
+                'per_page': per_page,
+                'total': total,
+                'has_next': page < pages,
+                'has_prev': page > 1
+            }
+        }
+
+    async def get_post(self, headers, query, post_id):
+        if post_shards.count > 1:
+            return None
+        async with self.session() as session:
+            post = await session.scalar(
+                select(Post).options(selectinload(Post.author)).filter_by(id=int(post_id))
+            )
+        if post is None:
+            # Possibly archived: Flask looks there
+            return None
+
+        if not post.published:
+            current_user_id = await self.current_user_id(headers)
+            if not current_user_id or post.user_id != current_user_id:
+                return 404, {'error': 'Post not found'}
+
+        view_counter.record(post.id)
+        return 200, post_schema.dump(post)
+
+    async def get_user(self, headers, query, user_id):
+        async with self.session() as session:
+            user = await session.get(User, int(user_id))
+        if user is None:
+            # Flask answers with its own 404 page
+            return None
+
+        return 200, {
+            'id': user.id,
+            'username': user.username,
+            'created_at': user.created_at
+        }
+
+
+def create_asgi_app(config_name='default'):
+    """Build the ASGI application around a regular Flask app."""
+    return AsyncReadApp(create_app(config_name))
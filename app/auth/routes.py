@@ -3,17 +3,17 @@ from flask_login import login_user, logout_user, login_required, current_user
 from flask_dance.contrib.github import github
 from flask_dance.contrib.google import google
 from werkzeug.urls import url_parse
-import json
 
 from app import db, login_manager
 from app.auth import bp
 from app.auth.forms import LoginForm, RegistrationForm
 from app.models import User, OAuth
+from app.statements import user_by_email, user_by_username
 
 @login_manager.user_loader
 def load_user(user_id):
     """Load user by ID for Flask-Login."""
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
 
 @bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -23,7 +23,7 @@ def login():
     
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = db.session.scalars(user_by_email, {'email': form.email.data}).first()
         if user and user.check_password(form.password.data):
             login_user(user, remember=form.remember_me.data)
             next_page = request.args.get('next')
@@ -44,11 +44,11 @@ def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         # Check if user already exists
-        if User.query.filter_by(email=form.email.data).first():
+        if db.session.scalars(user_by_email, {'email': form.email.data}).first():
             flash('Email already registered', 'error')
             return redirect(url_for('auth.register'))
         
-        if User.query.filter_by(username=form.username.data).first():
+        if db.session.scalars(user_by_username, {'username': form.username.data}).first():
             flash('Username already taken', 'error')
             return redirect(url_for('auth.register'))
         
@@ -105,37 +105,24 @@ def github_login():
         return redirect(url_for('auth.login'))
     
     # Find or create user
-    user = User.query.filter_by(github_id=github_user_id).first()
+    user = OAuth.find_user('github', github_user_id)
     
     if not user:
         # Check if user exists with this email
-        existing_user = User.query.filter_by(email=primary_email).first()
+        existing_user = db.session.scalars(user_by_email, {'email': primary_email}).first()
         if existing_user:
             # Link GitHub account to existing user
-            existing_user.github_id = github_user_id
             user = existing_user
         else:
             # Create new user
             user = User(
                 username=github_info.get('login', ''),
-                email=primary_email,
-                github_id=github_user_id
+                email=primary_email
             )
             db.session.add(user)
     
-    # Store OAuth token
-    token = github.token
-    oauth = OAuth.query.filter_by(provider='github', user=user).first()
-    if oauth:
-        oauth.token = json.dumps(token)
-    else:
-        oauth = OAuth(
-            provider='github',
-            provider_user_id=github_user_id,
-            token=json.dumps(token),
-            user=user
-        )
-        db.session.add(oauth)
+    # Link account and store OAuth token
+    OAuth.link(user, 'github', github_user_id, github.token)
     
     db.session.commit()
     login_user(user)
@@ -159,37 +146,24 @@ def google_login():
     google_user_id = google_info['id']
     
     # Find or create user
-    user = User.query.filter_by(google_id=google_user_id).first()
+    user = OAuth.find_user('google', google_user_id)
     
     if not user:
         # Check if user exists with this email
-        existing_user = User.query.filter_by(email=google_info['email']).first()
+        existing_user = db.session.scalars(user_by_email, {'email': google_info['email']}).first()
         if existing_user:
             # Link Google account to existing user
-            existing_user.google_id = google_user_id
             user = existing_user
         else:
             # Create new user
             user = User(
                 username=google_info.get('name', '').replace(' ', '_').lower(),
-                email=google_info['email'],
-                google_id=google_user_id
+                email=google_info['email']
             )
             db.session.add(user)
     
-    # Store OAuth token
-    token = google.token
-    oauth = OAuth.query.filter_by(provider='google', user=user).first()
-    if oauth:
-        oauth.token = json.dumps(token)
-    else:
-        oauth = OAuth(
-            provider='google',
-            provider_user_id=google_user_id,
-            token=json.dumps(token),
-            user=user
-        )
-        db.session.add(oauth)
+    # Link account and store OAuth token
+    OAuth.link(user, 'google', google_user_id, google.token)
     
     db.session.commit()
     login_user(user)
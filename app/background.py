@@ -0,0 +1,94 @@
+"""Lightweight in-process background jobs."""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+
+class PeriodicTask:
+    """Runs ``func`` every ``interval`` seconds on a daemon thread.
+
+    The thread is started lazily by :meth:`ensure_started` and restarted in
+    each forked worker, since threads do not survive ``fork()`` (e.g. under
+    gunicorn's ``preload_app``). :meth:`wake` runs the job early.
+    """
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or not self.interval:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.func()
+
+
+def _owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def hold_lease(name, seconds):
+    """Take or renew the lease on job ``name`` for ``seconds``; True if held.
+
+    Lets one process of many run a periodic job: the holder renews the lease
+    on each run and another process takes over once it lapses, e.g. after
+    its worker is recycled. Commits; needs an app context.
+    """
+    from sqlalchemy.exc import IntegrityError
+    from app import db
+    from app.models import JobState
+
+    now, owner = datetime.utcnow(), _owner()
+    expires = now + timedelta(seconds=seconds)
+    table = JobState.__table__
+    renewed = db.session.execute(
+        table.update()
+        .where(table.c.name == name,
+               db.or_(table.c.owner == owner, table.c.owner.is_(None), table.c.lease_expires_at < now))
+        .values(owner=owner, lease_expires_at=expires)
+    ).rowcount
+    if not renewed:
+        try:
+            db.session.execute(table.insert().values(name=name, owner=owner, lease_expires_at=expires))
+        except IntegrityError:
+            # Another process holds it
+            db.session.rollback()
+            return False
+    db.session.commit()
+    return True
+
+
+def job_watermark(name):
+    """Where job ``name``'s next incremental run starts, or None if it never ran."""
+    from app import db
+    from app.models import JobState
+
+    return db.session.scalar(db.select(JobState.watermark).where(JobState.name == name))
+
+
+def set_job_watermark(name, value):
+    """Record job ``name``'s watermark; the caller commits, with the job's own writes."""
+    from app import db
+    from app.models import JobState
+    from app.utils import upsert_statement
+
+    db.session.execute(upsert_statement(
+        JobState, JobState.name, lambda excluded: {'watermark': excluded.watermark}
+    ), {'name': name, 'watermark': value})
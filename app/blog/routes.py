@@ -1,29 +1,34 @@
-from datetime import datetime
-from flask import render_template, redirect, url_for, flash, request, abort
+from flask import render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
 from app import db
+from app.archive import find_post_or_404, is_archived, remove_post, restore_post
+from app.duplicates import attach_signature, check_duplicate
 from app.blog import bp
 from app.blog.forms import PostForm
 from app.models import Post
+from app.post_events import post_events
+from app.revisions import apply_edit, record_revision
+from app.sharding import paginate_author, paginate_newest
+from app.view_counter import view_counter
 
 @bp.route('/posts')
 def posts():
     """List all published posts."""
     page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(published=True).order_by(
-        Post.created_at.desc()
-    ).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    posts = paginate_newest(page=page, per_page=10)
     return render_template('blog/posts.html', title='Blog Posts', posts=posts)
 
 @bp.route('/post/<int:id>')
 def post(id):
     """View a single blog post."""
-    post = Post.query.get_or_404(id)
+    post = find_post_or_404(id)
     if not post.published and (not current_user.is_authenticated or post.author != current_user):
         abort(404)
+    if not is_archived(post):
+        view_counter.record(post.id)
     return render_template('blog/post.html', title=post.title, post=post)
 
 @bp.route('/create', methods=['GET', 'POST'])
@@ -32,14 +37,22 @@ def create_post():
     """Create a new blog post."""
     form = PostForm()
     if form.validate_on_submit():
+        duplicate = check_duplicate(form.title.data, form.content.data)
+        if duplicate.duplicate_of and current_app.config['DUPLICATE_POLICY'] == 'reject':
+            flash('This post is too similar to an existing post.', 'error')
+            return render_template('blog/create_post.html', title='Create Post', form=form)
         post = Post(
             title=form.title.data,
             content=form.content.data,
             published=form.published.data,
             author=current_user
         )
+        attach_signature(post, duplicate)
         db.session.add(post)
+        db.session.flush()
+        record_revision(post, user_id=current_user.id)
         db.session.commit()
+        post_events.notify()
         flash('Your post has been created!', 'success')
         return redirect(url_for('blog.post', id=post.id))
     
@@ -49,17 +62,28 @@ def create_post():
 @login_required
 def edit_post(id):
     """Edit an existing blog post."""
-    post = Post.query.get_or_404(id)
+    post = find_post_or_404(id)
     if post.author != current_user:
         abort(403)
     
     form = PostForm()
     if form.validate_on_submit():
-        post.title = form.title.data
-        post.content = form.content.data
-        post.published = form.published.data
-        post.updated_at = datetime.utcnow()
-        db.session.commit()
+        if is_archived(post):
+            post = restore_post(post)
+        duplicate = check_duplicate(form.title.data, form.content.data, exclude_post_id=post.id)
+        if duplicate.duplicate_of and current_app.config['DUPLICATE_POLICY'] == 'reject':
+            flash('This post is too similar to an existing post.', 'error')
+            return render_template('blog/edit_post.html', title='Edit Post', form=form, post=post)
+        attach_signature(post, duplicate)
+        apply_edit(post, form.title.data, form.content.data, form.published.data, current_user.id)
+        try:
+            db.session.commit()
+        except (StaleDataError, IntegrityError):
+            # Another edit of the same version was saved first
+            db.session.rollback()
+            flash('This post was changed while you were editing it.', 'error')
+            return redirect(url_for('blog.edit_post', id=post.id))
+        post_events.notify()
         flash('Your post has been updated!', 'success')
         return redirect(url_for('blog.post', id=post.id))
     elif request.method == 'GET':
@@ -73,12 +97,12 @@ def edit_post(id):
 @login_required
 def delete_post(id):
     """Delete a blog post."""
-    post = Post.query.get_or_404(id)
+    post = find_post_or_404(id)
     if post.author != current_user:
         abort(403)
     
-    db.session.delete(post)
-    db.session.commit()
+    remove_post(post)
+    post_events.notify()
     flash('Your post has been deleted!', 'success')
     return redirect(url_for('blog.my_posts'))
 
@@ -87,9 +111,5 @@ def delete_post(id):
 def my_posts():
     """List current user's posts."""
     page = request.args.get('page', 1, type=int)
-    posts = Post.query.filter_by(author=current_user).order_by(
-        Post.created_at.desc()
-    ).paginate(
-        page=page, per_page=10, error_out=False
-    )
+    posts = paginate_author(current_user.id, page=page, per_page=10)
     return render_template('blog/my_posts.html', title='My Posts', posts=posts)
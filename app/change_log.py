@@ -0,0 +1,93 @@
+"""Post change log for incremental client sync.
+
+Mapper events append a row to ``post_change`` in the same transaction as
+every ORM insert, update or delete of a ``Post``, whichever route made it.
+Clients then ask for changes after their last cursor and get back only the
+posts that changed plus tombstones for deleted (or unpublished) ones.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models import Post, PostChange
+from app.sharding import main_connection, posts_by_ids
+
+
+def _log(connection, post_id, op):
+    main_connection(connection).execute(PostChange.__table__.insert().values(
+        post_id=post_id, op=op, changed_at=datetime.utcnow()
+    ))
+
+
+def _after_insert(mapper, connection, target):
+    _log(connection, target.id, 'create')
+
+
+def _after_update(mapper, connection, target):
+    # Fired for any dirty post, including relationship-only changes; only
+    # column changes are visible to clients
+    state = inspect(target)
+    if any(state.attrs[attr.key].history.has_changes() for attr in mapper.column_attrs):
+        published = state.attrs.published.history
+        unpublished = bool(published.deleted and published.deleted[0]) and not target.published
+        _log(connection, target.id, 'unpublish' if unpublished else 'update')
+
+
+def _after_delete(mapper, connection, target):
+    _log(connection, target.id, 'delete')
+
+
+def register_change_listeners():
+    for name, listener in (('after_insert', _after_insert),
+                           ('after_update', _after_update),
+                           ('after_delete', _after_delete)):
+        if not event.contains(Post, name, listener):
+            event.listen(Post, name, listener)
+
+
+class CursorExpired(Exception):
+    """The requested cursor points into pruned history; resync required."""
+
+
+def current_cursor():
+    return db.session.scalar(db.select(db.func.max(PostChange.seq))) or 0
+
+
+def changes_since(cursor, limit):
+    """Changes after ``cursor`` as ``(upserted_posts, deleted_ids, next_cursor, has_more)``.
+
+    Several changes to one post collapse into its current state. Posts that
+    are now unpublished or gone are reported as deleted.
+    """
+    oldest = db.session.scalar(db.select(db.func.min(PostChange.seq)))
+    if oldest is not None and cursor + 1 < oldest:
+        raise CursorExpired()
+
+    query = db.select(PostChange.seq, PostChange.post_id).where(
+        PostChange.seq > cursor
+    ).order_by(PostChange.seq).limit(limit + 1)
+    settle = current_app.config.get('CHANGE_FEED_SETTLE_SECONDS', 0)
+    if settle:
+        # Leave room for transactions that took their seq earlier but
+        # commit later (possible on PostgreSQL, not on SQLite)
+        query = query.where(PostChange.changed_at <= datetime.utcnow() - timedelta(seconds=settle))
+    rows = db.session.execute(query).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], [], cursor, False
+
+    post_ids = {row.post_id for row in rows}
+    posts = posts_by_ids(post_ids, published_only=True)
+    deleted = sorted(post_ids - {post.id for post in posts})
+    return posts, deleted, rows[-1].seq, has_more
+
+
+def prune_changes(older_than_days):
+    """Drop log rows older than the retention window; returns rows removed."""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    result = db.session.execute(db.delete(PostChange).where(PostChange.changed_at < cutoff))
+    db.session.commit()
+    return result.rowcount
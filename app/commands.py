@@ -0,0 +1,161 @@
+"""Maintenance commands, run with ``flask <command>``."""
+import click
+
+from app.trending import trending_scorer
+
+
+@click.command('trending-refresh')
+@click.option('--full', is_flag=True, help='Rescore every post, not just recently changed ones.')
+def trending_refresh(full):
+    """Recompute trending scores for recently changed posts."""
+    count = trending_scorer.refresh(full=full)
+    click.echo(f'Rescored {count} posts')
+
+
+@click.command('related-index')
+@click.option('--full', is_flag=True, help='Rebuild every neighbour list from scratch.')
+def related_index(full):
+    """Update the related-posts index for posts changed since the last run."""
+    from app.related import index_related_posts
+    count = index_related_posts(full=full)
+    click.echo(f'Updated related posts for {count} posts')
+
+
+@click.command('duplicates-backfill')
+@click.option('--chunk-size', default=250, show_default=True, help='Posts signed per batch.')
+def duplicates_backfill(chunk_size):
+    """Compute MinHash signatures for posts that have none."""
+    from app.duplicates import backfill_signatures
+    count = backfill_signatures(chunk_size=chunk_size)
+    click.echo(f'Signed {count} posts')
+
+
+@click.command('changes-prune')
+@click.option('--days', type=int, default=None, help='Retention in days (default CHANGE_LOG_RETENTION_DAYS).')
+def changes_prune(days):
+    """Delete change-log rows older than the retention window."""
+    from flask import current_app
+    from app.change_log import prune_changes
+    if days is None:
+        days = current_app.config.get('CHANGE_LOG_RETENTION_DAYS', 30)
+    count = prune_changes(days)
+    click.echo(f'Pruned {count} change-log rows')
+
+
+@click.command('tags-recount')
+def tags_recount():
+    """Recompute per-tag published post counts from the assignments."""
+    from app.tags import recount_tags
+    count = recount_tags()
+    click.echo(f'Corrected {count} tag counts')
+
+
+@click.command('archive-posts')
+@click.option('--days', type=int, default=None, help='Archive posts untouched this long (default ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Posts moved per batch (default ARCHIVE_BATCH_SIZE).')
+def archive_posts(days, batch_size):
+    """Move old posts from the hot table to the archive."""
+    from flask import current_app
+    from app.archive import archive_posts as archive
+    if days is None:
+        days = current_app.config.get('ARCHIVE_AFTER_DAYS', 365)
+    if batch_size is None:
+        batch_size = current_app.config.get('ARCHIVE_BATCH_SIZE', 500)
+    count = archive(days, batch_size)
+    click.echo(f'Archived {count} posts')
+
+
+@click.command('archive-restore')
+@click.argument('post_id', type=int)
+def archive_restore(post_id):
+    """Move an archived post back to the hot table."""
+    from app import db
+    from app.archive import restore_post
+    from app.models import ArchivedPost
+    archived = db.session.get(ArchivedPost, post_id)
+    if archived is None:
+        raise click.ClickException(f'Post {post_id} is not archived')
+    restore_post(archived)
+    click.echo(f'Restored post {post_id}')
+
+
+@click.command('posts-compress')
+@click.option('--batch-size', default=200, show_default=True, help='Rows rewritten per batch.')
+def posts_compress(batch_size):
+    """Compress post bodies stored before compression was enabled."""
+    from app.compression import compress_existing
+    total, after_ids = 0, {}
+    while True:
+        count, after_ids = compress_existing(batch_size, after_ids)
+        if not count:
+            break
+        total += count
+    click.echo(f'Checked {total} uncompressed post bodies')
+
+
+@click.command('shards-status')
+def shards_status():
+    """Show posts and authors per post shard."""
+    from app.sharding import shard_loads
+    for shard, authors in enumerate(shard_loads()):
+        click.echo(f'Shard {shard}: {sum(authors.values())} posts by {len(authors)} authors')
+
+
+@click.command('shards-move')
+@click.argument('user_id', type=int)
+@click.argument('shard', type=int)
+def shards_move(user_id, shard):
+    """Move one author's posts to another post shard."""
+    from app.sharding import ShardingError, move_author
+    try:
+        count = move_author(user_id, shard)
+    except ShardingError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Moved {count} posts of user {user_id} to shard {shard}')
+
+
+@click.command('shards-rebalance')
+@click.option('--max-moves', default=100, show_default=True, help='Authors moved at most.')
+@click.option('--dry-run', is_flag=True, help='Only print the planned moves.')
+def shards_rebalance(max_moves, dry_run):
+    """Move authors from crowded post shards to emptier ones."""
+    from app.sharding import rebalance
+    moves = rebalance(max_moves, dry_run)
+    for user_id, source, target, posts in moves:
+        click.echo(f'User {user_id}: {posts} posts, shard {source} -> {target}')
+    click.echo(f"{'Planned' if dry_run else 'Made'} {len(moves)} moves")
+
+
+@click.command('stats-catchup')
+@click.option('--days', type=int, default=None, help='Recount this many days up to today (default STATS_CATCHUP_DAYS).')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Recount every day from this date (YYYY-MM-DD) to today, e.g. to backfill.')
+def stats_catchup(days, since):
+    """Recount daily posts, sign-ups and verified emails from the source tables."""
+    from datetime import datetime, timedelta
+    from flask import current_app
+    from app.daily_stats import recount_days
+    today = datetime.utcnow().date()
+    if since is not None:
+        start = since.date()
+    else:
+        start = today - timedelta(days=(days or current_app.config.get('STATS_CATCHUP_DAYS', 2)) - 1)
+    if start > today:
+        raise click.ClickException('Nothing to recount after today')
+    count = recount_days(start, today)
+    click.echo(f'Recounted {count} days')
+
+
+def register_commands(app):
+    app.cli.add_command(trending_refresh)
+    app.cli.add_command(related_index)
+    app.cli.add_command(duplicates_backfill)
+    app.cli.add_command(changes_prune)
+    app.cli.add_command(tags_recount)
+    app.cli.add_command(archive_posts)
+    app.cli.add_command(archive_restore)
+    app.cli.add_command(posts_compress)
+    app.cli.add_command(shards_status)
+    app.cli.add_command(shards_move)
+    app.cli.add_command(shards_rebalance)
+    app.cli.add_command(stats_catchup)
@@ -0,0 +1,185 @@
+"""Compressed storage for post bodies.
+
+``Post.content`` (and ``ArchivedPost.content``) use :class:`CompressedText`.
+Bodies shorter than ``POST_COMPRESS_MIN_BYTES`` are stored as plain text.
+Longer ones are stored as a BLOB: one header byte naming the codec (zlib,
+or zstd when the optional ``zstandard`` package is installed), then the
+compressed UTF-8. A body that does not get smaller stays plain text.
+Reading accepts all three forms, so rows written before compression was
+enabled, or with another codec, keep working and can be converted at
+leisure by :func:`compress_existing`.
+
+Compression only applies on SQLite. PostgreSQL already compresses large
+``text`` values itself (TOAST), and its ``text`` columns cannot hold bytes.
+"""
+import threading
+import zlib
+
+from sqlalchemy.types import Text, TypeDecorator
+
+from app import db
+from app.background import PeriodicTask
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is always available
+    zstandard = None
+
+ZLIB = b'\x01'
+ZSTD = b'\x02'
+
+BATCH_SIZE = 200
+
+
+class Codec:
+    """Process-wide compression settings, set from the app config."""
+
+    def __init__(self):
+        self.algorithm = 'zlib'
+        self.min_bytes = 1024
+        self.level = None
+        self._local = threading.local()
+
+    def configure(self, algorithm, min_bytes, level=None):
+        if algorithm == 'zstd' and zstandard is None:
+            algorithm = 'zlib'
+        if algorithm not in ('zstd', 'zlib', 'none'):
+            raise ValueError(f'Unknown POST_COMPRESSION: {algorithm!r}')
+        self.algorithm, self.min_bytes, self.level = algorithm, min_bytes, level
+
+    def _zstd(self, kind):
+        # zstandard (de)compressors must not be shared between threads
+        key = f'{kind}_{self.level}'
+        coder = getattr(self._local, key, None)
+        if coder is None:
+            if kind == 'compress':
+                coder = zstandard.ZstdCompressor(level=self.level or 3)
+            else:
+                coder = zstandard.ZstdDecompressor()
+            setattr(self._local, key, coder)
+        return coder
+
+    def compress(self, text):
+        """``text`` itself, or header + compressed bytes if that is smaller."""
+        data = text.encode('utf-8')
+        if self.algorithm == 'none' or len(data) < self.min_bytes:
+            return text
+        if self.algorithm == 'zstd':
+            packed = ZSTD + self._zstd('compress').compress(data)
+        else:
+            packed = ZLIB + zlib.compress(data, self.level if self.level is not None else 6)
+        return packed if len(packed) < len(data) else text
+
+    def decompress(self, value):
+        header, body = value[:1], value[1:]
+        if header == ZLIB:
+            return zlib.decompress(body).decode('utf-8')
+        if header == ZSTD:
+            if zstandard is None:
+                raise RuntimeError('Post content is zstd-compressed but zstandard is not installed')
+            return self._zstd('decompress').decompress(body).decode('utf-8')
+        raise ValueError(f'Unknown compressed content header: {header!r}')
+
+
+codec = Codec()
+
+
+class CompressedText(TypeDecorator):
+    """Text column stored compressed above a size threshold (SQLite only)."""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name != 'sqlite':
+            return value
+        return codec.compress(value)
+
+    def process_result_value(self, value, dialect):
+        if isinstance(value, bytes):
+            return codec.decompress(value)
+        return value
+
+
+def compress_existing(batch_size=BATCH_SIZE, after_ids=None):
+    """Compress one batch of plain-text bodies per table; returns ``(rows, after_ids)``.
+
+    ``after_ids`` maps each table (``Post:<shard>`` for the post shards) to
+    the last id looked at, so repeated calls walk each table once even past
+    bodies that do not compress. Rows are rewritten with Core updates that keep ``updated_at`` and produce no
+    change-log entries: the posts did not change.
+    """
+    from app.models import ArchivedPost, Post
+    from app.sharding import post_shards
+
+    after_ids = dict(after_ids or {})
+    written = 0
+    tables = [(Post, shard) for shard in range(post_shards.count)] + [(ArchivedPost, None)]
+    for model, shard in tables:
+        with post_shards.using(shard):
+            if codec.algorithm == 'none' or db.session.get_bind(mapper=model).dialect.name != 'sqlite':
+                continue
+            written += _compress_batch(model, batch_size, after_ids,
+                                       model.__name__ if shard is None else f'{model.__name__}:{shard}')
+    db.session.commit()
+    return written, after_ids
+
+
+def _compress_batch(model, batch_size, after_ids, name):
+    rows = db.session.execute(
+        db.select(model.id, model.content).where(
+            model.id > after_ids.get(name, 0),
+            db.func.typeof(model.content) == 'text',
+            db.func.length(db.cast(model.content, db.LargeBinary)) >= codec.min_bytes
+        ).order_by(model.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return 0
+    after_ids[name] = rows[-1].id
+    table = model.__table__
+    values = {'content': db.bindparam('b_content')}
+    if 'updated_at' in table.c:
+        values['updated_at'] = table.c.updated_at
+    db.session.execute(
+        table.update().where(table.c.id == db.bindparam('b_id')).values(**values),
+        [{'b_id': row.id, 'b_content': row.content} for row in rows]
+    )
+    return len(rows)
+
+
+class CompressionBackfill:
+    """Compresses existing bodies in the background, one batch per run."""
+
+    def __init__(self):
+        self.app = None
+        self.batch_size = BATCH_SIZE
+        self._after_ids = {}
+        self._done = False
+        self._task = PeriodicTask('post-compression-backfill', self.run, 0)
+
+    def init_app(self, app):
+        self.app = app
+        codec.configure(app.config.get('POST_COMPRESSION', 'zstd'),
+                        app.config.get('POST_COMPRESS_MIN_BYTES', 1024),
+                        app.config.get('POST_COMPRESSION_LEVEL'))
+        self.batch_size = app.config.get('POST_COMPRESS_BATCH_SIZE', BATCH_SIZE)
+        self._task.interval = app.config.get('POST_COMPRESS_BACKFILL_SECONDS', 30)
+        app.extensions['compression_backfill'] = self
+        app.before_request(self._task.ensure_started)
+
+    def run(self):
+        if self._done:
+            return
+        with self.app.app_context():
+            try:
+                written, self._after_ids = compress_existing(self.batch_size, self._after_ids)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"Post compression backfill failed: {e}")
+                return
+            # New bodies are compressed on write, so once a pass finds
+            # nothing the backfill is over for good
+            self._done = not written
+
+
+compression_backfill = CompressionBackfill()
@@ -0,0 +1,164 @@
+"""Daily site stats kept in the ``daily_stats`` rollup table.
+
+Each write that counts adds one to today's row in the same transaction:
+mapper events on ``Post`` and ``User`` count new posts, sign-ups and
+verified emails whichever route made them, and ``OAuth.link`` counts each
+provider login. A catch-up job then recounts the last
+``STATS_CATCHUP_DAYS`` days of posts, sign-ups and verified emails from
+the source tables, correcting whatever the increments missed (a write
+flushed just after midnight, rows inserted with plain SQL, deleted posts).
+``GET /api/admin/stats`` reads only this table: one primary-key range per
+query however much activity it covers.
+"""
+from datetime import date, datetime, time, timedelta
+
+from sqlalchemy import event, inspect
+
+from app import db
+from app.background import PeriodicTask
+from app.models import ArchivedPost, DailyStats, Post, User
+from app.sharding import main_connection, scatter
+from app.utils import upsert_statement
+
+METRICS = ('posts', 'signups', 'verified_emails', 'oauth_logins')
+
+# Metrics the catch-up job can recount; OAuth logins leave no timestamped rows
+RECOUNTED = ('posts', 'signups', 'verified_emails')
+
+
+def _add(connection, **counts):
+    """Add ``counts`` to today's row on ``connection`` (a main database one)."""
+    connection.execute(upsert_statement(
+        DailyStats, DailyStats.day,
+        lambda excluded: {name: getattr(DailyStats, name) + getattr(excluded, name) for name in counts}
+    ), {'day': datetime.utcnow().date(), **counts})
+
+
+def _today(value):
+    # A post restored from the archive is inserted again with its old
+    # created_at; only rows created today are new
+    return value is None or value.date() == datetime.utcnow().date()
+
+
+def _post_inserted(mapper, connection, target):
+    if _today(target.created_at):
+        _add(main_connection(connection), posts=1)
+
+
+def _user_inserted(mapper, connection, target):
+    counts = {'signups': 1} if _today(target.created_at) else {}
+    if target.email_verified_at is not None and _today(target.email_verified_at):
+        counts['verified_emails'] = 1
+    if counts:
+        _add(connection, **counts)
+
+
+def _user_updated(mapper, connection, target):
+    history = inspect(target).attrs.email_verified_at.history
+    if (history.added and history.added[0] is not None and _today(history.added[0])
+            and not (history.deleted and history.deleted[0] is not None)):
+        _add(connection, verified_emails=1)
+
+
+def register_stats_listeners():
+    for model, name, listener in ((Post, 'after_insert', _post_inserted),
+                                  (User, 'after_insert', _user_inserted),
+                                  (User, 'after_update', _user_updated)):
+        if not event.contains(model, name, listener):
+            event.listen(model, name, listener)
+
+
+def record_oauth_login():
+    """Count a provider login in today's row; commits with the caller's session."""
+    _add(db.session.connection(bind_arguments={'mapper': DailyStats}), oauth_logins=1)
+
+
+def _as_date(value):
+    # func.date() gives a date on PostgreSQL and an ISO string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _count_by_day(column, start, end, *criteria):
+    day = db.func.date(column)
+    rows = db.session.execute(
+        db.select(day, db.func.count())
+        .where(column >= datetime.combine(start, time()),
+               column < datetime.combine(end + timedelta(days=1), time()), *criteria)
+        .group_by(day)
+    ).all()
+    return [(_as_date(value), count) for value, count in rows]
+
+
+def recount_days(start, end):
+    """Recount posts, sign-ups and verified emails for ``start``..``end`` inclusive.
+
+    Counts are read from every post shard, the archive and the user table
+    and written over the rollup rows; ``oauth_logins`` is left as it is.
+    Returns the number of days written.
+    """
+    counts = {start + timedelta(days=i): dict.fromkeys(RECOUNTED, 0)
+              for i in range((end - start).days + 1)}
+    # published IN (...) lets the range use the (published, created_at) indexes
+    published = (True, False)
+    post_counts = scatter(lambda: _count_by_day(Post.created_at, start, end, Post.published.in_(published)))
+    post_counts.append(_count_by_day(ArchivedPost.created_at, start, end,
+                                     ArchivedPost.published.in_(published)))
+    for rows in post_counts:
+        for day, count in rows:
+            counts[day]['posts'] += count
+    for day, count in _count_by_day(User.created_at, start, end):
+        counts[day]['signups'] = count
+    for day, count in _count_by_day(User.email_verified_at, start, end):
+        counts[day]['verified_emails'] = count
+
+    db.session.execute(upsert_statement(
+        DailyStats, DailyStats.day,
+        lambda excluded: {name: getattr(excluded, name) for name in RECOUNTED}
+    ), [{'day': day, **values} for day, values in counts.items()])
+    db.session.commit()
+    return len(counts)
+
+
+def stats_between(start, end):
+    """``[{'date', <metric>: count, ...}]`` for every day of ``start``..``end``, oldest first."""
+    rows = {row.day: row for row in db.session.scalars(
+        db.select(DailyStats).where(DailyStats.day.between(start, end))
+    )}
+    days = []
+    for i in range((end - start).days + 1):
+        day = start + timedelta(days=i)
+        row = rows.get(day)
+        days.append({'date': day.isoformat(),
+                     **{name: getattr(row, name) if row else 0 for name in METRICS}})
+    return days
+
+
+class DailyStatsCatchUp:
+    """Recounts the most recent days every ``STATS_CATCHUP_SECONDS``."""
+
+    def __init__(self):
+        self.app = None
+        self.days = 2
+        self._task = PeriodicTask('daily-stats-catchup', self.run, 3600.0)
+
+    def init_app(self, app):
+        self.app = app
+        self.days = app.config.get('STATS_CATCHUP_DAYS', 2)
+        self._task.interval = app.config.get('STATS_CATCHUP_SECONDS', 3600)
+        app.extensions['daily_stats'] = self
+        register_stats_listeners()
+        app.before_request(self._task.ensure_started)
+
+    def run(self):
+        """Recount today and the ``days - 1`` before it; returns the days written."""
+        end = datetime.utcnow().date()
+        with self.app.app_context():
+            try:
+                return recount_days(end - timedelta(days=self.days - 1), end)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"Daily stats catch-up failed: {e}")
+                return 0
+
+
+daily_stats = DailyStatsCatchUp()
@@ -0,0 +1,213 @@
+"""Near-duplicate post detection with MinHash and LSH banding.
+
+Each post's text is reduced to a set of word 3-gram shingles and summarised
+by a 128-value MinHash signature; the fraction of equal values between two
+signatures estimates the Jaccard similarity of their shingle sets. The
+signature is cut into 16 bands of 8 values and each band is hashed to a
+bucket key. Posts that share any bucket are candidates, so a new post is only
+compared against the handful of posts in its 16 buckets instead of the whole
+table. With 16 x 8 banding, pairs above ~0.7 similarity almost always share
+a bucket.
+"""
+import hashlib
+import re
+import zlib
+from dataclasses import dataclass
+
+import numpy as np
+from flask import current_app
+
+from app import db
+from app.models import Post, PostLshBucket, PostSignature
+
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# Shingles permuted per vectorised pass: each takes NUM_PERM x 8 bytes, so
+# a block's intermediate arrays stay around 32 MiB however long the posts
+BLOCK_SHINGLES = 1 << 15
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+
+# Fixed seed: signatures must be comparable across processes and restarts
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+WORD_RE = re.compile(r'\w+')
+
+
+@dataclass
+class DuplicateCheck:
+    """Outcome of checking a text against the LSH index."""
+    signature: np.ndarray = None
+    duplicate_of: int = None
+    similarity: float = None
+
+
+def shingle_hashes(text):
+    """32-bit hashes of the word 3-grams of ``text`` (as uint64)."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = set(words)
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_SIZE])
+                    for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode()) for s in shingles),
+                       dtype=np.uint64, count=len(shingles))
+
+
+def signatures(hash_sets):
+    """MinHash signatures for several shingle-hash arrays at once.
+
+    The shingles of the batch are permuted in vectorised blocks of at most
+    ``BLOCK_SHINGLES`` columns, whatever the number or length of the
+    documents. Each block is reduced per document with ``np.minimum.reduceat``
+    and folded into the running minimum of the documents it overlaps. Every
+    array must be non-empty. Returns an ``(n, NUM_PERM)`` uint32 array.
+    """
+    lengths = np.array([len(h) for h in hash_sets])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    ends = starts + lengths
+    values = np.concatenate(hash_sets)
+    result = np.full((len(hash_sets), NUM_PERM), MAX_HASH, dtype=np.uint64)
+    for begin in range(0, len(values), BLOCK_SHINGLES):
+        block = values[begin:begin + BLOCK_SHINGLES]
+        permuted = ((_A[:, None] * block[None, :] + _B[:, None]) % MERSENNE_PRIME) & MAX_HASH
+        # Documents overlapping the block; the first may have started before it
+        first = np.searchsorted(ends, begin, side='right')
+        last = np.searchsorted(starts, begin + len(block), side='left')
+        offsets = np.maximum(starts[first:last] - begin, 0)
+        np.minimum(result[first:last], np.minimum.reduceat(permuted, offsets, axis=1).T,
+                   out=result[first:last])
+    return result.astype(np.uint32)
+
+
+def band_keys(signature):
+    """Signed 64-bit bucket key for each band of a signature."""
+    data = signature.astype('<u4')
+    keys = []
+    for band in range(BANDS):
+        chunk = data[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little', signed=True))
+    return keys
+
+
+def _decode(blob):
+    return np.frombuffer(blob, dtype='<u4')
+
+
+def check_duplicate(title, content, exclude_post_id=None):
+    """Signature of a post's text and the closest indexed near-duplicate.
+
+    Returns an empty check when detection is disabled or the text has no
+    words. Only posts sharing an LSH bucket are compared.
+    """
+    if current_app.config.get('DUPLICATE_POLICY', 'flag') == 'off':
+        return DuplicateCheck()
+    hashes = shingle_hashes(f'{title}\n{content}')
+    if not len(hashes):
+        return DuplicateCheck()
+    signature = signatures([hashes])[0]
+
+    query = db.select(PostSignature.post_id, PostSignature.signature).join(
+        PostLshBucket, PostLshBucket.post_id == PostSignature.post_id
+    ).where(PostLshBucket.bucket.in_(band_keys(signature))).distinct().limit(
+        current_app.config.get('DUPLICATE_MAX_CANDIDATES', 50)
+    )
+    if exclude_post_id is not None:
+        query = query.where(PostSignature.post_id != exclude_post_id)
+
+    check = DuplicateCheck(signature=signature)
+    threshold = current_app.config.get('DUPLICATE_THRESHOLD', 0.8)
+    for post_id, blob in db.session.execute(query):
+        similarity = float(np.mean(_decode(blob) == signature))
+        if similarity >= threshold and similarity > (check.similarity or 0):
+            check.duplicate_of, check.similarity = post_id, similarity
+    return check
+
+
+def attach_signature(post, check):
+    """Store the checked signature on ``post``, replacing any previous one.
+
+    Flagged duplicates keep their signature but stay out of the buckets.
+    The caller commits.
+    """
+    if check.signature is None:
+        post.signature = None
+        return
+    buckets = [] if check.duplicate_of else [
+        PostLshBucket(bucket=key) for key in set(band_keys(check.signature))
+    ]
+    if post.signature is not None:
+        # Flush the old buckets' removal before inserting identical keys
+        post.signature = None
+        db.session.flush()
+    post.signature = PostSignature(
+        signature=check.signature.astype('<u4').tobytes(),
+        duplicate_of=check.duplicate_of,
+        similarity=check.similarity,
+        buckets=buckets
+    )
+
+
+def backfill_signatures(chunk_size=250):
+    """Compute signatures for posts that have none, in vectorised chunks.
+
+    Existing posts are indexed as-is; no duplicate policy is applied. Returns
+    the number of posts signed.
+    """
+    from app.sharding import post_shards
+
+    total = 0
+    for shard in range(post_shards.count):
+        total += _backfill_shard(shard, chunk_size)
+    return total
+
+
+def _backfill_shard(shard, chunk_size):
+    # Signatures are in the main database, posts on their shard: page
+    # through post ids and read the bodies of the unsigned ones
+    from app.sharding import post_shards
+
+    total = 0
+    last_id = 0
+    while True:
+        with post_shards.using(shard):
+            ids = db.session.scalars(
+                db.select(Post.id).where(Post.id > last_id).order_by(Post.id).limit(chunk_size)
+            ).all()
+        if not ids:
+            return total
+        last_id = ids[-1]
+        signed = set(db.session.scalars(
+            db.select(PostSignature.post_id).where(PostSignature.post_id.in_(ids))
+        ))
+        unsigned = [post_id for post_id in ids if post_id not in signed]
+        if not unsigned:
+            continue
+        with post_shards.using(shard):
+            rows = db.session.execute(
+                db.select(Post.id, Post.title, Post.content)
+                .where(Post.id.in_(unsigned)).order_by(Post.id)
+            ).all()
+
+        hashed = [(row.id, shingle_hashes(f'{row.title}\n{row.content}')) for row in rows]
+        hashed = [(post_id, h) for post_id, h in hashed if len(h)]
+        if hashed:
+            sigs = signatures([h for _, h in hashed])
+            db.session.execute(db.insert(PostSignature), [
+                {'post_id': post_id, 'signature': sig.astype('<u4').tobytes()}
+                for (post_id, _), sig in zip(hashed, sigs)
+            ])
+            db.session.execute(db.insert(PostLshBucket), [
+                {'post_id': post_id, 'bucket': key}
+                for (post_id, _), sig in zip(hashed, sigs)
+                for key in set(band_keys(sig))
+            ])
+        db.session.commit()
+        total += len(hashed)
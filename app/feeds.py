@@ -0,0 +1,235 @@
+"""RSS/Atom feeds and the sitemap, built by streaming and cached per shard.
+
+The sitemap is split into shards of ``SITEMAP_SHARD_SIZE`` consecutive post
+ids under one sitemap index. Every document is rendered from rows streamed
+with ``yield_per`` and kept in memory together with its ETag and
+Last-Modified. Before serving, the cache reads the post change log since the
+last check (at most once per ``FEED_CHECK_SECONDS``) and drops only the
+documents those posts belong to: the shard holding each changed id, the
+feeds, and the index. Crawlers re-fetching unchanged shards get them from
+memory, or a 304.
+"""
+import hashlib
+import heapq
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+from xml.sax.saxutils import escape, quoteattr
+
+from flask import current_app
+
+from app import db
+
+STREAM_BATCH = 1000
+
+SUMMARY_CHARS = 300
+
+
+@dataclass
+class Document:
+    body: bytes
+    etag: str
+    last_modified: datetime
+    mimetype: str
+    entries: int
+
+
+def _post_url(post_id):
+    return f"{current_app.config['SITE_URL'].rstrip('/')}/posts/{post_id}"
+
+
+def _iso(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _summary(content):
+    return content[:SUMMARY_CHARS] + ('...' if len(content) > SUMMARY_CHARS else '')
+
+
+def _later(a, b):
+    return b if a is None or (b is not None and b > a) else a
+
+
+def _document(head, chunks, tail, last_modified, mimetype):
+    body = ''.join([head, *chunks, tail]).encode()
+    return Document(body, hashlib.sha1(body).hexdigest(),
+                    last_modified or datetime(2020, 1, 1), mimetype, len(chunks))
+
+
+def _latest_posts():
+    from app.models import User
+    from app.sharding import scatter_merge
+    from app.statements import latest_published_rows
+
+    # Authors are in the main database and posts on their shards, so the
+    # usernames are looked up after the merge instead of joined
+    rows = scatter_merge(latest_published_rows, lambda row: (row.created_at, row.id),
+                         current_app.config.get('FEED_SIZE', 50), scalars=False)
+    usernames = dict(db.session.execute(
+        db.select(User.id, User.username).where(User.id.in_({row.user_id for row in rows}))
+    ).all())
+    return [SimpleNamespace(**row._mapping, username=usernames.get(row.user_id)) for row in rows]
+
+
+def build_rss():
+    site = current_app.config['SITE_URL']
+    chunks, last_modified = [], None
+    for row in _latest_posts():
+        last_modified = _later(last_modified, row.updated_at)
+        chunks.append(
+            f'<item><title>{escape(row.title)}</title>'
+            f'<link>{_post_url(row.id)}</link>'
+            f'<guid isPermaLink="true">{_post_url(row.id)}</guid>'
+            f'<pubDate>{format_datetime(row.created_at.replace(tzinfo=timezone.utc), usegmt=True)}</pubDate>'
+            f'<author>{escape(row.username)}</author>'
+            f'<description>{escape(_summary(row.content))}</description></item>\n'
+        )
+    head = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>\n'
+        f'<title>{escape(current_app.config["SITE_NAME"])}</title><link>{escape(site)}</link>'
+        f'<description>Latest posts</description>\n'
+    )
+    return _document(head, chunks, '</channel></rss>\n', last_modified, 'application/rss+xml')
+
+
+def build_atom():
+    site = current_app.config['SITE_URL']
+    chunks, last_modified = [], None
+    for row in _latest_posts():
+        last_modified = _later(last_modified, row.updated_at)
+        chunks.append(
+            f'<entry><id>{_post_url(row.id)}</id><title>{escape(row.title)}</title>'
+            f'<link href={quoteattr(_post_url(row.id))}/>'
+            f'<published>{_iso(row.created_at)}</published>'
+            f'<updated>{_iso(row.updated_at or row.created_at)}</updated>'
+            f'<author><name>{escape(row.username)}</name></author>'
+            f'<summary>{escape(_summary(row.content))}</summary></entry>\n'
+        )
+    head = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n'
+        f'<id>{escape(site)}</id><title>{escape(current_app.config["SITE_NAME"])}</title>'
+        f'<link href={quoteattr(site)}/>'
+        f'<updated>{_iso(last_modified or datetime.utcnow())}</updated>\n'
+    )
+    return _document(head, chunks, '</feed>\n', last_modified, 'application/atom+xml')
+
+
+def shard_bounds(shard):
+    size = current_app.config.get('SITEMAP_SHARD_SIZE', 10000)
+    return shard * size + 1, (shard + 1) * size
+
+
+def build_sitemap_shard(shard):
+    from app.models import ArchivedPost, Post
+    from app.sharding import scatter
+
+    first, last = shard_bounds(shard)
+
+    def stream(model):
+        return db.session.execute(
+            db.select(model.id, model.updated_at)
+            .where(model.published.is_(True), model.id.between(first, last))
+            .order_by(model.id)
+            .execution_options(yield_per=STREAM_BATCH)
+        )
+
+    # Archived posts keep their URLs: merge every post shard and the
+    # archive in id order
+    rows = heapq.merge(*scatter(lambda: stream(Post)), stream(ArchivedPost),
+                       key=lambda row: row.id)
+    chunks, last_modified = [], None
+    for row in rows:
+        last_modified = _later(last_modified, row.updated_at)
+        chunks.append(f'<url><loc>{_post_url(row.id)}</loc>'
+                      f'<lastmod>{_iso(row.updated_at)}</lastmod></url>\n')
+    head = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    return _document(head, chunks, '</urlset>\n', last_modified, 'application/xml')
+
+
+class FeedCache:
+    """Rendered feed and sitemap documents, invalidated from the change log."""
+
+    def __init__(self):
+        self._docs = {}
+        self._seq = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key, build, keep_empty=True):
+        """Cached document for ``key``, rendering it with ``build()`` if stale."""
+        self._invalidate()
+        doc = self._docs.get(key)
+        if doc is None:
+            seq = self._seq
+            doc = build()
+            # A check that ran meanwhile may have seen writes this build
+            # missed; serve the result but do not keep it
+            if seq == self._seq and (keep_empty or doc.entries):
+                self._docs[key] = doc
+        return doc
+
+    def sitemap_shard(self, shard):
+        """Sitemap of one shard of post ids, or None if it lists no posts.
+
+        Empty shards are not cached: any shard number can be requested, and
+        only the shards posts are written to are ever invalidated.
+        """
+        doc = self.get(('sitemap', shard), lambda: build_sitemap_shard(shard), keep_empty=False)
+        return doc if doc.entries else None
+
+    def sitemap_index(self, url_for_shard):
+        def build():
+            from app.models import ArchivedPost, Post
+            from app.sharding import scatter
+
+            size = current_app.config.get('SITEMAP_SHARD_SIZE', 10000)
+            max_id = max(*scatter(lambda: db.session.scalar(db.select(db.func.max(Post.id))) or 0),
+                         db.session.scalar(db.select(db.func.max(ArchivedPost.id))) or 0)
+            chunks, last_modified = [], None
+            for shard in range((max_id + size - 1) // size):
+                shard_doc = self.sitemap_shard(shard)
+                if shard_doc is None:
+                    continue
+                last_modified = _later(last_modified, shard_doc.last_modified)
+                chunks.append(f'<sitemap><loc>{escape(url_for_shard(shard))}</loc>'
+                              f'<lastmod>{_iso(shard_doc.last_modified)}</lastmod></sitemap>\n')
+            head = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            return _document(head, chunks, '</sitemapindex>\n', last_modified, 'application/xml')
+
+        return self.get('sitemap-index', build)
+
+    def _invalidate(self):
+        from app.change_log import current_cursor
+        from app.models import PostChange
+
+        now = time.monotonic()
+        if now - self._checked < current_app.config.get('FEED_CHECK_SECONDS', 1.0):
+            return
+        with self._lock:
+            self._checked = now
+            cursor = current_cursor()
+            if self._seq is None or cursor < self._seq:
+                self._docs.clear()
+            elif cursor > self._seq:
+                oldest = db.session.scalar(db.select(db.func.min(PostChange.seq)))
+                if oldest is not None and self._seq + 1 < oldest:
+                    # History was pruned past our position: start over
+                    self._docs.clear()
+                else:
+                    post_ids = db.session.scalars(
+                        db.select(PostChange.post_id).where(PostChange.seq > self._seq).distinct()
+                    ).all()
+                    size = current_app.config.get('SITEMAP_SHARD_SIZE', 10000)
+                    for shard in {(post_id - 1) // size for post_id in post_ids}:
+                        self._docs.pop(('sitemap', shard), None)
+                    for key in ('rss', 'atom', 'sitemap-index'):
+                        self._docs.pop(key, None)
+            self._seq = cursor
+
+
+feed_cache = FeedCache()
@@ -0,0 +1,166 @@
+"""Liveness and readiness checks for orchestrators and load balancers.
+
+``/api/health/live`` only says the process is serving requests.
+``/api/health/ready`` runs the dependency checks below and answers 503 when
+a critical one fails, so traffic is routed away from a worker that cannot
+reach its database:
+
+* ``database`` (critical) - a round-trip on a pooled connection of every
+  engine (main, archive, post shards), with each pool's checkout counts;
+* ``schema`` (critical) - every table and column of the models exists, i.e.
+  the startup migration has been applied to the database this worker uses;
+* ``smtp`` - the mail server accepts a connection, when SMTP is configured.
+  Mail is sent inline by the requests that need it, so an unreachable
+  server only affects sign-up and password-reset mail: it makes the worker
+  ``degraded`` (still 200) rather than unready.
+
+Results are cached per process for ``READINESS_CACHE_SECONDS``. One thread
+runs the checks at a time while concurrent probes get the previous result,
+so however many load balancers probe, each worker checks its dependencies
+at most once per interval.
+"""
+import logging
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, select
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def _failure(e):
+    # Probe responses are public: name the error, log the details
+    return {'ok': False, 'error': type(e).__name__}
+
+
+def _engines():
+    return [(key or 'default', key, engine) for key, engine in db.engines.items()]
+
+
+def check_database():
+    results = {}
+    for name, _, engine in _engines():
+        began = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.execute(select(1))
+            result = {'ok': True, 'latency_ms': round((time.perf_counter() - began) * 1000, 2)}
+        except Exception as e:
+            logger.warning('Readiness: database %s unreachable: %s', name, e)
+            result = _failure(e)
+        pool = engine.pool
+        if hasattr(pool, 'checkedout'):
+            result['pool'] = {'size': pool.size(), 'checked_out': pool.checkedout(),
+                              'overflow': pool.overflow()}
+        results[name] = result
+    return {'ok': all(result['ok'] for result in results.values()), 'engines': results}
+
+
+def _expected_tables(key):
+    from app.sharding import SHARDED_TABLES
+
+    if key in db.metadatas:
+        return db.metadatas[key].tables.values()
+    # Post shards hold the sharded tables of the main metadata
+    return [table for table in db.metadata.tables.values() if table.name in SHARDED_TABLES]
+
+
+def check_schema():
+    missing = []
+    try:
+        for name, key, engine in _engines():
+            inspector = inspect(engine)
+            existing = set(inspector.get_table_names())
+            for table in _expected_tables(key):
+                if table.name not in existing:
+                    missing.append(f'{name}:{table.name}')
+                    continue
+                columns = {column['name'] for column in inspector.get_columns(table.name)}
+                missing += [f'{name}:{table.name}.{column.name}'
+                            for column in table.columns if column.name not in columns]
+    except Exception as e:
+        logger.warning('Readiness: schema check failed: %s', e)
+        return _failure(e)
+    if missing:
+        logger.warning('Readiness: database schema is behind the models: %s', ', '.join(missing))
+    return {'ok': not missing, 'missing': missing}
+
+
+def check_smtp(timeout):
+    # Same settings as app.utils.send_email
+    host = os.environ.get('SMTP_HOST')
+    if not host or not os.environ.get('SMTP_USER') or not os.environ.get('SMTP_PASSWORD'):
+        return {'ok': True, 'configured': False}
+    began = time.perf_counter()
+    try:
+        server = smtplib.SMTP(host, int(os.environ.get('SMTP_PORT', '587')), timeout=timeout)
+        try:
+            server.noop()
+        finally:
+            server.close()
+    except Exception as e:
+        logger.warning('Readiness: SMTP server %s unreachable: %s', host, e)
+        return {**_failure(e), 'configured': True}
+    return {'ok': True, 'configured': True,
+            'latency_ms': round((time.perf_counter() - began) * 1000, 2)}
+
+
+class Readiness:
+    """Runs the dependency checks and caches their outcome briefly."""
+
+    CRITICAL = ('database', 'schema')
+
+    def __init__(self):
+        self.ttl = 5.0
+        self.smtp_timeout = 3.0
+        self._result = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('READINESS_CACHE_SECONDS', 5.0)
+        self.smtp_timeout = app.config.get('READINESS_SMTP_TIMEOUT', 3.0)
+        app.extensions['readiness'] = self
+
+    def _fresh(self):
+        return self._result is not None and time.monotonic() - self._checked < self.ttl
+
+    def status(self):
+        """``(ready, report)``; ``ready`` is False if a critical check failed."""
+        if not self._fresh():
+            # Wait only when there is nothing to serve yet
+            if self._lock.acquire(blocking=self._result is None):
+                try:
+                    if not self._fresh():
+                        self._result = self._run()
+                        self._checked = time.monotonic()
+                finally:
+                    self._lock.release()
+        return self._result
+
+    def _run(self):
+        checks = {
+            'database': check_database(),
+            'schema': check_schema(),
+            'smtp': check_smtp(self.smtp_timeout),
+        }
+        ready = all(checks[name]['ok'] for name in self.CRITICAL)
+        if not ready:
+            status = 'unavailable'
+        elif all(check['ok'] for check in checks.values()):
+            status = 'ready'
+        else:
+            status = 'degraded'
+        return ready, {
+            'status': status,
+            'checked_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+            'checks': checks,
+        }
+
+
+readiness = Readiness()
@@ -0,0 +1,169 @@
+"""Structured logging through a background writer thread.
+
+Log calls on request threads only build a record and put it on a queue
+(:class:`ContextQueueHandler`); a ``QueueListener`` thread formats it as
+one JSON object per line and writes it to stderr. A slow or blocked stderr
+therefore never stalls a request.
+
+Every record carries the id of the request it was logged in, taken from an
+incoming ``X-Request-ID`` header or generated, and echoed on the response.
+Levels are set per logger with ``LOG_LEVELS``. Debug records are sampled
+per request (``LOG_DEBUG_SAMPLE_RATE``): a request either keeps all of its
+debug records or none, so sampled requests can still be followed end to end.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import traceback
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+REQUEST_ID_RE = re.compile(r'^[\w.:-]{1,64}$')
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'request_id'}
+
+
+def parse_levels(spec):
+    """``{'app.oauth_handler': 'DEBUG'}`` from ``"app.oauth_handler=DEBUG,..."``."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        if not isinstance(logging.getLevelName(level.strip().upper()), int):
+            raise ValueError(f'Invalid LOG_LEVELS entry: {item!r}')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including fields passed with ``extra``."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'pid': record.process,
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text or record.exc_info:
+            entry['exc'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ContextQueueHandler(QueueHandler):
+    """Queues records with their request id, leaving formatting to the listener.
+
+    The message is merged with its arguments and any traceback rendered
+    here, while the objects they refer to are still current; everything
+    else waits for the writer thread.
+    """
+
+    def __init__(self, log_queue, debug_sample_rate=1.0):
+        super().__init__(log_queue)
+        self.debug_sample_rate = debug_sample_rate
+
+    def _keep_debug(self):
+        if self.debug_sample_rate >= 1:
+            return True
+        if not has_request_context():
+            return random.random() < self.debug_sample_rate
+        if 'log_debug' not in g:
+            g.log_debug = random.random() < self.debug_sample_rate
+        return g.log_debug
+
+    def emit(self, record):
+        if record.levelno <= logging.DEBUG and not self._keep_debug():
+            return
+        super().emit(record)
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = ''.join(traceback.format_exception(*record.exc_info)).rstrip()
+            record.exc_info = None
+        if not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id') if has_request_context() else None
+        return record
+
+
+class LogPipeline:
+    """The process-wide queue, its handler on the root logger and the writer thread."""
+
+    def __init__(self):
+        self.handler = None
+        self.listener = None
+        self.output = None
+
+    def install(self, debug_sample_rate):
+        if self.handler is None:
+            self.output = logging.StreamHandler(sys.stderr)
+            self.output.setFormatter(JsonFormatter())
+            self.handler = ContextQueueHandler(queue.SimpleQueue(), debug_sample_rate)
+            logging.getLogger().addHandler(self.handler)
+            self._start()
+            atexit.register(self.stop)
+            # The writer thread does not survive a fork (gunicorn preload)
+            if hasattr(os, 'register_at_fork'):
+                os.register_at_fork(after_in_child=self._restart_in_child)
+        self.handler.debug_sample_rate = debug_sample_rate
+
+    def _start(self):
+        self.listener = QueueListener(self.handler.queue, self.output, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart_in_child(self):
+        self.handler.queue = queue.SimpleQueue()
+        self._start()
+
+    def stop(self):
+        """Flush queued records and stop the writer thread."""
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+
+log_pipeline = LogPipeline()
+
+
+def _assign_request_id():
+    incoming = request.headers.get('X-Request-ID', '')
+    g.request_id = incoming if REQUEST_ID_RE.match(incoming) else uuid.uuid4().hex
+
+
+def _echo_request_id(response):
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+
+def init_app(app):
+    app.before_request(_assign_request_id)
+    app.after_request(_echo_request_id)
+    if not app.config.get('LOG_STRUCTURED', True):
+        return
+
+    root = logging.getLogger()
+    root.setLevel(app.config.get('LOG_LEVEL', 'INFO').upper())
+    for name, level in parse_levels(app.config.get('LOG_LEVELS', '')).items():
+        logging.getLogger(name).setLevel(level)
+    # Flask's own stderr handler would write every app.logger record twice,
+    # synchronously; let them propagate to the queue instead
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(logging.NOTSET)
+    log_pipeline.install(app.config.get('LOG_DEBUG_SAMPLE_RATE', 1.0))
@@ -0,0 +1,260 @@
+"""Uploaded images: avatars and pictures embedded in posts.
+
+Upload parts never sit in memory whole: :class:`MediaRequest` has Werkzeug's
+multipart parser write each file part straight into a temporary file inside
+the upload folder, hashing it on the way. Storing the file is then a rename
+to its content-addressed path (``originals/ab/cd/<sha256>.<ext>``), and an
+identical upload is just dropped.
+
+Thumbnails are rendered by a small process pool after the request has
+returned; until one exists the original is served with a short cache
+lifetime. Everything under a content-addressed URL never changes, so it is
+served with ``immutable`` cache headers, through ``sendfile`` via the WSGI
+file wrapper or handed to nginx with ``X-Accel-Redirect``.
+"""
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import Request, current_app, g, request, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from app import db
+from app.utils import upsert_statement
+
+FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+MIMETYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'gif': 'image/gif', 'webp': 'image/webp'}
+
+# Decoded size limit; guards the thumbnail workers against decompression bombs
+MAX_PIXELS = 40_000_000
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class InvalidImage(ValueError):
+    """The upload is not an image in a supported format."""
+
+
+class HashingSpool:
+    """File object the multipart parser writes an upload part into.
+
+    Data goes to a named file in the upload folder's ``tmp`` directory and
+    through SHA-256 as it is written, so the part is never held in memory
+    and never needs a second pass.
+    """
+
+    def __init__(self, directory, limit):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        self.path = self._file.name
+        self.limit = limit
+        self.size = 0
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge()
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class MediaRequest(Request):
+    """Request whose uploaded files are spooled by :class:`HashingSpool`."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        directory = media_path('tmp')
+        os.makedirs(directory, exist_ok=True)
+        spool = HashingSpool(directory, current_app.config.get('UPLOAD_MAX_BYTES', 10 << 20))
+        g.setdefault('media_spools', []).append(spool)
+        return spool
+
+
+def _remove_spools(exc=None):
+    # Parts that were not stored (rejected, duplicate, unused field)
+    for spool in g.pop('media_spools', []):
+        spool.close()
+        try:
+            os.unlink(spool.path)
+        except FileNotFoundError:
+            pass
+
+
+def media_path(*parts):
+    root = current_app.config.get('UPLOAD_FOLDER') or os.path.join(current_app.instance_path, 'uploads')
+    return os.path.join(root, *parts)
+
+
+def _sharded(name):
+    return os.path.join(name[:2], name[2:4], name)
+
+
+def original_path(name):
+    return media_path('originals', _sharded(name))
+
+
+def thumbnail_path(name, size):
+    return media_path('thumbs', str(size), _sharded(name))
+
+
+def _inspect_image(path):
+    """``(ext, width, height)`` of an image file; raises InvalidImage."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(path) as image:
+            ext = FORMATS.get(image.format)
+            width, height = image.size
+            if ext is None:
+                raise InvalidImage(f'Unsupported image format: {image.format}')
+            if width * height > MAX_PIXELS:
+                raise InvalidImage('Image dimensions are too large')
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage('File is not a valid image') from e
+    return ext, width, height
+
+
+def render_thumbnails(source, targets):
+    """Write ``(size, path)`` thumbnails of ``source``; runs in a pool process."""
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image.load()
+        for size, path in targets:
+            if os.path.exists(path):
+                continue
+            thumb = image.copy()
+            thumb.thumbnail((size, size))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f'{path}.{os.getpid()}.part'
+            thumb.save(partial, format=image.format)
+            os.replace(partial, path)
+    return len(targets)
+
+
+class ThumbnailPool:
+    """Per-process pool rendering thumbnails off the request threads.
+
+    Workers are spawned rather than forked: the web process has threads
+    (background jobs, the server's own) that a fork would copy mid-flight.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pid = None
+        self.workers = 2
+
+    def submit(self, source, targets):
+        if self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            self._pid = os.getpid()
+        return self._executor.submit(render_thumbnails, source, targets)
+
+
+thumbnail_pool = ThumbnailPool()
+
+
+def init_app(app):
+    app.request_class = MediaRequest
+    app.teardown_request(_remove_spools)
+    thumbnail_pool.workers = app.config.get('MEDIA_THUMBNAIL_WORKERS', 2)
+
+
+def store_upload(file_storage, user_id):
+    """Store an uploaded image and queue its thumbnails; returns the MediaFile.
+
+    Raises :class:`InvalidImage` for anything that is not a supported image.
+    The caller commits.
+    """
+    from app.models import MediaFile
+
+    spool = file_storage.stream
+    if not isinstance(spool, HashingSpool):
+        raise InvalidImage('No file uploaded')
+    spool.flush()
+    ext, width, height = _inspect_image(spool.path)
+    name = f'{spool.hexdigest()}.{ext}'
+
+    media = db.session.get(MediaFile, name)
+    path = original_path(name)
+    if media is None or not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        spool.close()
+        os.replace(spool.path, path)
+    if media is None:
+        # Concurrent identical uploads race for the same row; either one wins
+        db.session.execute(upsert_statement(
+            MediaFile, MediaFile.name, lambda excluded: {'name': excluded.name}
+        ), [{'name': name, 'size': spool.size, 'width': width, 'height': height,
+             'uploaded_by': user_id}])
+        media = db.session.get(MediaFile, name)
+
+    targets = []
+    for size in current_app.config.get('THUMBNAIL_SIZES', (128, 512)):
+        thumb = thumbnail_path(name, size)
+        if os.path.exists(thumb):
+            continue
+        if size >= max(width, height):
+            # Already small enough: the original doubles as this thumbnail
+            os.makedirs(os.path.dirname(thumb), exist_ok=True)
+            try:
+                os.link(path, thumb)
+            except FileExistsError:
+                pass
+            except OSError:
+                shutil.copyfile(path, thumb)
+        else:
+            targets.append((size, thumb))
+    if targets:
+        thumbnail_pool.submit(path, targets)
+    return media
+
+
+def media_url(name, size=None):
+    return f'/api/media/{name}' + (f'?size={size}' if size else '')
+
+
+def send_media(name, size=None):
+    """Response for a stored file, or None if it does not exist."""
+    path, immutable = original_path(name), True
+    if size is not None:
+        thumb = thumbnail_path(name, size)
+        if os.path.exists(thumb):
+            path = thumb
+        else:
+            # Not rendered yet (or the original is smaller): serve the original
+            # briefly so the thumbnail is picked up once it exists
+            immutable = False
+    if not os.path.exists(path):
+        return None
+
+    mimetype = MIMETYPES.get(name.rsplit('.', 1)[-1], 'application/octet-stream')
+    etag = name if path == original_path(name) else f'{name}-{size}'
+    max_age = IMMUTABLE_MAX_AGE if immutable else 60
+    prefix = current_app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX')
+    if prefix:
+        response = current_app.response_class(mimetype=mimetype)
+        relative = os.path.relpath(path, media_path())
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative.replace(os.sep, '/')
+        response.set_etag(etag)
+        response.make_conditional(request)
+    else:
+        # Werkzeug streams through wsgi.file_wrapper, i.e. sendfile() under gunicorn
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag,
+                             max_age=max_age)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = immutable or None
+    return response
@@ -0,0 +1,205 @@
+"""Worker memory diagnostics behind ``/api/diagnostics/memory``.
+
+* ``tracemalloc`` can be started and stopped at run time. Snapshots are
+  kept in memory (the newest ``MAX_SNAPSHOTS``) and diffed by line or by
+  file, to see what grew between two points.
+* A ``MEMORY_SAMPLE_RATE`` fraction of requests (adjustable at run time)
+  is measured: RSS before and after, and (while tracing) the peak of traced
+  memory during the request. Results are aggregated per endpoint, so
+  endpoints that leave RSS higher than they found it stand out.
+* The process RSS is recorded at most every ``MEMORY_RSS_INTERVAL`` seconds
+  on a sampled request, as a timeline with the endpoint that moved it most.
+
+Everything is per worker process. The tracemalloc peak is process-wide, so
+a request's peak is only measured while no other sampled request is in
+flight, and it can still include allocations from other threads.
+"""
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from flask import g, request
+
+MAX_SNAPSHOTS = 5
+
+TIMELINE_POINTS = 1440
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+@dataclass
+class EndpointMemory:
+    requests: int = 0
+    rss_growth: int = 0
+    max_rss_growth: int = 0
+    last_rss: int = 0
+    peak_samples: int = 0
+    peak_total: int = 0
+    max_peak: int = 0
+
+    def as_dict(self):
+        data = asdict(self)
+        data['mean_peak'] = self.peak_total // self.peak_samples if self.peak_samples else None
+        del data['peak_total']
+        return data
+
+
+class MemoryDiagnostics:
+    """tracemalloc control, snapshot diffs and per-endpoint memory stats."""
+
+    def __init__(self):
+        self.sample_rate = 0.0
+        self.rss_interval = 60.0
+        self._lock = threading.Lock()
+        # Held by the one sampled request whose tracemalloc peak is measured
+        self._peak_lock = threading.Lock()
+        self._snapshots = OrderedDict()
+        self._next_snapshot = 1
+        self._endpoints = {}
+        self._timeline = deque(maxlen=TIMELINE_POINTS)
+        self._last_point = 0.0
+        self._growth_since_point = {}
+
+    def init_app(self, app):
+        # Only reachable through the diagnostics API, which needs the token
+        if not app.config.get('DIAGNOSTICS_TOKEN'):
+            return
+        self.sample_rate = app.config.get('MEMORY_SAMPLE_RATE', 0.0)
+        self.rss_interval = app.config.get('MEMORY_RSS_INTERVAL', 60.0)
+        app.before_request(self._before)
+        app.teardown_request(self._after)
+
+    # -- tracing and snapshots --
+
+    def start_tracing(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+
+    def stop_tracing(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def take_snapshot(self):
+        """Snapshot the traced allocations; returns its id. Tracing must be on."""
+        snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        with self._lock:
+            snapshot_id = self._next_snapshot
+            self._next_snapshot += 1
+            self._snapshots[snapshot_id] = (datetime.utcnow(), snapshot)
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def diff(self, base_id, other_id, group_by='lineno', limit=25):
+        """Largest changes from snapshot ``base_id`` to ``other_id``; KeyError if unknown."""
+        with self._lock:
+            base = self._snapshots[base_id][1]
+            other = self._snapshots[other_id][1]
+        stats = other.compare_to(base, group_by)
+        return [{
+            'file': stat.traceback[0].filename,
+            'line': stat.traceback[0].lineno if group_by == 'lineno' else None,
+            'size': stat.size,
+            'size_diff': stat.size_diff,
+            'count': stat.count,
+            'count_diff': stat.count_diff,
+        } for stat in stats[:limit]]
+
+    def status(self):
+        traced, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'rss': current_rss(),
+                'tracing': tracemalloc.is_tracing(),
+                'traced': traced,
+                'traced_peak': peak,
+                'sample_rate': self.sample_rate,
+                'snapshots': [{'id': snapshot_id, 'taken_at': taken_at.isoformat()}
+                              for snapshot_id, (taken_at, _) in self._snapshots.items()],
+            }
+
+    def endpoint_stats(self):
+        """Per-endpoint stats, endpoints that grew RSS the most first."""
+        with self._lock:
+            stats = [{'endpoint': name, **stats.as_dict()} for name, stats in self._endpoints.items()]
+        return sorted(stats, key=lambda item: item['rss_growth'], reverse=True)
+
+    def timeline(self):
+        with self._lock:
+            return list(self._timeline)
+
+    # -- sampled requests --
+
+    def _before(self):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return
+        traced = None
+        if tracemalloc.is_tracing() and self._peak_lock.acquire(blocking=False):
+            tracemalloc.reset_peak()
+            traced = tracemalloc.get_traced_memory()[0]
+        g.memory_sample = (current_rss(), traced)
+
+    def _after(self, exc=None):
+        sample = g.pop('memory_sample', None)
+        if sample is None:
+            return
+        rss_before, traced = sample
+        peak = None
+        if traced is not None:
+            peak = max(tracemalloc.get_traced_memory()[1] - traced, 0)
+            self._peak_lock.release()
+        rss = current_rss()
+        if rss is None or rss_before is None:
+            return
+        growth = rss - rss_before
+        endpoint = request.endpoint or 'unmatched'
+
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, EndpointMemory())
+            stats.requests += 1
+            stats.rss_growth += growth
+            stats.max_rss_growth = max(stats.max_rss_growth, growth)
+            stats.last_rss = rss
+            if peak is not None:
+                stats.peak_samples += 1
+                stats.peak_total += peak
+                stats.max_peak = max(stats.max_peak, peak)
+            self._growth_since_point[endpoint] = self._growth_since_point.get(endpoint, 0) + growth
+
+            now = time.monotonic()
+            if now - self._last_point >= self.rss_interval:
+                top = max(self._growth_since_point.items(), key=lambda item: item[1])
+                self._timeline.append({
+                    'at': datetime.utcnow().isoformat(),
+                    'rss': rss,
+                    'top_endpoint': top[0] if top[1] > 0 else None,
+                    'top_growth': top[1],
+                })
+                self._growth_since_point.clear()
+                self._last_point = now
+
+
+memory_diagnostics = MemoryDiagnostics()
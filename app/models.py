@@ -1,8 +1,10 @@
+import json
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from app.compression import CompressedText
 
 class User(UserMixin, db.Model):
     """User model for authentication."""
@@ -12,11 +14,21 @@ class User(UserMixin, db.Model):
     lastName = db.Column(db.String(80), nullable=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=True)  # Nullable for OAuth users
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Indexed for the daily stats recount (app/daily_stats.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     is_active = db.Column(db.Boolean, default=True)
     # Email verification
     email_verified = db.Column(db.Boolean, default=False)
-    email_verified_at = db.Column(db.DateTime, nullable=True)
+    email_verified_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Follow graph counters; authors past the fan-out limit are switched to
+    # fan-out-on-read for good (see app/timeline.py)
+    follower_count = db.Column(db.Integer, default=0, nullable=False)
+    fanout_on_read = db.Column(db.Boolean, default=False, nullable=False)
+    # Stored file name (<sha256>.<ext>) of the uploaded avatar
+    avatar = db.Column(db.String(80), nullable=True)
+    # Shard holding this author's posts (app/sharding.py); set on the first
+    # post written while several shards are configured
+    post_shard = db.Column(db.Integer, nullable=True)
     
     # OAuth fields
     github_id = db.Column(db.String(100), unique=True, nullable=True)
@@ -29,6 +41,27 @@ class User(UserMixin, db.Model):
         """Hash and set password."""
         self.password_hash = generate_password_hash(password)
     
+    @property
+    def avatar_url(self):
+        if not self.avatar:
+            return None
+        from app.media import media_url
+        return media_url(self.avatar, size=128)
+    
+    @classmethod
+    def get_many(cls, user_ids):
+        """``{id: user}`` for the given ids, in one query.
+
+        While the returned users are referenced they are in the session's
+        identity map, so the ``author`` of posts loaded alongside resolves
+        without a query of its own.
+        """
+        from app.statements import users_by_ids
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        return {user.id: user for user in db.session.scalars(users_by_ids, {'ids': user_ids})}
+    
     def check_password(self, password):
         """Check if provided password matches hash."""
         if not self.password_hash:
@@ -42,25 +75,402 @@ class Post(db.Model):
     """Blog post model."""
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=False)
+    content = db.Column(CompressedText, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     published = db.Column(db.Boolean, default=False)
+    # Bumped by every edit (app/revisions.py). ORM updates carry
+    # ``WHERE version = <loaded>``, so of two concurrent edits of the same
+    # version the second fails with StaleDataError instead of overwriting
+    version = db.Column(db.Integer, default=1, nullable=False)
+    
+    # Author feeds and fan-out-on-read timelines range-scan the first index,
+    # the archive-aware history feed the second
+    __table_args__ = (
+        db.Index('ix_post_user_created', 'user_id', 'created_at'),
+        db.Index('ix_post_published_created', 'published', 'created_at', 'id'),
+    )
+    __mapper_args__ = {'version_id_col': version, 'version_id_generator': False}
     
     # Foreign key to User
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
+    # Counters kept out of the post row; loaded with the post in the same query
+    stats = db.relationship('PostStats', uselist=False, lazy='joined',
+                            cascade='all, delete-orphan')
+    # The signature and tag rows stay in the main database, without foreign
+    # keys to a post that may live on another shard (app/sharding.py)
+    signature = db.relationship('PostSignature', uselist=False,
+                                primaryjoin='Post.id == foreign(PostSignature.post_id)',
+                                cascade='all, delete-orphan')
+    # Read-only: tag assignments go through app/tags.py, which keeps the
+    # per-tag published counts in step
+    tags = db.relationship('Tag', secondary='post_tag', viewonly=True,
+                           primaryjoin='Post.id == foreign(post_tag.c.post_id)',
+                           secondaryjoin='Tag.id == foreign(post_tag.c.tag_id)',
+                           lazy='selectin', order_by='Tag.name')
+    
+    @property
+    def tag_names(self):
+        return [tag.name for tag in self.tags]
+    
+    @property
+    def view_count(self):
+        """Flushed views plus those still buffered in this process."""
+        from app.view_counter import view_counter
+        flushed = self.stats.views if self.stats else 0
+        return flushed + view_counter.pending(self.id)
+    
     def __repr__(self):
         return f'<Post {self.title}>'
 
+class PostStats(db.Model):
+    """Per-post counters written in batches by the view counter.
+
+    ``trending_score`` is maintained by the trending scorer (NULL for
+    unpublished posts) and indexed so the trending feed is a range scan.
+    """
+    __tablename__ = 'post_stats'
+
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    views = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    trending_score = db.Column(db.Float, nullable=True, index=True)
+    
+    def __repr__(self):
+        return f'<PostStats {self.post_id} views={self.views}>'
+
+class PostLocator(db.Model):
+    """Allocates post ids and records each post's author.
+
+    Always in the main database: with posts sharded by author, this is how
+    the shard holding a post is found from its id (app/sharding.py). Rows
+    are only written while several shards are configured.
+    """
+    __tablename__ = 'post_locator'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<PostLocator {self.id} user={self.user_id}>'
+
 class OAuth(db.Model):
-    """OAuth model for storing OAuth tokens."""
+    """OAuth model for storing OAuth tokens.
+
+    Each row links one provider account to a user. ``(provider,
+    provider_user_id)`` is uniquely indexed so resolving a login is a single
+    index lookup, and ``(provider, user_id)`` serves the per-user token lookup.
+    """
+    __table_args__ = (
+        db.Index('uq_oauth_provider_account', 'provider', 'provider_user_id', unique=True),
+        db.Index('ix_oauth_provider_user', 'provider', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     provider = db.Column(db.String(50), nullable=False)
     provider_user_id = db.Column(db.String(100), nullable=False)
     token = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     user = db.relationship('User')
+
+    @classmethod
+    def find_user(cls, provider, provider_user_id):
+        """Return the user linked to a provider account, in one query."""
+        from app.statements import user_by_oauth
+        return db.session.scalars(user_by_oauth, {
+            'provider': provider, 'provider_user_id': str(provider_user_id)
+        }).first()
+
+    @classmethod
+    def link(cls, user, provider, provider_user_id, token=None):
+        """Link (or re-link) a provider account to ``user`` and store its token.
+
+        Called on every provider login, which it counts in today's site
+        stats. The legacy ``User.<provider>_id`` column is kept in sync so
+        older code paths reading it keep working. The caller commits.
+        """
+        from app.daily_stats import record_oauth_login
+        from app.statements import oauth_by_account
+        provider_user_id = str(provider_user_id)
+        oauth = db.session.scalars(oauth_by_account, {
+            'provider': provider, 'provider_user_id': provider_user_id
+        }).first()
+        if oauth is None:
+            oauth = cls(provider=provider, provider_user_id=provider_user_id, token='{}')
+            db.session.add(oauth)
+        oauth.user = user
+        if token is not None:
+            oauth.token = json.dumps(token)
+        legacy_field = f'{provider}_id'
+        if hasattr(User, legacy_field):
+            setattr(user, legacy_field, provider_user_id)
+        record_oauth_login()
+        return oauth
     
     def __repr__(self):
         return f'<OAuth {self.provider}:{self.provider_user_id}>'
+
+class RevokedToken(db.Model):
+    """Revoked JWT access tokens.
+
+    A row with a ``jti`` revokes that single token; a row without one revokes
+    every token issued to ``user_id`` up to ``revoked_at``. Rows are only ever
+    appended (ids never reused), so workers mirror the table incrementally by
+    reading ids above the last one they have seen.
+    """
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    
+    def __repr__(self):
+        return f'<RevokedToken {self.jti or "all"} user={self.user_id}>'
+
+class RelatedPost(db.Model):
+    """Precomputed nearest neighbours of a post by TF-IDF cosine similarity.
+
+    Rows are written by the related-posts indexer; ``(post_id, rank)`` is the
+    primary key, so reading a post's neighbours is one index range lookup.
+    Neither id has a foreign key, since posts may live on other shards;
+    rows naming a deleted post are dropped with it (app/sharding.py).
+    """
+    __tablename__ = 'related_post'
+
+    post_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    related_id = db.Column(db.Integer, nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<RelatedPost {self.post_id} #{self.rank} -> {self.related_id}>'
+
+class PostSignature(db.Model):
+    """MinHash signature of a post's text, used for near-duplicate detection.
+
+    ``duplicate_of`` is set when the post was flagged as a near-duplicate at
+    write time. Flagged posts are not added to the LSH buckets (they would
+    match the original anyway), which keeps bucket sizes bounded under floods.
+    """
+    __tablename__ = 'post_signature'
+
+    post_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    signature = db.Column(db.LargeBinary, nullable=False)
+    duplicate_of = db.Column(db.Integer, nullable=True, index=True)
+    similarity = db.Column(db.Float, nullable=True)
+    buckets = db.relationship('PostLshBucket', cascade='all, delete-orphan')
+    
+    def __repr__(self):
+        return f'<PostSignature {self.post_id}>'
+
+class PostLshBucket(db.Model):
+    """LSH band bucket membership; posts sharing a bucket are duplicate candidates."""
+    __tablename__ = 'post_lsh_bucket'
+
+    bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post_signature.post_id', ondelete='CASCADE'),
+                        primary_key=True, index=True)
+    
+    def __repr__(self):
+        return f'<PostLshBucket {self.bucket} -> {self.post_id}>'
+
+class PostChange(db.Model):
+    """Append-only log of post writes, read by the delta sync endpoint.
+
+    ``seq`` is the monotonic sync cursor. ``post_id`` deliberately has no
+    foreign key so deletions outlive the post they describe (tombstones).
+    """
+    __tablename__ = 'post_change'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, nullable=False, index=True)
+    op = db.Column(db.String(10), nullable=False)  # 'create', 'update', 'unpublish' or 'delete'
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<PostChange #{self.seq} {self.op} {self.post_id}>'
+
+
+class JobState(db.Model):
+    """Progress and leadership of a background job shared by every worker.
+
+    ``watermark`` is where the job's next incremental run starts. The worker
+    holding the lease (``owner`` until ``lease_expires_at``) is the only one
+    that runs the job; see ``app.background.hold_lease``.
+    """
+    __tablename__ = 'job_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    watermark = db.Column(db.DateTime, nullable=True)
+    owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f'<JobState {self.name}>'
+
+
+class PostRevision(db.Model):
+    """One version of a post's title and body, for its edit history.
+
+    ``data`` is zlib-compressed JSON: the whole title and body when
+    ``base_version == version`` (a snapshot), otherwise the edit from the
+    previous version. ``base_version`` is the snapshot a row's chain starts
+    from, so rebuilding any version reads one short range of the primary key
+    (app/revisions.py). Like ``PostChange`` it stays in the main database
+    with no foreign key, whichever shard or archive holds the post.
+    """
+    __tablename__ = 'post_revision'
+
+    post_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    base_version = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    @property
+    def is_snapshot(self):
+        return self.base_version == self.version
+    
+    def __repr__(self):
+        return f'<PostRevision {self.post_id} v{self.version}>'
+
+
+class DailyStats(db.Model):
+    """Site activity per UTC day, behind ``GET /api/admin/stats``.
+
+    Writes add to today's row as they happen and the catch-up job recounts
+    recent days from the source tables (app/daily_stats.py), so the stats
+    endpoint never aggregates ``post`` or ``user`` itself. ``oauth_logins``
+    is only ever counted as logins happen: ``oauth`` keeps no timestamps
+    to recount it from.
+    """
+    __tablename__ = 'daily_stats'
+
+    day = db.Column(db.Date, primary_key=True)
+    posts = db.Column(db.Integer, default=0, nullable=False)
+    signups = db.Column(db.Integer, default=0, nullable=False)
+    verified_emails = db.Column(db.Integer, default=0, nullable=False)
+    oauth_logins = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<DailyStats {self.day}>'
+
+
+class Follow(db.Model):
+    """``follower_id`` follows ``followee_id``."""
+    __tablename__ = 'follow'
+    __table_args__ = (db.Index('ix_follow_followee', 'followee_id', 'follower_id'),)
+
+    follower_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    followee_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Follow {self.follower_id} -> {self.followee_id}>'
+
+
+class TimelineEntry(db.Model):
+    """A post materialised into a follower's home timeline (fan-out-on-write).
+
+    The primary key is also the read order, and on SQLite the table is
+    stored as that one clustered index: each fanned-out row costs a single
+    B-tree insert.
+    """
+    __tablename__ = 'timeline_entry'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    user_id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, primary_key=True)
+    post_id = db.Column(db.Integer, primary_key=True)
+    author_id = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<TimelineEntry {self.user_id}: {self.post_id}>'
+
+
+# post -> tags through the primary key, tag -> posts in feed order through
+# ix_post_tag_tag_created; created_at is copied from the post for keyset paging.
+# No foreign key to ``post``, which may be on another shard
+post_tag = db.Table(
+    'post_tag',
+    db.Column('post_id', db.Integer, primary_key=True, autoincrement=False),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Column('created_at', db.DateTime, nullable=False),
+    db.Index('ix_post_tag_tag_created', 'tag_id', 'created_at', 'post_id'),
+)
+
+
+class Tag(db.Model):
+    """Post tag with a maintained count of the published posts carrying it."""
+    __tablename__ = 'tag'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    published_count = db.Column(db.Integer, default=0, nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Tag {self.name}>'
+
+
+class MediaFile(db.Model):
+    """An uploaded image, stored once per distinct content."""
+    __tablename__ = 'media_file'
+
+    name = db.Column(db.String(80), primary_key=True)  # <sha256>.<ext>
+    size = db.Column(db.Integer, nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaFile {self.name}>'
+
+
+class ArchivedPost(db.Model):
+    """A post moved out of the hot ``post`` table by ``flask archive-posts``.
+
+    Keeps the post's id and columns plus the view count and tag names it had
+    when archived, so it serialises like a ``Post``. Lives on the ``archive``
+    bind, which may be a separate database.
+    """
+    __tablename__ = 'archived_post'
+    __bind_key__ = 'archive'
+    __table_args__ = (
+        db.Index('ix_archived_post_published_created', 'published', 'created_at', 'id'),
+        db.Index('ix_archived_post_user_created', 'user_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    content = db.Column(CompressedText, nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    published = db.Column(db.Boolean, default=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    views = db.Column(db.Integer, default=0, nullable=False)
+    tags = db.Column(db.Text, nullable=False, default='[]')  # JSON list of names
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # No foreign key: the user table may live in another database
+    author = db.relationship('User', primaryjoin='foreign(ArchivedPost.user_id) == User.id',
+                             viewonly=True)
+    
+    @property
+    def tag_names(self):
+        return json.loads(self.tags)
+    
+    @property
+    def view_count(self):
+        return self.views
+    
+    def __repr__(self):
+        return f'<ArchivedPost {self.title}>'
@@ -2,28 +2,59 @@
 
 import json
 import base64
-from flask import current_app, redirect
+import logging
+import secrets
+from flask import redirect
 from flask_dance.contrib.github import github
 from flask_dance.contrib.google import google
 from flask_jwt_extended import create_access_token
-import pdb
+
+logger = logging.getLogger(__name__)
 
 
 class OAuthHandler:
     """Helper class for OAuth operations."""
     
+    # Candidates probed per query when allocating a username: numbered ones
+    # first, then batches of random suffixes, at most USERNAME_RANDOM_BATCHES
+    # of them, so allocation takes a bounded number of queries however many
+    # names are taken
+    USERNAME_CANDIDATES = 10
+    USERNAME_RANDOM_BATCHES = 3
+
     @staticmethod
-    def create_unique_username(base_username, provider_id):
-        """Create a unique username by appending numbers if necessary."""
+    def _first_free_username(candidates):
+        """The first of ``candidates`` no user has, checked with one ``IN`` query, or None."""
         from app.models import User
         
-        username = base_username
-        counter = 1
-        
-        while User.query.filter_by(username=username).first():
-            username = f"{base_username}_{counter}"
-            counter += 1
-        
+        taken = {
+            row[0] for row in User.query.with_entities(User.username)
+            .filter(User.username.in_(candidates)).all()
+        }
+        return next((username for username in candidates if username not in taken), None)
+
+    @staticmethod
+    def create_unique_username(base_username, provider_id):
+        """Create a unique username by appending numbers if necessary.
+
+        Numbered candidates and a provider-id based one are checked with one
+        ``IN`` query; if all are taken, batches of random suffixes are, one
+        query per batch. Raises ValueError if every batch is taken too.
+        """
+        candidates = [base_username] + [
+            f"{base_username}_{n}" for n in range(1, OAuthHandler.USERNAME_CANDIDATES)
+        ]
+        candidates.append(f"{base_username}_{provider_id}")
+        username = OAuthHandler._first_free_username(candidates)
+        for _ in range(OAuthHandler.USERNAME_RANDOM_BATCHES):
+            if username is not None:
+                break
+            username = OAuthHandler._first_free_username([
+                f"{base_username}_{provider_id}_{secrets.token_hex(3)}"
+                for _ in range(OAuthHandler.USERNAME_CANDIDATES)
+            ])
+        if username is None:
+            raise ValueError(f'No free username for {base_username}')
         return username
     
     @staticmethod
@@ -107,38 +138,39 @@ class OAuthHandler:
         """Find existing user or create new one for OAuth login."""
         from app import db
         from app.models import User, OAuth
+        from app.statements import user_by_email
         
         provider_id = user_data['id']
         email = user_data['email']
         
-        print(f"🔥 Looking for existing user with {provider}_id: {provider_id}")
+        logger.debug('Looking up %s account %s', provider, provider_id)
         
-        # Check if user exists with this OAuth provider ID
-        provider_field = f'{provider}_id'
-        user = User.query.filter(getattr(User, provider_field) == provider_id).first()
+        # Check if user exists with this OAuth provider account
+        user = OAuth.find_user(provider, provider_id)
         
         if user:
-            print(f"🔥 Found existing user with {provider} ID: {user.email}")
+            logger.debug('Found user %s by %s account', user.id, provider)
+            OAuth.link(user, provider, provider_id, user_data.get('token'))
+            db.session.commit()
             return user, None
         
-        print(f"🔥 No existing {provider} user found, checking email: {email}")
+        logger.debug('No user with this %s account, checking email', provider)
         
         # Check if user exists with same email
-        existing_user = User.query.filter_by(email=email).first()
+        existing_user = db.session.scalars(user_by_email, {'email': email}).first()
         if existing_user:
-            print(f"🔥 Found existing user by email, linking {provider} account")
+            logger.debug('Linking %s account to user %s found by email', provider, existing_user.id)
             # Link OAuth account to existing user
-            setattr(existing_user, provider_field, provider_id)
+            OAuth.link(existing_user, provider, provider_id, user_data.get('token'))
             try:
                 db.session.commit()
-                print(f"🔥 Successfully linked {provider} account to existing user")
                 return existing_user, None
             except Exception as e:
-                print(f"🔥 Error linking {provider} account: {str(e)}")
+                logger.exception('Linking %s account to user %s failed', provider, existing_user.id)
                 db.session.rollback()
                 return None, f"Database error: {str(e)}"
         
-        print(f"🔥 Creating new user for {provider}")
+        logger.debug('Creating a new user for %s account %s', provider, provider_id)
         
         # Create new user
         if provider == 'github':
@@ -157,7 +189,7 @@ class OAuthHandler:
                 provider_id
             )
         
-        print(f"🔥 Creating user: username={username}, email={email}, first_name={first_name}, last_name={last_name}")
+        logger.debug('Allocated username %s', username)
         
         user = User(
             username=username,
@@ -166,28 +198,15 @@ class OAuthHandler:
             email=email
         )
         
-        # Set provider ID
-        setattr(user, provider_field, provider_id)
-        print(f"🔥 Set {provider_field} = {provider_id}")
-        
         try:
             db.session.add(user)
-            print(f"🔥 Added user to session")
+            # Link the provider account
+            OAuth.link(user, provider, provider_id, user_data.get('token'))
             db.session.commit()
-            print(f"🔥 Successfully committed user to database, ID: {user.id}")
-            
-            # Verify user was actually saved
-            verification_user = User.query.filter_by(email=email).first()
-            if verification_user:
-                print(f"🔥 Verification: User exists in database with ID: {verification_user.id}")
-            else:
-                print(f"🔥 WARNING: User not found in database after commit!")
-                
+            logger.info('Created user %s from %s account %s', user.id, provider, provider_id)
             return user, None
         except Exception as e:
-            print(f"🔥 Error saving user to database: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception('Saving new %s user failed', provider)
             db.session.rollback()
             return None, f"Database error: {str(e)}"
 
@@ -196,46 +215,34 @@ class OAuthHandler:
         """Handle OAuth callback for the given provider."""
         from app import db
         
-        print(f"🔥 OAuth callback started for provider: {provider}")
+        logger.debug('OAuth callback for %s', provider)
         
         try:
             # Get user data from provider
             if provider == 'github':
-                print("🔥 Getting GitHub user data...")
                 user_data, error = OAuthHandler.get_github_user_data()
             elif provider == 'google':
-                print("🔥 Getting Google user data...")
                 user_data, error = OAuthHandler.get_google_user_data()
             else:
-                print(f"🔥 Unknown provider: {provider}")
+                logger.warning('OAuth callback for unknown provider %s', provider)
                 return redirect('http://localhost:3000/auth/error?message=Unknown provider')
             
-            print(f"🔥 User data result: {user_data is not None}, Error: {error}")
-            
             if error:
-                print(f"🔥 Error getting user data: {error}")
-                current_app.logger.error(f"OAuth error for {provider}: {error}")
+                logger.error('OAuth error for %s: %s', provider, error)
                 return redirect(f'http://localhost:3000/auth/error?message={error}')
             
             if not user_data:
-                print("🔥 No user data received")
+                logger.error('OAuth callback for %s returned no user data', provider)
                 return redirect('http://localhost:3000/auth/error?message=No user data received')
             
-            print(f"🔥 User data received: email={user_data.get('email')}, id={user_data.get('id')}")
-            
             # Find or create user
-            print("🔥 Finding or creating user...")
             user, user_error = OAuthHandler.find_or_create_user(provider, user_data)
             
             if user_error:
-                print(f"🔥 User creation error: {user_error}")
-                current_app.logger.error(f"User creation error: {user_error}")
+                logger.error('User creation error: %s', user_error)
                 return redirect(f'http://localhost:3000/auth/error?message={user_error}')
             
-            print(f"🔥 User found/created: {user.email} (ID: {user.id})")
-            
             # Create JWT token
-            print("🔥 Creating JWT token...")
             access_token = create_access_token(identity=user.id)
             
             # Prepare user data for frontend
@@ -250,17 +257,13 @@ class OAuthHandler:
             # Encode user data as base64 to pass in URL
             user_data_b64 = base64.b64encode(json.dumps(user_response).encode()).decode()
             
-            print(f"🔥 OAuth success for {provider}: user {user.email} logged in with token")
-            current_app.logger.info(f"OAuth success for {provider}: user {user.email} logged in")
+            logger.info('OAuth login for %s: user %s', provider, user.id,
+                        extra={'provider': provider, 'user_id': user.id})
             
             # Redirect to frontend with token and user data
             redirect_url = f'http://localhost:3000/auth/callback?token={access_token}&user={user_data_b64}&provider={provider}'
-            print(f"🔥 Redirecting to: {redirect_url[:100]}...")
             return redirect(redirect_url)
             
         except Exception as e:
-            print(f"🔥 Exception in OAuth callback: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            current_app.logger.error(f"{provider.title()} OAuth error: {str(e)}")
+            logger.exception('%s OAuth callback failed', provider.title())
             return redirect(f'http://localhost:3000/auth/error?message={provider.title()} login failed: {str(e)}')
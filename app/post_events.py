@@ -0,0 +1,296 @@
+"""Live post updates for Server-Sent Events clients.
+
+Post write paths call :meth:`PostEventHub.notify` after committing. That only
+wakes the hub's pump thread, which reads the new ``post_change`` rows once,
+renders each as an SSE frame and appends the same string to every
+subscriber's buffer, so a write costs one query per worker however many
+clients are connected. Other workers are woken through the notifier, and the
+pump also runs every ``SSE_POLL_SECONDS`` so a lost wake-up only delays
+delivery.
+
+Event ids are change-log sequence numbers: a reconnecting client's
+``Last-Event-ID`` is a delta-sync cursor and the events it missed are
+replayed from the log. Buffers are bounded; a client that falls behind is
+disconnected and catches up the same way when it reconnects.
+
+Every open stream holds a server thread for as long as it stays connected,
+so each worker accepts at most ``SSE_MAX_CLIENTS`` of them and turns away
+the rest with a 503, leaving its other threads to ordinary requests.
+"""
+import glob
+import json
+import os
+import socket
+import threading
+from collections import deque
+
+from app import db
+from app.background import PeriodicTask
+from app.change_log import CursorExpired
+
+# Changes read per query by the pump and when replaying
+PUMP_BATCH = 500
+
+# Clients further behind than this are told to resync instead of replaying
+REPLAY_LIMIT = 1000
+
+# Reconnect delay suggested to EventSource clients
+RETRY_MS = 3000
+
+
+def _frame(seq, event, data):
+    return f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def render_changes(after_seq, limit):
+    """SSE frames for up to ``limit`` changes after ``after_seq``.
+
+    Returns ``(frames, last_seq)`` where ``frames`` is a list of
+    ``(seq, frame)`` and ``last_seq`` the last change read. Deleted posts
+    and published posts that were unpublished are sent as ``deleted``;
+    writes to drafts are skipped, so clients never see their ids.
+    """
+    from app.models import PostChange
+    from app.schemas import PostSchema
+    from app.sharding import posts_by_ids
+
+    changes = db.session.execute(
+        db.select(PostChange.seq, PostChange.post_id, PostChange.op)
+        .where(PostChange.seq > after_seq).order_by(PostChange.seq).limit(limit)
+    ).all()
+    if not changes:
+        return [], after_seq
+
+    posts = {post.id: post for post in posts_by_ids(
+        {change.post_id for change in changes}, published_only=True
+    )}
+    schema = PostSchema()
+    payloads = {}
+    frames = []
+    for change in changes:
+        post = posts.get(change.post_id)
+        if change.op == 'delete' or (post is None and change.op == 'unpublish'):
+            frames.append((change.seq, _frame(change.seq, 'deleted', {'id': change.post_id})))
+            continue
+        if post is None:
+            continue
+        if post.id not in payloads:
+            payloads[post.id] = schema.dump(post)
+        event = 'created' if change.op == 'create' else 'updated'
+        frames.append((change.seq, _frame(change.seq, event, payloads[post.id])))
+    return frames, changes[-1].seq
+
+
+class Subscription:
+    """A client's bounded buffer of pending ``(seq, frame)`` pairs."""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self.overflowed = False
+        self._frames = deque()
+        self._ready = threading.Condition()
+
+    def push(self, frames):
+        with self._ready:
+            if self.overflowed:
+                return
+            if len(self._frames) + len(frames) > self.maxlen:
+                # Too slow to keep up: drop everything and disconnect it
+                self.overflowed = True
+                self._frames.clear()
+            else:
+                self._frames.extend(frames)
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Pending frames, ``[]`` after ``timeout`` seconds, ``None`` once overflowed."""
+        with self._ready:
+            if not self._frames and not self.overflowed:
+                self._ready.wait(timeout)
+            if self.overflowed:
+                return None
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+
+class SocketNotifier:
+    """Wakes the hubs of every worker on this host.
+
+    Local stand-in for a broker's pub/sub channel: each process binds a Unix
+    datagram socket ``<directory>/<pid>.sock`` and publishing sends one byte
+    to every other socket there. Sockets left behind by dead workers are
+    removed when a send to them is refused.
+    """
+
+    def __init__(self, directory, on_message):
+        self.directory = directory
+        self.on_message = on_message
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.sock')
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(os.getpid())
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, args=(sock,),
+                             name='post-events-notifier', daemon=True).start()
+
+    def publish(self):
+        own = self._path(os.getpid())
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sender.setblocking(False)
+        try:
+            for path in glob.glob(os.path.join(self.directory, '*.sock')):
+                if path == own:
+                    continue
+                try:
+                    sender.sendto(b'1', path)
+                except BlockingIOError:
+                    pass  # receiver already has wake-ups queued
+                except (ConnectionRefusedError, FileNotFoundError):
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+        finally:
+            sender.close()
+
+    def _listen(self, sock):
+        while True:
+            sock.recv(64)
+            self.on_message()
+
+
+class PostEventHub:
+    """Fans post changes out to this worker's SSE subscribers."""
+
+    def __init__(self):
+        self.app = None
+        self.buffer_size = 100
+        self.max_clients = 2
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._last_seq = None
+        self._notifier = None
+        self._task = PeriodicTask('post-events', self._pump, 5.0)
+
+    def init_app(self, app):
+        self.app = app
+        self.buffer_size = app.config.get('SSE_CLIENT_BUFFER', 100)
+        self.max_clients = app.config.get('SSE_MAX_CLIENTS', 2)
+        self._task.interval = app.config.get('SSE_POLL_SECONDS', 5.0)
+        directory = app.config.get('SSE_NOTIFY_DIR')
+        if directory and hasattr(socket, 'AF_UNIX'):
+            self._notifier = SocketNotifier(directory, self._task.wake)
+        app.extensions['post_events'] = self
+
+    def notify(self):
+        """Tell the hubs of all workers that posts changed; call after committing."""
+        self._task.wake()
+        if self._notifier is not None:
+            try:
+                self._notifier.publish()
+            except OSError as e:
+                self.app.logger.warning(f"Post event notification failed: {e}")
+
+    def subscribe(self):
+        """Register a new client, or return None if this worker is full.
+
+        Must be called inside an app context.
+        """
+        from app.change_log import current_cursor
+
+        with self._lock:
+            if self.max_clients and len(self._subscribers) >= self.max_clients:
+                return None
+            if self._last_seq is None:
+                self._last_seq = current_cursor()
+            subscription = Subscription(self.buffer_size)
+            self._subscribers.add(subscription)
+        if self._notifier is not None:
+            self._notifier.ensure_started()
+        self._task.ensure_started()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def replay(self, last_event_id):
+        """Frames a client missed since ``last_event_id`` and the last seq read.
+
+        Raises :class:`CursorExpired` if the log no longer reaches back that
+        far or the client is too far behind to catch up by replaying.
+        """
+        from app.models import PostChange
+
+        oldest = db.session.scalar(db.select(db.func.min(PostChange.seq)))
+        if oldest is not None and last_event_id + 1 < oldest:
+            raise CursorExpired()
+        frames, seq = [], last_event_id
+        while True:
+            batch, last = render_changes(seq, PUMP_BATCH)
+            if last == seq:
+                return frames, seq
+            frames += batch
+            seq = last
+            if len(frames) > REPLAY_LIMIT:
+                raise CursorExpired()
+
+    def stream(self, subscription, replay=(), after_seq=None, heartbeat=15):
+        """SSE body for one client; needs no app context.
+
+        Live frames already covered by ``replay`` (up to ``after_seq``) are
+        skipped. The client is unsubscribed when the stream is closed.
+        """
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            for _, frame in replay:
+                yield frame
+            while True:
+                frames = subscription.get(heartbeat)
+                if frames is None:
+                    return
+                if not frames:
+                    yield ": keepalive\n\n"
+                    continue
+                for seq, frame in frames:
+                    if after_seq is None or seq > after_seq:
+                        yield frame
+        finally:
+            self.unsubscribe(subscription)
+
+    def _pump(self):
+        if self.app is None or self._last_seq is None:
+            return
+        with self.app.app_context():
+            try:
+                while True:
+                    frames, last = render_changes(self._last_seq, PUMP_BATCH)
+                    if last == self._last_seq:
+                        break
+                    self._last_seq = last
+                    with self._lock:
+                        subscribers = list(self._subscribers)
+                    if frames:
+                        for subscription in subscribers:
+                            subscription.push(frames)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"Post event pump failed: {e}")
+
+
+post_events = PostEventHub()
@@ -0,0 +1,195 @@
+"""On-demand per-request profiling.
+
+A request is profiled when it carries ``X-Profile: <DIAGNOSTICS_TOKEN>`` or
+falls in the ``PROFILE_SAMPLE_RATE`` fraction of traffic. Two modes:
+
+* ``cprofile`` - the deterministic profiler, saved as a ``.prof`` pstats
+  file (``python -m pstats``, snakeviz);
+* ``sample`` - the request thread's stack is sampled every
+  ``PROFILE_SAMPLE_INTERVAL`` seconds by a helper thread and saved as a
+  ``.collapsed`` file (one ``frame;frame;frame count`` line per stack, the
+  input of flamegraph.pl and speedscope). Much cheaper, so better suited
+  to sampled traffic.
+
+``X-Profile-Mode`` picks the mode for a header-triggered request, otherwise
+``PROFILE_MODE`` applies. Profiled responses name their file in
+``X-Profile-Id``; files are listed and downloaded under
+``/api/diagnostics/profiles``.
+
+With no token and a zero sample rate no hooks are installed at all, so
+profiling costs nothing when off. Only requests served by Flask are seen;
+the ASGI fast paths bypass it.
+"""
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import current_app, g, request
+
+MODES = ('cprofile', 'sample')
+
+SUFFIXES = {'cprofile': '.prof', 'sample': '.collapsed'}
+
+
+def token_matches(value):
+    """True if ``value`` is the configured diagnostics token."""
+    token = current_app.config.get('DIAGNOSTICS_TOKEN')
+    return bool(token and value) and hmac.compare_digest(value.encode(), token.encode())
+
+
+def profile_dir():
+    return current_app.config.get('PROFILE_DIR') or os.path.join(current_app.instance_path, 'profiles')
+
+
+def _frame_name(code):
+    # ';' separates frames in the collapsed format
+    filename = code.co_filename
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+
+
+class StackSampler:
+    """Samples the stacks of registered threads from one helper thread."""
+
+    def __init__(self):
+        self.interval = 0.005
+        self._stacks = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        stacks = Counter()
+        with self._lock:
+            self._stacks[threading.get_ident()] = stacks
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return stacks
+
+    def stop(self):
+        with self._lock:
+            return self._stacks.pop(threading.get_ident(), Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stacks:
+                    self._wake.clear()
+            # Idle until a request registers
+            self._wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._stacks.items():
+                    frame = frames.get(ident)
+                    names = []
+                    while frame is not None:
+                        names.append(_frame_name(frame.f_code))
+                        frame = frame.f_back
+                    if names:
+                        stacks[';'.join(reversed(names))] += 1
+
+
+class RequestProfiler:
+    """Profiles selected requests and keeps the newest ``PROFILE_KEEP`` results."""
+
+    def __init__(self):
+        self.sampler = StackSampler()
+        # Python 3.12+ allows one cProfile profiler per process at a time
+        self._cprofile_lock = threading.Lock()
+
+    def init_app(self, app):
+        if not app.config.get('DIAGNOSTICS_TOKEN') and not app.config.get('PROFILE_SAMPLE_RATE'):
+            return
+        self.sampler.interval = app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005)
+        app.before_request(self._start)
+        app.after_request(self._tag_response)
+        app.teardown_request(self._finish)
+
+    def _mode(self):
+        if token_matches(request.headers.get('X-Profile')):
+            mode = request.headers.get('X-Profile-Mode')
+            return mode if mode in MODES else current_app.config.get('PROFILE_MODE', 'cprofile')
+        rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0)
+        if rate and random.random() < rate:
+            return current_app.config.get('PROFILE_MODE', 'cprofile')
+        return None
+
+    def _start(self):
+        mode = self._mode()
+        if mode == 'cprofile':
+            if not self._cprofile_lock.acquire(blocking=False):
+                return
+            profiler = cProfile.Profile()
+            g.profile = (mode, profiler, time.perf_counter())
+            profiler.enable()
+        elif mode == 'sample':
+            g.profile = (mode, self.sampler.start(), time.perf_counter())
+
+    def _tag_response(self, response):
+        profile = g.get('profile')
+        if profile is not None:
+            g.profile_name = self._name(profile)
+            response.headers['X-Profile-Id'] = g.profile_name
+        return response
+
+    def _name(self, profile):
+        mode, _, started = profile
+        endpoint = (request.endpoint or 'unmatched').replace('.', '-')
+        elapsed = (time.perf_counter() - started) * 1000
+        return (f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}-{endpoint}-"
+                f"{elapsed:.0f}ms{SUFFIXES[mode]}")
+
+    def _finish(self, exc=None):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        mode, collector, _ = profile
+        if mode == 'cprofile':
+            collector.disable()
+            self._cprofile_lock.release()
+        else:
+            self.sampler.stop()
+        name = g.pop('profile_name', None) or self._name(profile)
+
+        directory = profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        if mode == 'cprofile':
+            collector.dump_stats(path)
+        else:
+            with open(path, 'w') as f:
+                f.writelines(f'{stack} {count}\n' for stack, count in collector.items())
+        self._prune(directory)
+
+    def _prune(self, directory):
+        keep = current_app.config.get('PROFILE_KEEP', 200)
+        entries = sorted(list_profiles(directory), reverse=True)
+        for name in entries[keep:]:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory=None):
+    """Names of the saved profiles (they sort by time)."""
+    try:
+        names = os.listdir(directory or profile_dir())
+    except FileNotFoundError:
+        return []
+    return [name for name in names if name.endswith(tuple(SUFFIXES.values()))]
+
+
+request_profiler = RequestProfiler()
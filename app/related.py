@@ -0,0 +1,206 @@
+"""Related posts.
+
+An offline indexer turns every published post into a sparse TF-IDF vector
+(sublinear term frequency, smoothed idf, L2-normalised rows) and finds each
+post's top-k cosine neighbours with batched sparse matrix products. The
+neighbours are stored in ``related_post``, so serving them is one indexed
+lookup.
+
+Incremental runs recompute only the lists that can have changed: posts
+edited or published since the previous run, the posts those now rank as
+neighbours, and posts whose stored list points at a changed, deleted or
+unpublished post.
+"""
+import heapq
+import re
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+
+from app import db
+from app.models import Post, RelatedPost
+from app.sharding import scatter
+
+TOKEN_RE = re.compile(r'[a-z][a-z0-9]{2,}')
+
+STOP_WORDS = frozenset('''
+    about above after again against all and any are because been before being
+    below between both but can did does doing down during each few for from
+    further had has have having her here hers herself him himself his how into
+    its itself just more most myself nor not now off once only other our ours
+    ourselves out over own same she should some such than that the their theirs
+    them themselves then there these they this those through too under until
+    very was were what when where which while who whom why will with would you
+    your yours yourself yourselves
+'''.split())
+
+# Rows per sparse similarity product; bounds the size of the intermediate result
+CHUNK_ROWS = 1000
+
+# Rows fetched per round-trip while streaming post bodies
+STREAM_BATCH = 2000
+
+
+def tokenize(text):
+    """Lower-cased word tokens without stop words or very short words."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def build_matrix(documents, min_df=2, max_df=0.1, max_terms=24):
+    """TF-IDF matrix for ``documents``, an iterable of ``(post_id, text)``.
+
+    Returns ``(post_ids, matrix)`` where row ``i`` of the CSR matrix is the
+    L2-normalised vector of ``post_ids[i]``. Terms in fewer than ``min_df``
+    documents or more than ``max_df`` of them carry no signal and are dropped,
+    and each document keeps only its ``max_terms`` heaviest terms. Both bound
+    the candidate set of the similarity products, which otherwise grows
+    towards all-pairs.
+    """
+    vocabulary = {}
+    post_ids, indptr, indices, counts = [], [0], [], []
+    for post_id, text in documents:
+        tf = Counter(tokenize(text))
+        post_ids.append(post_id)
+        indices.extend(vocabulary.setdefault(term, len(vocabulary)) for term in tf)
+        counts.extend(tf.values())
+        indptr.append(len(indices))
+
+    n = len(post_ids)
+    matrix = sparse.csr_matrix(
+        (np.asarray(counts, dtype=np.float32),
+         np.asarray(indices, dtype=np.int32),
+         np.asarray(indptr, dtype=np.int64)),
+        shape=(n, len(vocabulary))
+    )
+
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    keep = np.flatnonzero((df >= min_df) & (df <= max(max_df * n, min_df)))
+    matrix = matrix[:, keep].tocsr()
+    df = df[keep]
+
+    matrix.data = 1.0 + np.log(matrix.data)
+    idf = (np.log((1.0 + n) / (1.0 + df)) + 1.0).astype(np.float32)
+    matrix = (matrix @ sparse.diags(idf)).tocsr()
+    matrix.sort_indices()
+
+    # Rank each entry within its row by weight and drop all but the top terms
+    lengths = np.diff(matrix.indptr)
+    row_of_entry = np.repeat(np.arange(n), lengths)
+    order = np.lexsort((-matrix.data, row_of_entry))
+    rank = np.empty(matrix.nnz, dtype=np.int64)
+    rank[order] = np.arange(matrix.nnz) - np.repeat(matrix.indptr[:-1], lengths)
+    matrix.data[rank >= max_terms] = 0
+    matrix.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    matrix = sparse.diags((1.0 / norms).astype(np.float32)) @ matrix
+    return np.asarray(post_ids), matrix.tocsr()
+
+
+def top_neighbours(matrix, rows, k):
+    """Yield ``(row, cols, scores)``: the ``k`` most similar rows to each row."""
+    transposed = matrix.T.tocsr()
+    rows = list(rows)
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start:start + CHUNK_ROWS]
+        similarities = (matrix[chunk] @ transposed).tocsr()
+        for i, row in enumerate(chunk):
+            lo, hi = similarities.indptr[i], similarities.indptr[i + 1]
+            cols = similarities.indices[lo:hi]
+            scores = similarities.data[lo:hi]
+            others = cols != row
+            cols, scores = cols[others], scores[others]
+            if len(scores) > k:
+                best = np.argpartition(-scores, k)[:k]
+                cols, scores = cols[best], scores[best]
+            order = np.argsort(-scores, kind='stable')
+            yield row, cols[order], scores[order]
+
+
+def _published_documents():
+    # One stream per post shard, merged back into id order
+    statement = (db.select(Post.id, Post.title, Post.content)
+                 .where(Post.published.is_(True))
+                 .order_by(Post.id)
+                 .execution_options(yield_per=STREAM_BATCH))
+    results = scatter(lambda: db.session.execute(statement))
+    for post_id, title, content in heapq.merge(*results, key=lambda row: row[0]):
+        yield post_id, f'{title}\n{content}'
+
+
+def _in_chunks(values, size=500):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def index_related_posts(full=False):
+    """Recompute stored neighbour lists; incremental unless ``full``.
+
+    Returns the number of posts whose list was rewritten.
+    """
+    config = current_app.config
+    top_k = config.get('RELATED_POSTS_TOP_K', 5)
+    started = datetime.utcnow()
+    since = None if full else db.session.scalar(db.select(db.func.max(RelatedPost.computed_at)))
+
+    post_ids, matrix = build_matrix(
+        _published_documents(),
+        min_df=config.get('RELATED_POSTS_MIN_DF', 2),
+        max_df=config.get('RELATED_POSTS_MAX_DF', 0.1),
+        max_terms=config.get('RELATED_POSTS_MAX_TERMS', 24)
+    )
+    row_of = {post_id: row for row, post_id in enumerate(post_ids.tolist())}
+
+    if since is None:
+        db.session.execute(db.delete(RelatedPost))
+        results = top_neighbours(matrix, range(len(post_ids)), top_k)
+    else:
+        # Posts live on their shards and neighbour lists in the main
+        # database, so the sets are compared here rather than joined
+        changed_ids = set().union(*scatter(lambda: db.session.scalars(
+            db.select(Post.id).where(Post.updated_at >= since)
+        ).all()))
+        # Lists of deleted or unpublished posts go away entirely
+        gone = set(db.session.scalars(db.select(RelatedPost.post_id).distinct())) - row_of.keys()
+        for chunk in _in_chunks(gone):
+            db.session.execute(db.delete(RelatedPost).where(RelatedPost.post_id.in_(chunk)))
+        # Lists pointing at a changed, deleted or unpublished post are stale
+        stale = {post_id for post_id, related_id in db.session.execute(
+            db.select(RelatedPost.post_id, RelatedPost.related_id)
+        ) if related_id in changed_ids or related_id not in row_of}
+        changed_rows = [row_of[i] for i in changed_ids if i in row_of]
+
+        results = list(top_neighbours(matrix, changed_rows, top_k))
+        # Changed posts may now belong in their new neighbours' lists
+        targets = {row_of[i] for i in stale if i in row_of}
+        for _, cols, _ in results:
+            targets.update(cols.tolist())
+        targets.difference_update(changed_rows)
+        results += list(top_neighbours(matrix, sorted(targets), top_k))
+
+        for chunk in _in_chunks(post_ids[row].item() for row, _, _ in results):
+            db.session.execute(db.delete(RelatedPost).where(RelatedPost.post_id.in_(chunk)))
+
+    count = 0
+    rows = []
+    for row, cols, scores in results:
+        count += 1
+        rows.extend({
+            'post_id': post_ids[row].item(),
+            'rank': rank,
+            'related_id': post_ids[col].item(),
+            'score': float(score),
+            'computed_at': started,
+        } for rank, (col, score) in enumerate(zip(cols, scores)))
+        if len(rows) >= STREAM_BATCH:
+            db.session.execute(db.insert(RelatedPost), rows)
+            rows = []
+    if rows:
+        db.session.execute(db.insert(RelatedPost), rows)
+    db.session.commit()
+    return count
@@ -10,6 +10,7 @@ class UserSchema(Schema):
     created_at = fields.DateTime(dump_only=True)
     is_active = fields.Bool(dump_only=True)
     email_verified = fields.Bool(dump_only=True, data_key='emailVerified')
+    avatar = fields.Str(attribute='avatar_url', dump_only=True)
 
 class PostSchema(Schema):
     """Post serialization schema."""
@@ -17,8 +18,11 @@ class PostSchema(Schema):
     title = fields.Str(required=True)
     content = fields.Str(required=True)
     published = fields.Bool(load_default=False)
+    version = fields.Int(dump_only=True)
     created_at = fields.DateTime(dump_only=True)
     updated_at = fields.DateTime(dump_only=True)
+    views = fields.Int(attribute='view_count', dump_only=True)
+    tags = fields.List(fields.Str(), attribute='tag_names')
     author = fields.Nested(UserSchema, exclude=['email'], dump_only=True)
 
 class LoginSchema(Schema):
@@ -0,0 +1,566 @@
+"""Posts partitioned by author across several databases.
+
+Shard 0 is the main database; ``POST_SHARD_URLS`` adds shards 1..N-1 as the
+binds ``post_shard_<n>``. With no extra URLs there is one shard and nothing
+below costs anything. Adding shards is a matter of listing them and running
+``flask shards-rebalance``, which moves authors off the crowded ones.
+
+A post lives on its author's home shard, ``user.post_shard``, assigned as
+``user_id % N`` when the author first writes a post while several shards
+are configured. Only ``post`` and its per-post counters ``post_stats`` are
+sharded. What is keyed by post id but searched across authors (tags,
+timelines, the change log, related posts, signatures, the archive) stays in
+the main database as a global index. Post ids are allocated from
+``post_locator`` there, which also maps each id to its author, so reading
+a post by id goes straight to one shard.
+
+Routing happens in :class:`ShardedSession`:
+
+* statements on sharded tables run on the shard selected with
+  ``post_shards.using(shard)``;
+* objects remember the shard they were loaded from or flushed to, so
+  expired attributes and lazy loads are fetched from there, and a flush
+  goes to the one shard its posts live on (a flush spanning shards raises
+  :class:`ShardingError`, as does a statement joining sharded and main
+  tables).
+
+Author-scoped reads therefore run on one shard. Global feeds ask every shard
+for its first rows in feed order and merge them (:func:`scatter_merge`), so
+a page costs one index range scan per shard. Shards are queried one after
+another on the request's session.
+"""
+import heapq
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import chain, islice
+
+from flask_sqlalchemy.pagination import Pagination
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Table, event, inspect, or_, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.sql.util import find_tables
+
+SHARDED_TABLES = frozenset({'post', 'post_stats'})
+
+# Main database tables keyed by post id; they keep no foreign keys to ``post``
+POST_INDEX_TABLES = ('related_post', 'post_signature', 'post_tag')
+
+# Rows copied per statement when moving an author between shards
+MOVE_BATCH = 500
+
+_current_shard = ContextVar('post_shard', default=None)
+
+
+class ShardingError(Exception):
+    """A statement or flush could not be routed to a single post shard."""
+
+
+def _tables(mapper, clause):
+    if clause is not None:
+        return {table.name for table in find_tables(clause, include_joins=True, include_crud=True)
+                if isinstance(table, Table)}
+    if mapper is not None:
+        return {inspect(mapper).local_table.name}
+    return set()
+
+
+def _is_sharded(obj):
+    return inspect(obj).mapper.local_table.name in SHARDED_TABLES
+
+
+class ShardedSession(Session):
+    """Flask-SQLAlchemy session that sends post tables to their shard."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, shard=None, **kwargs):
+        if bind is None and post_shards.count > 1:
+            tables = _tables(mapper, clause)
+            if tables & SHARDED_TABLES:
+                if tables - SHARDED_TABLES:
+                    raise ShardingError(f'Statement mixes sharded and main tables: {sorted(tables)}')
+                return post_shards.engine(self._route(shard))
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _route(self, shard):
+        if shard is None and self._flushing:
+            shard = self.info.get('flush_shard')
+        if shard is None:
+            shard = _current_shard.get()
+        if shard is None:
+            raise ShardingError('No post shard selected; wrap the query in post_shards.using(shard)')
+        return shard
+
+
+def _route_orm_execute(orm_context):
+    # Refreshing an expired object or lazy loading from one reads the shard
+    # the object came from, whatever shard is selected at the time
+    if 'shard' in orm_context.bind_arguments or not orm_context.is_select:
+        return
+    state = orm_context.load_options._refresh_state or orm_context.lazy_loaded_from
+    shard = getattr(state.obj(), '_shard', None) if state is not None else None
+    if shard is not None:
+        orm_context.bind_arguments['shard'] = shard
+
+
+def _stamp_loaded(target, context):
+    target._shard = context.bind_arguments.get('shard', _current_shard.get())
+
+
+def _before_flush(session, flush_context, instances):
+    from app.models import Post
+
+    sharded = [obj for obj in chain(session.new, session.dirty, session.deleted) if _is_sharded(obj)]
+    for obj in sharded:
+        if isinstance(obj, Post) and getattr(obj, '_shard', None) is None:
+            _place(session, obj)
+    # New counters rows without a shard belong to a post in the same flush
+    shards = {obj._shard for obj in sharded if getattr(obj, '_shard', None) is not None}
+    if len(shards) > 1:
+        raise ShardingError(f'A flush can only write to one post shard, not {sorted(shards)}')
+    if sharded and not shards:
+        raise ShardingError('Cannot tell which post shard to flush to')
+    session.info['flush_shard'] = shards.pop() if shards else None
+
+
+def _after_flush(session, flush_context):
+    shard = session.info.pop('flush_shard', None)
+    for obj in session.new:
+        if _is_sharded(obj):
+            obj._shard = shard
+
+
+def _place(session, post):
+    """Give a new post its author's shard and, unless restored with one, an id."""
+    from app.models import PostLocator
+
+    user_id = post.user_id if post.user_id is not None else post.author.id
+    post._shard = home_shard(user_id, assign=True)
+    locator = PostLocator.__table__
+    if post.id is None:
+        post.id = session.execute(locator.insert().values(user_id=user_id)).inserted_primary_key[0]
+    elif session.scalar(locator.select().with_only_columns(locator.c.id)
+                        .where(locator.c.id == post.id)) is None:
+        session.execute(locator.insert().values(id=post.id, user_id=user_id))
+
+
+class PostShards:
+    """The configured shards, the current selection and the routing hooks."""
+
+    def __init__(self):
+        self.app = None
+        self.count = 1
+
+    def init_app(self, app):
+        from app.models import Post, PostStats
+
+        self.app = app
+        self.count = 1 + len(app.config.get('POST_SHARD_URLS', ()))
+        app.extensions['post_shards'] = self
+        if not event.contains(Post, 'after_delete', _drop_related):
+            event.listen(Post, 'after_delete', _drop_related)
+        if self.count == 1:
+            return
+        for target, name, listener in ((ShardedSession, 'do_orm_execute', _route_orm_execute),
+                                       (ShardedSession, 'before_flush', _before_flush),
+                                       (ShardedSession, 'after_flush', _after_flush),
+                                       (Post, 'load', _stamp_loaded),
+                                       (PostStats, 'load', _stamp_loaded)):
+            if not event.contains(target, name, listener):
+                event.listen(target, name, listener)
+
+    def bind_key(self, shard):
+        return None if shard == 0 else f'post_shard_{shard}'
+
+    def engine(self, shard):
+        from app import db
+
+        if not 0 <= shard < self.count:
+            raise ShardingError(f'No post shard {shard}; {self.count} configured')
+        return db.engines[self.bind_key(shard)]
+
+    @contextmanager
+    def using(self, shard):
+        """Run statements on sharded tables against ``shard`` inside the block."""
+        token = _current_shard.set(shard)
+        try:
+            yield shard
+        finally:
+            _current_shard.reset(token)
+
+    def create_all(self):
+        """Create the post tables on every shard and index posts made before sharding.
+
+        Only foreign keys between sharded tables are created on shards 1..N-1,
+        since the tables they would point to live in the main database.
+        """
+        from app import db
+        from app.models import Post, PostLocator, User
+
+        if self.count == 1:
+            return
+        self._drop_post_foreign_keys()
+        tables = [table for table in db.metadata.sorted_tables if table.name in SHARDED_TABLES]
+        for shard in range(1, self.count):
+            with self.engine(shard).begin() as connection:
+                existing = set(inspect(connection).get_table_names())
+                for table in tables:
+                    if table.name in existing:
+                        continue
+                    connection.execute(CreateTable(table, include_foreign_key_constraints=[
+                        fk for fk in table.foreign_key_constraints if fk.referred_table.name in SHARDED_TABLES
+                    ]))
+                    for index in table.indexes:
+                        connection.execute(CreateIndex(index))
+
+        # Posts written while the main database was the only shard have no
+        # locator rows and their authors no home shard yet. Both tables are
+        # in the main database, so this bypasses the routing session.
+        locator, posts, users = PostLocator.__table__, Post.__table__, User.__table__
+        with db.engine.begin() as connection:
+            connection.execute(locator.insert().from_select(
+                ['id', 'user_id'],
+                db.select(posts.c.id, posts.c.user_id).where(
+                    ~db.exists().where(locator.c.id == posts.c.id))
+            ))
+            connection.execute(users.update().where(
+                users.c.post_shard.is_(None),
+                db.exists().where(posts.c.user_id == users.c.id)
+            ).values(post_shard=0))
+
+    def _drop_post_foreign_keys(self):
+        """Drop foreign keys to ``post`` left on the main database's post indexes.
+
+        Databases created before posts could be sharded have them, and on a
+        backend enforcing them every insert for a post on another shard would
+        fail. SQLite does not enforce them, and cannot drop them in place.
+        """
+        from app import db
+
+        if db.engine.dialect.name == 'sqlite':
+            return
+        preparer = db.engine.dialect.identifier_preparer
+        with db.engine.begin() as connection:
+            insp = inspect(connection)
+            for table in POST_INDEX_TABLES:
+                for fk in insp.get_foreign_keys(table):
+                    if fk['referred_table'] == 'post' and fk.get('name'):
+                        connection.execute(text(f"ALTER TABLE {preparer.quote(table)} "
+                                                f"DROP CONSTRAINT {preparer.quote(fk['name'])}"))
+
+
+post_shards = PostShards()
+
+
+def scatter(func):
+    """``[func() for each shard]``, each call made with that shard selected."""
+    results = []
+    for shard in range(post_shards.count):
+        with post_shards.using(shard):
+            results.append(func())
+    return results
+
+
+def home_shard(user_id, assign=False):
+    """The shard holding ``user_id``'s posts, recording it if ``assign`` and unset."""
+    from app import db
+    from app.models import User
+
+    if post_shards.count == 1:
+        return 0
+    cache = db.session.info.setdefault('home_shards', {})
+    if user_id in cache:
+        return cache[user_id]
+    users = User.__table__
+    with db.session.no_autoflush:
+        shard = db.session.scalar(users.select().with_only_columns(users.c.post_shard)
+                                  .where(users.c.id == user_id))
+    if shard is None:
+        shard = user_id % post_shards.count
+        if not assign:
+            return shard
+        db.session.execute(users.update().where(users.c.id == user_id, users.c.post_shard.is_(None))
+                           .values(post_shard=shard))
+    cache[user_id] = shard
+    return shard
+
+
+def group_by_shard(post_ids):
+    """``{shard: [post_id, ...]}`` for the posts in ``post_ids`` that exist."""
+    from app import db
+    from app.models import PostLocator, User
+
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    if post_shards.count == 1:
+        return {0: post_ids}
+    groups = {}
+    for post_id, shard in db.session.execute(
+        db.select(PostLocator.id, db.func.coalesce(User.post_shard, 0))
+        .join(User, User.id == PostLocator.user_id)
+        .where(PostLocator.id.in_(post_ids))
+    ):
+        groups.setdefault(shard, []).append(post_id)
+    return groups
+
+
+def get_post(post_id):
+    """The ``Post`` with this id, read from its shard, or None."""
+    from app import db
+    from app.models import Post
+
+    for shard in group_by_shard([post_id]):
+        with post_shards.using(shard):
+            return db.session.get(Post, post_id)
+    return None
+
+
+def posts_by_ids(post_ids, published_only=False):
+    """Posts with the given ids (only published ones if asked), in no particular order."""
+    from app import db
+    from app import statements
+
+    statement = statements.published_posts_by_ids if published_only else statements.posts_by_ids
+    posts = []
+    for shard, ids in group_by_shard(post_ids).items():
+        with post_shards.using(shard):
+            posts += db.session.scalars(statement, {'ids': ids}).all()
+    return posts
+
+
+def scatter_merge(statement, key, limit, offset=0, params=None, scalars=True):
+    """Rows ``offset`` to ``offset + limit`` of an ordered ``statement`` over all shards.
+
+    ``statement`` must be ordered descending by ``key`` and take its LIMIT
+    and OFFSET as the bound parameters ``limit`` and ``offset`` (see
+    app/statements.py); ``params`` holds any others. Each shard returns its
+    first ``offset + limit`` rows and the sorted lists are merged; with a
+    single shard the offset is left to the database.
+    """
+    from app import db
+
+    execute = db.session.scalars if scalars else db.session.execute
+    params = dict(params or {})
+    if post_shards.count == 1:
+        return execute(statement, {**params, 'limit': limit, 'offset': offset}).all()
+    params.update(limit=offset + limit, offset=0)
+    merged = heapq.merge(*scatter(lambda: execute(statement, params).all()), key=key, reverse=True)
+    return list(islice(merged, offset, offset + limit))
+
+
+def _newest_key(post):
+    return post.created_at, post.id
+
+
+def newest_posts(before=None, limit=20, offset=0):
+    """Published posts newest first, by ``(created_at, id)`` across shards.
+
+    ``before`` is the ``(created_at, id)`` of the last post of the previous
+    page, for keyset paging.
+    """
+    from app import statements
+
+    if before is None:
+        return scatter_merge(statements.published_feed, _newest_key, limit, offset)
+    return scatter_merge(statements.published_feed_before, _newest_key, limit, offset,
+                         statements.before_params(before))
+
+
+class FeedPagination(Pagination):
+    """Page-numbered results of ``items(limit, offset)`` out of ``total()``."""
+
+    def _query_items(self):
+        return self._query_args['items'](self.per_page, self._query_offset)
+
+    def _query_count(self):
+        return self._query_args['total']()
+
+
+def _paginate(items, total, page, per_page):
+    return FeedPagination(page=page, per_page=per_page, max_per_page=None, error_out=False,
+                          items=items, total=total)
+
+
+def paginate_newest(page=1, per_page=20):
+    """Page ``page`` of :func:`newest_posts`, for the templates and the paged API."""
+    from app import db
+    from app import statements
+
+    return _paginate(lambda limit, offset: newest_posts(limit=limit, offset=offset),
+                     lambda: sum(scatter(lambda: db.session.scalar(statements.published_count))),
+                     page, per_page)
+
+
+def paginate_author(user_id, page=1, per_page=20):
+    """Page ``page`` of an author's posts, newest first, read from their home shard."""
+    from app import db
+    from app import statements
+
+    shard = home_shard(user_id)
+
+    def items(limit, offset):
+        with post_shards.using(shard):
+            return db.session.scalars(statements.author_posts,
+                                      {'user_id': user_id, 'limit': limit, 'offset': offset}).all()
+
+    def total():
+        with post_shards.using(shard):
+            return db.session.scalar(statements.author_post_count, {'user_id': user_id})
+
+    return _paginate(items, total, page, per_page)
+
+
+def _drop_related(mapper, connection, target):
+    # No foreign key cascades neighbour lists away with the post they name.
+    # Its signature and tag rows are removed by the Post mapper already
+    from app.models import RelatedPost
+
+    related = RelatedPost.__table__
+    main_connection(connection).execute(related.delete().where(
+        or_(related.c.post_id == target.id, related.c.related_id == target.id)))
+
+
+def main_connection(connection):
+    """The main database connection of the flush a post listener was given ``connection`` for."""
+    from app import db
+
+    if post_shards.count == 1 or connection.engine is db.engine:
+        return connection
+    return db.session.connection()
+
+
+# -- rebalancing --
+
+def shard_loads():
+    """``[{user_id: posts}, ...]``: post counts per author on each shard."""
+    from app import db
+    from app.models import Post
+
+    return scatter(lambda: dict(db.session.execute(
+        db.select(Post.user_id, db.func.count()).group_by(Post.user_id)
+    ).all()))
+
+
+def plan_rebalance(loads, max_moves=100):
+    """Author moves ``[(user_id, source, target, posts), ...]`` that even out ``loads``.
+
+    Greedy: repeatedly moves the biggest author from the fullest shard to the
+    emptiest one that still narrows the gap between the two, i.e. has at
+    most half the difference in posts.
+    """
+    loads = [dict(authors) for authors in loads]
+    totals = [sum(authors.values()) for authors in loads]
+    moves = []
+    while len(moves) < max_moves and len(loads) > 1:
+        source = max(range(len(loads)), key=totals.__getitem__)
+        target = min(range(len(loads)), key=totals.__getitem__)
+        room = (totals[source] - totals[target]) // 2
+        fits = [(posts, user_id) for user_id, posts in loads[source].items() if posts <= room]
+        if not fits:
+            break
+        posts, user_id = max(fits)
+        moves.append((user_id, source, target, posts))
+        del loads[source][user_id]
+        loads[target][user_id] = posts
+        totals[source] -= posts
+        totals[target] += posts
+    return moves
+
+
+def _copy_posts(user_id, source, target, views, since=None):
+    """Upsert ``user_id``'s posts and counters from ``source`` onto ``target``.
+
+    Rows are copied in id order, ``MOVE_BATCH`` posts per statement, with
+    their ids. ``since`` limits the post rows to those updated from then on,
+    but counters are copied for every post: view flushes only touch
+    ``post_stats``. ``views`` maps post ids to the view counts copied so
+    far; a later pass adds what ``source`` gained since on top of what
+    ``target`` already has, so views flushed to either side are kept.
+    Returns the ids found on ``source``.
+    """
+    from app import db
+    from app.models import Post, PostStats
+
+    posts, stats = Post.__table__, PostStats.__table__
+    copied, last_id = [], 0
+    while True:
+        with post_shards.using(source):
+            query = posts.select().where(posts.c.user_id == user_id, posts.c.id > last_id)
+            rows = [dict(row._mapping) for row in db.session.execute(
+                query.order_by(posts.c.id).limit(MOVE_BATCH))]
+            if not rows:
+                return copied
+            ids = [row['id'] for row in rows]
+            last_id = ids[-1]
+            copied += ids
+            if since is not None:
+                rows = [row for row in rows if row['updated_at'] is None or row['updated_at'] >= since]
+            stat_rows = [dict(row._mapping) for row in db.session.execute(
+                stats.select().where(stats.c.post_id.in_(ids)))]
+        with post_shards.using(target):
+            if since is not None:
+                current = {row.post_id: dict(row._mapping) for row in db.session.execute(
+                    stats.select().where(stats.c.post_id.in_(ids)))}
+                for row in stat_rows:
+                    flushed = current.pop(row['post_id'], None)
+                    row['views'] += (flushed['views'] if flushed else 0) - views.get(row['post_id'], 0)
+                # Counters only ever flushed to the target are kept as they are
+                stat_rows += current.values()
+            db.session.execute(stats.delete().where(stats.c.post_id.in_(ids)))
+            if rows:
+                changed = [row['id'] for row in rows]
+                db.session.execute(posts.delete().where(posts.c.id.in_(changed)))
+                db.session.execute(posts.insert(), rows)
+            if stat_rows:
+                db.session.execute(stats.insert(), stat_rows)
+        db.session.commit()
+        views.update((row['post_id'], row['views']) for row in stat_rows)
+
+
+def move_author(user_id, target):
+    """Move ``user_id``'s posts to shard ``target``; returns the number moved.
+
+    The posts are copied to ``target`` and committed there, the author's
+    home shard is switched, then posts written on the old shard during the
+    copy are copied again, views flushed to either shard meanwhile are added
+    up, ones deleted meanwhile are dropped, and the old rows are deleted. Reads see the complete set on one side or the other
+    throughout; a write that picked the old shard just before the switch and
+    commits after the final copy is lost.
+    """
+    from datetime import datetime
+
+    from app import db
+    from app.models import Post, PostStats, User
+
+    source = home_shard(user_id)
+    if source == target:
+        return 0
+    post_shards.engine(target)
+    started = datetime.utcnow()
+    views = {}
+    copied = _copy_posts(user_id, source, target, views)
+
+    db.session.execute(User.__table__.update().where(User.__table__.c.id == user_id)
+                       .values(post_shard=target))
+    db.session.commit()
+    db.session.info.pop('home_shards', None)
+
+    moved = _copy_posts(user_id, source, target, views, since=started)
+    posts, stats = Post.__table__, PostStats.__table__
+    # Posts deleted during the copy must not come back on the new shard
+    for shard, ids in ((source, moved), (target, sorted(set(copied) - set(moved)))):
+        with post_shards.using(shard):
+            for i in range(0, len(ids), MOVE_BATCH):
+                chunk = ids[i:i + MOVE_BATCH]
+                db.session.execute(stats.delete().where(stats.c.post_id.in_(chunk)))
+                db.session.execute(posts.delete().where(posts.c.id.in_(chunk)))
+    db.session.commit()
+    return len(moved)
+
+
+def rebalance(max_moves=100, dry_run=False):
+    """Plan author moves with :func:`plan_rebalance` and carry them out unless ``dry_run``."""
+    moves = plan_rebalance(shard_loads(), max_moves)
+    if not dry_run:
+        for user_id, _, target, _ in moves:
+            move_author(user_id, target)
+    return moves
@@ -0,0 +1,180 @@
+"""Prebuilt statements for the hot request paths, and compiled-cache stats.
+
+Building ``Post.query.filter_by(...)`` on every request costs Python time
+before the database sees anything: the query object, its ``select()``, the
+ORM compile state and the cache key under which SQLAlchemy looks up the
+compiled SQL. The statements below are built once, take everything that
+varies (including LIMIT and OFFSET) as bound parameters, and memoise their
+cache key, so executing one goes straight to the engine's compiled cache.
+Run them with ``db.session.execute(statement, {'name': value})``.
+
+:class:`StatementCacheStats` counts, per process, how statements fared in
+that cache (``/api/diagnostics/statement-cache``): a ``miss`` compiled SQL
+that a later execution can reuse, and a steady stream of misses means the
+cache (``SQLALCHEMY_QUERY_CACHE_SIZE``) is too small or a statement embeds
+values instead of parameters.
+"""
+import threading
+
+from sqlalchemy import bindparam, event, func, select, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import default
+from sqlalchemy.orm import contains_eager
+
+from app.models import Follow, OAuth, Post, PostStats, Tag, TimelineEntry, User, post_tag
+
+
+def _page(statement):
+    return statement.limit(bindparam('limit')).offset(bindparam('offset'))
+
+
+def _before(created_at, id_):
+    return tuple_(created_at, id_) < tuple_(bindparam('before_created_at'), bindparam('before_id'))
+
+
+def _ids(column, name='ids'):
+    return column.in_(bindparam(name, expanding=True))
+
+
+# -- users and auth --
+
+user_by_email = select(User).where(User.email == bindparam('email')).limit(1)
+
+user_by_username = select(User).where(User.username == bindparam('username')).limit(1)
+
+users_by_ids = select(User).where(_ids(User.id))
+
+user_by_oauth = select(User).join(OAuth, OAuth.user_id == User.id).where(
+    OAuth.provider == bindparam('provider'),
+    OAuth.provider_user_id == bindparam('provider_user_id')
+).limit(1)
+
+oauth_by_account = select(OAuth).where(
+    OAuth.provider == bindparam('provider'),
+    OAuth.provider_user_id == bindparam('provider_user_id')
+).limit(1)
+
+# -- posts (run on a post shard) --
+
+_newest = (Post.created_at.desc(), Post.id.desc())
+
+published_feed = _page(select(Post).where(Post.published.is_(True)).order_by(*_newest))
+
+published_feed_before = _page(select(Post).where(
+    Post.published.is_(True), _before(Post.created_at, Post.id)
+).order_by(*_newest))
+
+published_count = select(func.count()).select_from(Post).where(Post.published.is_(True))
+
+author_posts = _page(select(Post).where(Post.user_id == bindparam('user_id'))
+                     .order_by(Post.created_at.desc()))
+
+author_post_count = select(func.count()).select_from(Post).where(Post.user_id == bindparam('user_id'))
+
+posts_by_ids = select(Post).where(_ids(Post.id))
+
+published_posts_by_ids = select(Post).where(_ids(Post.id), Post.published.is_(True))
+
+trending_posts = _page(select(Post).join(Post.stats).options(contains_eager(Post.stats)).where(
+    Post.published.is_(True),
+    PostStats.trending_score.isnot(None)
+).order_by(PostStats.trending_score.desc()))
+
+# Syndication feeds; the author is looked up in the main database
+latest_published_rows = _page(select(
+    Post.id, Post.title, Post.content, Post.created_at, Post.updated_at, Post.user_id
+).where(Post.published.is_(True)).order_by(*_newest))
+
+# -- tag pages and home timelines (main database) --
+
+tag_by_name = select(Tag).where(Tag.name == bindparam('name')).limit(1)
+
+_tagged_newest = (post_tag.c.created_at.desc(), post_tag.c.post_id.desc())
+
+tagged_post_ids = select(post_tag.c.post_id, post_tag.c.created_at).where(
+    post_tag.c.tag_id == bindparam('tag_id')
+).order_by(*_tagged_newest).limit(bindparam('limit'))
+
+tagged_post_ids_before = select(post_tag.c.post_id, post_tag.c.created_at).where(
+    post_tag.c.tag_id == bindparam('tag_id'),
+    _before(post_tag.c.created_at, post_tag.c.post_id)
+).order_by(*_tagged_newest).limit(bindparam('limit'))
+
+_entry_newest = (TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc())
+
+timeline_entries = select(TimelineEntry.post_id, TimelineEntry.created_at).where(
+    TimelineEntry.user_id == bindparam('user_id')
+).order_by(*_entry_newest).limit(bindparam('limit'))
+
+timeline_entries_before = select(TimelineEntry.post_id, TimelineEntry.created_at).where(
+    TimelineEntry.user_id == bindparam('user_id'),
+    _before(TimelineEntry.created_at, TimelineEntry.post_id)
+).order_by(*_entry_newest).limit(bindparam('limit'))
+
+read_fanned_followees = select(Follow.followee_id).join(User, User.id == Follow.followee_id).where(
+    Follow.follower_id == bindparam('user_id'),
+    User.fanout_on_read.is_(True)
+)
+
+# Posts of read-fanned authors, merged into home timelines (post shard)
+authors_published = select(Post.id.label('post_id'), Post.created_at).where(
+    _ids(Post.user_id, 'author_ids'), Post.published.is_(True)
+).order_by(*_newest).limit(bindparam('limit'))
+
+authors_published_before = select(Post.id.label('post_id'), Post.created_at).where(
+    _ids(Post.user_id, 'author_ids'), Post.published.is_(True), _before(Post.created_at, Post.id)
+).order_by(*_newest).limit(bindparam('limit'))
+
+
+def before_params(before):
+    """Bound parameters of a ``*_before`` statement for a ``(created_at, id)`` cursor."""
+    return {'before_created_at': before[0], 'before_id': before[1]}
+
+
+class StatementCacheStats:
+    """Per-process counts of compiled-cache outcomes across all engines."""
+
+    OUTCOMES = {
+        default.CACHE_HIT: 'hits',
+        default.CACHE_MISS: 'misses',
+        default.CACHING_DISABLED: 'disabled',
+        default.NO_CACHE_KEY: 'uncacheable',
+        default.NO_DIALECT_SUPPORT: 'uncacheable',
+    }
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.OUTCOMES.values(), 0)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.extensions['statement_cache'] = self
+        if not event.contains(Engine, 'after_cursor_execute', self._record):
+            event.listen(Engine, 'after_cursor_execute', self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # Raw driver-level SQL has no execution context to report on
+        outcome = self.OUTCOMES.get(getattr(context, 'cache_hit', None))
+        if outcome is not None:
+            with self._lock:
+                self._counts[outcome] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.OUTCOMES.values(), 0)
+
+    def status(self, engines=()):
+        """Outcome counts, hit ratio and, for each named engine, its cache fill."""
+        with self._lock:
+            counts = dict(self._counts)
+        looked_up = counts['hits'] + counts['misses']
+        return {
+            **counts,
+            'hit_ratio': round(counts['hits'] / looked_up, 4) if looked_up else None,
+            'engines': {
+                name: {'entries': len(engine._compiled_cache), 'capacity': engine._compiled_cache.capacity}
+                for name, engine in engines if engine._compiled_cache is not None
+            },
+        }
+
+
+statement_cache = StatementCacheStats()
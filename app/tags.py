@@ -0,0 +1,193 @@
+"""Post tags.
+
+Assignments are written here rather than through ``Post.tags`` so the
+per-tag ``published_count`` stays exact: adding or removing a tag on a
+published post adjusts it directly, and mapper events adjust it when a
+tagged post is published, unpublished or deleted. The tag cloud then reads
+the counts instead of grouping ``post_tag`` on every request.
+"""
+import re
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models import Post, Tag, post_tag
+from app.sharding import main_connection, scatter
+from app.utils import upsert_statement
+
+MAX_TAGS_PER_POST = 10
+
+TAG_RE = re.compile(r'^[a-z0-9][a-z0-9-]{0,49}$')
+
+
+def normalize_tags(names, limit=MAX_TAGS_PER_POST):
+    """Lower-cased, hyphenated, de-duplicated tag names; ValueError if invalid."""
+    if not isinstance(names, (list, tuple)):
+        raise ValueError('Tags must be a list')
+    result = []
+    for name in names:
+        if not isinstance(name, str):
+            raise ValueError('Tags must be strings')
+        name = re.sub(r'\s+', '-', name.strip().lower())
+        if not TAG_RE.match(name):
+            raise ValueError(f'Invalid tag: {name!r}')
+        if name not in result:
+            result.append(name)
+    if limit is not None and len(result) > limit:
+        raise ValueError(f'A post can have at most {limit} tags')
+    return result
+
+
+def _tag_ids(names, create=True):
+    """``{name: id}`` for ``names``, creating missing tags unless ``create`` is false."""
+    if not names:
+        return {}
+    if create:
+        db.session.execute(upsert_statement(
+            Tag, Tag.name, lambda excluded: {'name': excluded.name}
+        ), [{'name': name, 'published_count': 0, 'created_at': datetime.utcnow()} for name in names])
+    return dict(db.session.execute(db.select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+
+
+def _adjust_counts(connection, deltas):
+    deltas = [{'tag_id': tag_id, 'delta': delta} for tag_id, delta in deltas.items() if delta]
+    if deltas:
+        connection.execute(
+            db.update(Tag).where(Tag.id == db.bindparam('tag_id'))
+            .values(published_count=Tag.published_count + db.bindparam('delta')),
+            deltas
+        )
+
+
+def _persisted_published(post):
+    # Pending publish/unpublish changes are counted by _after_update when
+    # they are flushed, so count assignments against the stored state
+    history = inspect(post).attrs.published.history
+    if history.has_changes():
+        return bool(history.deleted and history.deleted[0])
+    return bool(post.published)
+
+
+def _apply(posts, added, removed):
+    """Insert ``added`` and delete ``removed`` ``(post_id, tag_id)`` pairs."""
+    by_id = {post.id: post for post in posts}
+    if added:
+        db.session.execute(post_tag.insert(), [
+            {'post_id': post_id, 'tag_id': tag_id, 'created_at': by_id[post_id].created_at}
+            for post_id, tag_id in added
+        ])
+    if removed:
+        db.session.execute(
+            post_tag.delete().where(post_tag.c.post_id == db.bindparam('p'),
+                                    post_tag.c.tag_id == db.bindparam('t')),
+            [{'p': post_id, 't': tag_id} for post_id, tag_id in removed]
+        )
+    published = {post.id for post in posts if _persisted_published(post)}
+    deltas = Counter(tag_id for post_id, tag_id in added if post_id in published)
+    deltas.subtract(tag_id for post_id, tag_id in removed if post_id in published)
+    _adjust_counts(db.session.connection(), deltas)
+    for post in posts:
+        # Tags are part of the post payload, so let sync clients see the change
+        db.session.expire(post, ['tags'])
+        post.updated_at = datetime.utcnow()
+
+
+def _current_pairs(post_ids):
+    return set(db.session.execute(
+        db.select(post_tag.c.post_id, post_tag.c.tag_id).where(post_tag.c.post_id.in_(post_ids))
+    ).all())
+
+
+def set_post_tags(post, names):
+    """Replace the tags of a flushed ``post`` with ``names``. The caller commits."""
+    names = normalize_tags(names)
+    wanted = {(post.id, tag_id) for tag_id in _tag_ids(names).values()}
+    current = _current_pairs([post.id])
+    if wanted != current:
+        _apply([post], wanted - current, current - wanted)
+
+
+def bulk_tag(posts, add=(), remove=()):
+    """Add and remove tags across many flushed posts at once. The caller commits.
+
+    Returns the number of assignments changed.
+    """
+    add, remove = normalize_tags(add, limit=None), normalize_tags(remove, limit=None)
+    post_ids = [post.id for post in posts]
+    current = _current_pairs(post_ids)
+    add_ids = _tag_ids(add).values()
+    remove_ids = _tag_ids(remove, create=False).values()
+
+    added = {(post_id, tag_id) for post_id in post_ids for tag_id in add_ids} - current
+    removed = {(post_id, tag_id) for post_id in post_ids for tag_id in remove_ids} & current
+    per_post = Counter(post_id for post_id, _ in current | added)
+    per_post.subtract(post_id for post_id, _ in removed)
+    if any(n > MAX_TAGS_PER_POST for n in per_post.values()):
+        raise ValueError(f'A post can have at most {MAX_TAGS_PER_POST} tags')
+
+    changed = [post for post in posts
+               if any(pair[0] == post.id for pair in added | removed)]
+    if changed:
+        _apply(changed, added, removed)
+    return len(added) + len(removed)
+
+
+def _published_delta(connection, post_id, delta):
+    tag_ids = connection.scalars(
+        db.select(post_tag.c.tag_id).where(post_tag.c.post_id == post_id)
+    ).all()
+    _adjust_counts(connection, {tag_id: delta for tag_id in tag_ids})
+
+
+def _after_update(mapper, connection, target):
+    history = inspect(target).attrs.published.history
+    if history.has_changes() and bool(history.deleted and history.deleted[0]) != bool(target.published):
+        _published_delta(main_connection(connection), target.id, 1 if target.published else -1)
+
+
+def _before_delete(mapper, connection, target):
+    connection = main_connection(connection)
+    if target.published:
+        _published_delta(connection, target.id, -1)
+    connection.execute(post_tag.delete().where(post_tag.c.post_id == target.id))
+
+
+def register_tag_listeners():
+    for name, listener in (('after_update', _after_update),
+                           ('before_delete', _before_delete)):
+        if not event.contains(Post, name, listener):
+            event.listen(Post, name, listener)
+
+
+def tag_cloud(limit=50):
+    """Most used tags with their published post counts."""
+    return db.session.execute(
+        db.select(Tag.name, Tag.published_count)
+        .where(Tag.published_count > 0)
+        .order_by(Tag.published_count.desc(), Tag.name)
+        .limit(limit)
+    ).all()
+
+
+def recount_tags():
+    """Recompute every ``published_count`` from ``post_tag``; returns tags updated."""
+    # Posts may live on other shards than the assignments, so no join
+    published = set().union(*scatter(lambda: db.session.scalars(
+        db.select(Post.id).where(Post.published.is_(True))
+    ).all()))
+    counts = Counter(tag_id for post_id, tag_id in db.session.execute(
+        db.select(post_tag.c.post_id, post_tag.c.tag_id)
+    ) if post_id in published)
+    rows = [{'tag_id': tag_id, 'count': counts.get(tag_id, 0)}
+            for tag_id, current in db.session.execute(db.select(Tag.id, Tag.published_count))
+            if counts.get(tag_id, 0) != current]
+    if rows:
+        db.session.execute(
+            db.update(Tag).where(Tag.id == db.bindparam('tag_id'))
+            .values(published_count=db.bindparam('count')),
+            rows
+        )
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,157 @@
+"""Follow graph and home timelines.
+
+Publishing a post copies a small row into the timeline of every follower of
+its author with one ``INSERT ... SELECT`` (fan-out-on-write), so a timeline
+read is an index range scan of ``timeline_entry`` for one user. Authors with
+more than ``TIMELINE_FANOUT_MAX_FOLLOWERS`` followers would make each publish
+write that many rows; they are switched to fan-out-on-read and their posts
+are merged in at read time from the ``(user_id, created_at)`` post index of
+each shard holding their posts.
+
+The switch is one-way, so no post ever falls between the two modes. Entries
+fanned out before an author switched come back from both sides of the read
+and are collapsed when they are merged.
+"""
+import heapq
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import event, inspect, literal
+
+from app import db
+from app.models import Follow, Post, TimelineEntry, User
+from app.sharding import home_shard, main_connection, post_shards
+from app.statements import (authors_published, authors_published_before, before_params,
+                            read_fanned_followees, timeline_entries, timeline_entries_before)
+
+ENTRY_COLUMNS = ['user_id', 'post_id', 'author_id', 'created_at']
+
+
+def _fan_out(connection, post):
+    pull = connection.scalar(db.select(User.fanout_on_read).where(User.id == post.user_id))
+    if pull:
+        return
+    connection.execute(db.insert(TimelineEntry).from_select(ENTRY_COLUMNS, db.select(
+        Follow.follower_id,
+        literal(post.id),
+        literal(post.user_id),
+        literal(post.created_at, db.DateTime)
+    ).where(Follow.followee_id == post.user_id)))
+
+
+def _retract(connection, post):
+    # Only current followers hold entries (unfollowing removes them), so this
+    # is one primary-key lookup per follower
+    connection.execute(db.delete(TimelineEntry).where(
+        TimelineEntry.user_id.in_(db.select(Follow.follower_id).where(Follow.followee_id == post.user_id)),
+        TimelineEntry.created_at == post.created_at,
+        TimelineEntry.post_id == post.id
+    ))
+
+
+def _after_insert(mapper, connection, target):
+    if target.published:
+        _fan_out(main_connection(connection), target)
+
+
+def _after_update(mapper, connection, target):
+    history = inspect(target).attrs.published.history
+    if not history.has_changes():
+        return
+    connection = main_connection(connection)
+    _retract(connection, target)
+    if target.published:
+        _fan_out(connection, target)
+
+
+def _after_delete(mapper, connection, target):
+    _retract(main_connection(connection), target)
+
+
+def register_timeline_listeners():
+    for name, listener in (('after_insert', _after_insert),
+                           ('after_update', _after_update),
+                           ('after_delete', _after_delete)):
+        if not event.contains(Post, name, listener):
+            event.listen(Post, name, listener)
+
+
+def follow(follower, followee):
+    """Make ``follower`` follow ``followee``; False if it already did.
+
+    The followee's recent posts are copied into the new follower's timeline
+    unless the followee is read-fanned. The caller commits.
+    """
+    if db.session.get(Follow, (follower.id, followee.id)):
+        return False
+    db.session.add(Follow(follower_id=follower.id, followee_id=followee.id))
+    followee.follower_count = User.follower_count + 1
+    db.session.flush()
+
+    if not followee.fanout_on_read and \
+            followee.follower_count > current_app.config.get('TIMELINE_FANOUT_MAX_FOLLOWERS', 10000):
+        followee.fanout_on_read = True
+    if not followee.fanout_on_read:
+        with post_shards.using(home_shard(followee.id)):
+            recent = db.session.execute(db.select(Post.id, Post.created_at).where(
+                Post.user_id == followee.id, Post.published.is_(True)
+            ).order_by(Post.created_at.desc()).limit(
+                current_app.config.get('TIMELINE_BACKFILL', 50)
+            )).all()
+        if recent:
+            db.session.execute(db.insert(TimelineEntry), [
+                {'user_id': follower.id, 'post_id': post_id, 'author_id': followee.id,
+                 'created_at': created_at}
+                for post_id, created_at in recent
+            ])
+    return True
+
+
+def unfollow(follower, followee):
+    """Stop ``follower`` following ``followee``; False if it did not. The caller commits."""
+    link = db.session.get(Follow, (follower.id, followee.id))
+    if link is None:
+        return False
+    db.session.delete(link)
+    followee.follower_count = User.follower_count - 1
+    db.session.execute(db.delete(TimelineEntry).where(
+        TimelineEntry.user_id == follower.id,
+        TimelineEntry.author_id == followee.id
+    ))
+    return True
+
+
+def timeline_page(user_id, before=None, limit=20):
+    """Newest-first ``(post_id, created_at)`` rows of a user's home timeline.
+
+    ``before`` is the ``(created_at, post_id)`` of the last row of the
+    previous page. Returns up to ``limit + 1`` rows so callers can tell
+    whether another page follows.
+    """
+    params = {'user_id': user_id, 'limit': limit + 1}
+    if before is not None:
+        params.update(before_params(before))
+    branches = [db.session.execute(
+        timeline_entries if before is None else timeline_entries_before, params
+    ).all()]
+
+    # Read-fanned authors are pulled from their shards, each branch limited
+    # on its own index before the merge
+    authors = defaultdict(list)
+    for author_id in db.session.scalars(read_fanned_followees, {'user_id': user_id}):
+        authors[home_shard(author_id)].append(author_id)
+    for shard, author_ids in authors.items():
+        with post_shards.using(shard):
+            branches.append(db.session.execute(
+                authors_published if before is None else authors_published_before,
+                {**params, 'author_ids': author_ids}
+            ).all())
+
+    rows, seen = [], set()
+    for row in heapq.merge(*branches, key=lambda row: (row[1], row[0]), reverse=True):
+        if row[0] not in seen:
+            seen.add(row[0])
+            rows.append(row)
+            if len(rows) > limit:
+                break
+    return rows
@@ -0,0 +1,137 @@
+"""In-process mirror of the revoked-token table.
+
+Every ``@jwt_required()`` request asks whether its token was revoked, so the
+answer has to come from memory rather than a query. Each worker keeps the
+revoked JTIs in a dict and the per-user "revoke all" cutoffs in another, and
+at most once every ``JWT_BLOCKLIST_REFRESH_SECONDS`` one request pulls just
+the rows appended since the last refresh.
+"""
+import threading
+import time
+from datetime import datetime, timezone
+
+from flask import current_app
+
+from app import db
+from app.models import RevokedToken
+
+# Issue time in milliseconds, added to every token we create: ``iat`` is whole
+# seconds, too coarse to order a token against a revoke-all in the same second
+ISSUED_AT_MS_CLAIM = 'iat_ms'
+
+
+def _timestamp(value):
+    """Naive UTC datetime -> unix seconds."""
+    return value.replace(tzinfo=timezone.utc).timestamp() if value else None
+
+
+def issue_time_claims():
+    """Extra claims for a new token: its issue time in milliseconds."""
+    return {ISSUED_AT_MS_CLAIM: int(time.time() * 1000)}
+
+
+def _issued_at(jwt_payload):
+    """When the token was issued, in unix seconds, as precisely as it says."""
+    issued_ms = jwt_payload.get(ISSUED_AT_MS_CLAIM)
+    if issued_ms is not None:
+        return issued_ms / 1000
+    # Tokens from before the claim existed count as issued at the start of
+    # their second, so a revoke-all later in that second still covers them
+    return jwt_payload.get('iat', 0)
+
+
+class TokenBlocklist:
+    """Revoked tokens for one app, checked in O(1) without touching the DB."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._jtis = {}              # jti -> expiry (unix seconds) or None
+        self._revoked_before = {}    # str(user_id) -> cutoff (unix seconds)
+        self._last_id = 0
+        self._next_refresh = 0.0
+        self.refresh_interval = 5.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.refresh_interval = app.config.get('JWT_BLOCKLIST_REFRESH_SECONDS', 5.0)
+        app.extensions['token_blocklist'] = self
+
+    def is_revoked(self, jwt_payload):
+        """Whether the decoded token has been revoked."""
+        if time.monotonic() >= self._next_refresh:
+            self.refresh()
+        if jwt_payload.get('jti') in self._jtis:
+            return True
+        cutoff = self._revoked_before.get(str(jwt_payload.get('sub')))
+        return cutoff is not None and _issued_at(jwt_payload) <= cutoff
+
+    def refresh(self):
+        """Pull revocations appended since the last refresh."""
+        # Only one thread refreshes; the others keep using the current state
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            rows = db.session.execute(
+                db.select(RevokedToken.id, RevokedToken.jti, RevokedToken.user_id,
+                          RevokedToken.revoked_at, RevokedToken.expires_at)
+                .where(RevokedToken.id > self._last_id)
+                .order_by(RevokedToken.id)
+            ).all()
+            for row in rows:
+                self._apply(row.jti, row.user_id, row.revoked_at, row.expires_at)
+                self._last_id = row.id
+            self._evict_expired()
+            self._next_refresh = time.monotonic() + self.refresh_interval
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Token blocklist refresh failed: {e}")
+        finally:
+            self._lock.release()
+
+    def revoke(self, jwt_payload):
+        """Revoke a single token (logout)."""
+        exp = jwt_payload.get('exp')
+        self._store(RevokedToken(
+            jti=jwt_payload['jti'],
+            user_id=int(jwt_payload['sub']),
+            expires_at=datetime.utcfromtimestamp(exp) if exp else None
+        ))
+
+    def revoke_all(self, user_id):
+        """Revoke every token issued to ``user_id`` so far."""
+        now = datetime.utcnow()
+        expires = current_app.config.get('JWT_ACCESS_TOKEN_EXPIRES')
+        self._store(RevokedToken(
+            user_id=int(user_id),
+            revoked_at=now,
+            # Once the longest-lived token issued before now has expired the
+            # cutoff is moot
+            expires_at=now + expires if expires else None
+        ))
+
+    def _store(self, row):
+        RevokedToken.query.filter(RevokedToken.expires_at < datetime.utcnow()).delete()
+        db.session.add(row)
+        db.session.commit()
+        # Apply locally right away; other workers pick it up on their next refresh
+        self._apply(row.jti, row.user_id, row.revoked_at, row.expires_at)
+
+    def _apply(self, jti, user_id, revoked_at, expires_at):
+        if jti:
+            self._jtis[jti] = _timestamp(expires_at)
+        else:
+            key = str(user_id)
+            cutoff = _timestamp(revoked_at)
+            self._revoked_before[key] = max(cutoff, self._revoked_before.get(key, cutoff))
+
+    def _evict_expired(self):
+        now = time.time()
+        for jti, exp in list(self._jtis.items()):
+            if exp is not None and exp < now:
+                self._jtis.pop(jti, None)
+
+
+def get_token_blocklist():
+    """The blocklist of the current app."""
+    return current_app.extensions['token_blocklist']
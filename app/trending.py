@@ -0,0 +1,133 @@
+"""Trending post scores.
+
+Scores use a "hot" ranking with time decay expressed as a bonus for newer
+posts instead of a penalty that grows with age::
+
+    score = log2(views + 1) + (created_at - SCORE_EPOCH) / half_life
+
+Doubling a post's views is worth as much as being one half-life newer. The
+order between two posts never changes as time passes, only when their views
+do, so scores only need recomputing for posts whose views, content or
+publish state changed since the last run. The feed then reads the indexed
+``post_stats.trending_score`` column in order.
+
+The watermark of the last run is kept in ``job_state`` and committed with
+the scores, so a restarted or recycled worker carries on from it instead
+of rescoring every post. The background refresh runs in whichever worker
+holds the job's lease, not in all of them.
+"""
+import math
+from datetime import datetime, timedelta
+
+from app import db
+from app.background import PeriodicTask, hold_lease, job_watermark, set_job_watermark
+from app.utils import upsert_statement
+
+SCORE_EPOCH = datetime(2020, 1, 1)
+
+# Re-scan this far behind the previous run so rows committed while it was
+# running are not missed; rescoring is idempotent
+WATERMARK_OVERLAP = timedelta(seconds=30)
+
+BATCH_SIZE = 500
+
+JOB_NAME = 'trending-refresh'
+
+# The lease outlives this many refresh intervals, so the worker holding it
+# keeps it between runs and another takes over soon after it goes away
+LEASE_INTERVALS = 3
+
+
+def trending_score(views, created_at, half_life_seconds):
+    """Hot score for a post with ``views`` views created at ``created_at``."""
+    age = (created_at - SCORE_EPOCH).total_seconds()
+    return math.log2((views or 0) + 1) + age / half_life_seconds
+
+
+class TrendingScorer:
+    """Incrementally recomputes ``PostStats.trending_score``."""
+
+    def __init__(self):
+        self.app = None
+        self.half_life_seconds = 12 * 3600
+        self._task = PeriodicTask(JOB_NAME, self._scheduled_refresh, 60.0)
+
+    def init_app(self, app):
+        self.app = app
+        self.half_life_seconds = app.config.get('TRENDING_HALF_LIFE_HOURS', 12) * 3600
+        self._task.interval = app.config.get('TRENDING_REFRESH_SECONDS', 60)
+        app.extensions['trending_scorer'] = self
+        app.before_request(self._task.ensure_started)
+
+    def _scheduled_refresh(self):
+        with self.app.app_context():
+            try:
+                leader = hold_lease(JOB_NAME, self._task.interval * LEASE_INTERVALS)
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"Trending refresh lease failed: {e}")
+                return
+        if leader:
+            self.refresh()
+
+    def refresh(self, full=False):
+        """Rescore posts changed since the previous run (all posts if ``full``).
+
+        Returns the number of posts rescored.
+        """
+        from app.sharding import scatter
+
+        started = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                since = None if full else job_watermark(JOB_NAME)
+                rescored = sum(scatter(lambda: self._refresh_shard(since)))
+                set_job_watermark(JOB_NAME, started - WATERMARK_OVERLAP)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.warning(f"Trending refresh failed: {e}")
+                return 0
+        return rescored
+
+    def _refresh_shard(self, since):
+        from app.models import Post, PostStats
+
+        if since is None:
+            post_ids = set(db.session.scalars(db.select(Post.id)))
+        else:
+            post_ids = set(db.session.scalars(
+                db.select(Post.id).where(Post.updated_at >= since)
+            ))
+            post_ids.update(db.session.scalars(
+                db.select(PostStats.post_id).where(PostStats.updated_at >= since)
+            ))
+
+        post_ids = sorted(post_ids)
+        for i in range(0, len(post_ids), BATCH_SIZE):
+            self._rescore(post_ids[i:i + BATCH_SIZE])
+        return len(post_ids)
+
+    def _rescore(self, post_ids):
+        from app.models import Post, PostStats
+
+        rows = db.session.execute(
+            db.select(Post.id, Post.created_at, Post.published, PostStats.views)
+            .outerjoin(PostStats, PostStats.post_id == Post.id)
+            .where(Post.id.in_(post_ids))
+        ).all()
+        scores = [{
+            'post_id': row.id,
+            'trending_score': (
+                trending_score(row.views, row.created_at, self.half_life_seconds)
+                if row.published and row.created_at else None
+            ),
+        } for row in rows]
+        if scores:
+            db.session.execute(upsert_statement(
+                PostStats, PostStats.post_id,
+                lambda excluded: {'trending_score': excluded.trending_score}
+            ), scores)
+
+
+trending_scorer = TrendingScorer()
@@ -2,9 +2,11 @@ import base64
 import hmac
 import hashlib
 import json
+import logging
 import os
 from datetime import datetime, timedelta, timezone
-import pdb  # For debugging purposes, can be removed in production
+
+logger = logging.getLogger(__name__)
 
 
 def _sign(data: bytes, secret: str) -> str:
@@ -45,6 +47,52 @@ def verify_timed_token(token: str, secret: str) -> dict | None:
         return None
 
 
+def upsert_statement(model, key, update):
+    """INSERT ... ON CONFLICT (key) DO UPDATE for SQLite and PostgreSQL.
+
+    ``update`` receives the ``excluded`` row and returns the SET clause.
+    Execute with a list of parameter dicts for a batched upsert.
+    """
+    from sqlalchemy.dialects import postgresql, sqlite
+    from app import db
+
+    # Models on another bind (the archive, a post shard) may use another dialect
+    dialect = db.session.get_bind(mapper=model).dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        raise RuntimeError(f'Upsert not supported on {dialect}')
+    insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+    stmt = insert(model)
+    return stmt.on_conflict_do_update(index_elements=[key], set_=update(stmt.excluded))
+
+
+def encode_cursor(created_at, post_id):
+    """Keyset pagination cursor for a ``(created_at, id)`` ordered feed."""
+    return f'{created_at.isoformat()}_{post_id}'
+
+
+def decode_cursor(cursor):
+    """``(created_at, id)`` from a feed cursor; raises ValueError if malformed."""
+    created_at, post_id = cursor.rsplit('_', 1)
+    return datetime.fromisoformat(created_at), int(post_id)
+
+
+def parse_ids(value, limit):
+    """Distinct ids from ``"1,2,3"`` in the order given; raises ValueError if malformed."""
+    ids = list(dict.fromkeys(int(part) for part in value.split(',') if part.strip()))
+    if not ids:
+        raise ValueError('ids must list at least one id')
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} ids per request')
+    return ids
+
+
+def _log_body(to_email, subject, body):
+    from flask import current_app, has_app_context
+
+    if has_app_context() and current_app.debug:
+        logger.debug('Email body: %s', subject, extra={'to': to_email, 'body': body})
+
+
 def send_email(to_email: str, subject: str, body: str) -> None:
     """Send email via SMTP. Supports Gmail if SMTP_* envs provided.
     Env:
@@ -54,7 +102,9 @@ def send_email(to_email: str, subject: str, body: str) -> None:
       SMTP_PASSWORD (app password)
       SMTP_USE_TLS ("1" to enable)
       FROM_EMAIL (optional display from)
-    Fallback: print to console.
+    Fallback: log that the message was not sent. Bodies carry live
+    verification and reset links, so they are never logged at INFO or above;
+    with ``app.debug`` on they are logged at DEBUG for local development.
     """
     smtp_host = os.environ.get('SMTP_HOST')
     smtp_user = os.environ.get('SMTP_USER')
@@ -62,9 +112,9 @@ def send_email(to_email: str, subject: str, body: str) -> None:
     smtp_port = int(os.environ.get('SMTP_PORT', '587'))
     smtp_use_tls = os.environ.get('SMTP_USE_TLS', '1') == '1'
     from_email = os.environ.get('FROM_EMAIL', smtp_user or 'no-reply@example.com')
-    pdb.set_trace()
     if not smtp_host or not smtp_user or not smtp_password:
-        print(f"[EMAIL:console] To: {to_email}\nSubject: {subject}\n\n{body}\n")
+        logger.info('Email not sent (SMTP not configured): %s', subject, extra={'to': to_email})
+        _log_body(to_email, subject, body)
         return
 
     import smtplib
@@ -83,9 +133,10 @@ def send_email(to_email: str, subject: str, body: str) -> None:
             server.starttls()
         server.login(smtp_user, smtp_password)
         server.sendmail(from_email, [to_email], msg.as_string())
-        print(f"[EMAIL:sent] to {to_email}")
-    except Exception as e:
-        print(f"[EMAIL:error] {e}. Falling back to console.\nTo: {to_email}\nSubject: {subject}\n\n{body}\n")
+        logger.info('Email sent: %s', subject, extra={'to': to_email})
+    except Exception:
+        logger.exception('Email not sent: %s', subject, extra={'to': to_email})
+        _log_body(to_email, subject, body)
     finally:
         try:
             if server:
@@ -0,0 +1,104 @@
+"""Write-behind post view counting.
+
+Recording a view only bumps a counter in process memory; a background thread
+folds the accumulated increments into ``post_stats`` with one batched upsert
+every ``VIEW_COUNTER_FLUSH_SECONDS`` or as soon as ``VIEW_COUNTER_MAX_PENDING``
+views are waiting. Reads therefore stay reads, and SQLite sees one short write
+transaction per flush instead of one per page view. With
+``VIEW_COUNTER_FLUSH_SECONDS=0`` there is no thread, and the view that fills
+the buffer flushes it.
+
+Counts already flushed are durable; at most one interval's worth of
+increments is lost if a worker dies without running its exit hook.
+"""
+import atexit
+import threading
+from collections import Counter
+from datetime import datetime
+
+from app import db
+from app.background import PeriodicTask
+from app.utils import upsert_statement
+
+
+class ViewCounter:
+    """Buffers view increments per post and flushes them in batches."""
+
+    def __init__(self):
+        self.app = None
+        self._pending = Counter()
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._task = PeriodicTask('view-counter-flush', self.flush, 10.0)
+        self.max_pending = 1000
+
+    def init_app(self, app):
+        self.app = app
+        self._task.interval = app.config.get('VIEW_COUNTER_FLUSH_SECONDS', 10.0)
+        self.max_pending = app.config.get('VIEW_COUNTER_MAX_PENDING', 1000)
+        app.extensions['view_counter'] = self
+        atexit.register(self.flush)
+
+    def record(self, post_id, count=1):
+        """Count a view of ``post_id``; touches the database only to flush a full buffer."""
+        self._task.ensure_started()
+        with self._lock:
+            self._pending[post_id] += count
+            self._pending_total += count
+            full = self._pending_total >= self.max_pending
+        if full:
+            if self._task.interval:
+                self._task.wake()
+            else:
+                # No flusher thread to hand the batch to
+                self.flush()
+
+    def pending(self, post_id):
+        """Views of ``post_id`` recorded by this process but not yet flushed."""
+        return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """Write all buffered increments in one batched upsert."""
+        with self._lock:
+            batch, self._pending = self._pending, Counter()
+            self._pending_total = 0
+        if not batch or self.app is None:
+            return 0
+
+        from app.models import Post, PostStats
+        from app.sharding import group_by_shard, post_shards
+
+        with self.app.app_context():
+            try:
+                written = 0
+                for shard, post_ids in group_by_shard(batch).items():
+                    with post_shards.using(shard):
+                        # Views of posts deleted meanwhile are dropped, not upserted
+                        existing = set(db.session.scalars(
+                            db.select(Post.id).where(Post.id.in_(post_ids))
+                        ))
+                        rows = [{'post_id': post_id, 'views': batch[post_id],
+                                 'updated_at': datetime.utcnow()}
+                                for post_id in post_ids if post_id in existing]
+                        if rows:
+                            db.session.execute(upsert_statement(
+                                PostStats, PostStats.post_id,
+                                lambda excluded: {'views': PostStats.views + excluded.views,
+                                                  'updated_at': excluded.updated_at}
+                            ), rows)
+                        written += len(rows)
+                db.session.commit()
+                return written
+            except Exception as e:
+                db.session.rollback()
+                self._requeue(batch)
+                self.app.logger.warning(f"View counter flush failed: {e}")
+                return 0
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._pending.update(batch)
+            self._pending_total += sum(batch.values())
+
+
+view_counter = ViewCounter()
@@ -0,0 +1,4 @@
+from app.asgi import create_asgi_app
+import os
+
+app = create_asgi_app(os.environ.get('FLASK_CONFIG') or 'default')
@@ -0,0 +1,104 @@
+"""Concurrency comparison: WSGI (gunicorn gthread) vs. ASGI (uvicorn) mode.
+
+Opens many simultaneous keep-alive connections (1000 by default) and has each
+one issue a few requests against a read endpoint, reporting throughput,
+latency percentiles and failed connections for both serving modes.
+
+Usage:
+    python benchmarks/asgi_concurrency.py [--connections 1000] [--requests-per-conn 5]
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from server_throughput import ROOT, seed, wait_ready
+
+CONTENT_LENGTH = re.compile(rb'content-length:\s*(\d+)', re.I)
+
+
+async def connection(port, path, count, latencies):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = f'GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode()
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            head = await reader.readuntil(b'\r\n\r\n')
+            await reader.readexactly(int(CONTENT_LENGTH.search(head).group(1)))
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def load(port, path, connections, count):
+    latencies = []
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(connection(port, path, count, latencies) for _ in range(connections)),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        print(f'  first failure: {errors[0]!r}')
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+        'failed': len(errors),
+    }
+
+
+def run_server(name, cmd, env, port, args):
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_ready(port)
+        result = asyncio.run(load(port, args.path, args.connections, args.requests_per_conn))
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+    print(f"{name:<28} {result['rps']:>9.1f} req/s   p50 {result['p50_ms']:>8.1f} ms   "
+          f"p99 {result['p99_ms']:>8.1f} ms   failed conns {result['failed']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connections', type=int, default=1000)
+    parser.add_argument('--requests-per-conn', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--path', default='/api/posts?per_page=10')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(env, args.posts)
+
+        print(f"GET {args.path}  connections={args.connections} "
+              f"requests/conn={args.requests_per_conn} workers={args.workers}")
+        run_server(f'wsgi gunicorn {args.threads}t', [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'run:app'
+        ], dict(env, GUNICORN_BIND='127.0.0.1:5103',
+                GUNICORN_WORKERS=str(args.workers),
+                GUNICORN_THREADS=str(args.threads),
+                GUNICORN_PIDFILE=os.path.join(tmp, 'gunicorn.pid'),
+                GUNICORN_ACCESS_LOG=os.devnull), 5103, args)
+        run_server('asgi uvicorn', [
+            sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1',
+            '--port', '5104', '--workers', str(args.workers), '--no-access-log',
+            '--backlog', str(max(2048, args.connections))
+        ], env, 5104, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Cost of the reads behind one page: per-item requests, multi-gets and /api/batch.
+
+Renders a page needing ``--posts`` posts and the profiles of their authors
+four ways, through the Flask test client on a throwaway SQLite database:
+
+* ``per item``  - one ``GET /api/posts/<id>`` and ``GET /api/users/<id>`` each;
+* ``multi-get`` - ``GET /api/posts?ids=...`` and ``GET /api/users?ids=...``;
+* ``batch``     - the per-item requests as sub-requests of one ``POST /api/batch``;
+* ``batch of multi-gets`` - the two multi-gets in one ``POST /api/batch``.
+
+Reports HTTP requests, SQL statements and time per page. The test client
+has no network in between, so the time saved per avoided request is a lower
+bound: over a real connection every request also pays its round-trip.
+
+Usage (posts plus authors must fit in one batch, ``BATCH_MAX_REQUESTS``):
+    python benchmarks/batch_reads.py [--posts 10] [--pages 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+        os.environ['VIEW_COUNTER_FLUSH_SECONDS'] = '0'
+        os.environ['POST_COMPRESS_BACKFILL_SECONDS'] = '0'
+        os.environ['SSE_NOTIFY_DIR'] = ''
+        os.environ['LOG_LEVEL'] = 'WARNING'
+        from flask_jwt_extended import create_access_token
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        from app import create_app, db
+        from app.models import Post, User
+
+        app = create_app()
+        rng = random.Random(9)
+        with app.app_context():
+            db.session.execute(db.insert(User), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com'} for i in range(args.users)
+            ])
+            db.session.execute(db.insert(Post), [
+                {'title': f'Post {i}', 'content': 'Body ' * 40, 'published': True,
+                 'user_id': rng.randint(1, args.users)}
+                for i in range(args.posts * 10)
+            ])
+            db.session.commit()
+            headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+            authors = dict(db.session.execute(db.select(Post.id, Post.user_id)).all())
+
+        statements = []
+        event.listen(Engine, 'before_cursor_execute', lambda *a: statements.append(1))
+        client = app.test_client()
+
+        def page_reads():
+            post_ids = rng.sample(sorted(authors), args.posts)
+            user_ids = list(dict.fromkeys(authors[post_id] for post_id in post_ids))
+            items = [f'/api/posts/{i}' for i in post_ids] + [f'/api/users/{i}' for i in user_ids]
+            multi = [f"/api/posts?ids={','.join(map(str, post_ids))}",
+                     f"/api/users?ids={','.join(map(str, user_ids))}"]
+            return items, multi
+
+        styles = {
+            'per item': lambda items, multi: [client.get(path, headers=headers) for path in items],
+            'multi-get': lambda items, multi: [client.get(path, headers=headers) for path in multi],
+            'batch': lambda items, multi: [client.post(
+                '/api/batch', json={'requests': [{'path': path} for path in items]}, headers=headers)],
+            'batch of multi-gets': lambda items, multi: [client.post(
+                '/api/batch', json={'requests': [{'path': path} for path in multi]}, headers=headers)],
+        }
+        results = []
+        for name, run in styles.items():
+            requests = 0
+            statements.clear()
+            began = time.perf_counter()
+            for _ in range(args.pages):
+                responses = run(*page_reads())
+                assert all(response.status_code == 200 for response in responses)
+                requests += len(responses)
+            elapsed = time.perf_counter() - began
+            results.append((name, requests / args.pages, len(statements) / args.pages,
+                            elapsed / args.pages * 1000))
+
+    print(f'{args.pages} pages of {args.posts} posts and their authors')
+    for name, requests, queries, ms in results:
+        print(f'  {name:20} {requests:5.1f} requests  {queries:5.1f} queries  {ms:6.2f} ms per page')
+
+
+if __name__ == '__main__':
+    main()
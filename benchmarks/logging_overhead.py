@@ -0,0 +1,113 @@
+"""Request latency with logging off, queued to the writer thread, and synchronous.
+
+Runs a request that goes through the OAuth account lookup (an existing user
+logging in again) and the console fallback of ``send_email`` -- the two paths
+that used to ``print()`` -- against a throwaway SQLite database, in three
+modes:
+
+* ``off``   - ``app`` loggers at WARNING: log calls return after a level check;
+* ``queue`` - DEBUG through the structured pipeline (``app/logs.py``): the
+  request thread only enqueues records, a background thread writes JSON;
+* ``sync``  - the same records formatted and written on the request thread,
+  as the old ``print()`` calls were.
+
+stderr is redirected to a file for the run (or a pipe drained slowly with
+``--slow-sink``, standing in for a log collector that falls behind).
+
+Usage:
+    python benchmarks/logging_overhead.py [--requests 2000] [--slow-sink]
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1000,
+            samples[int(len(samples) * 0.99) - 1] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--slow-sink', action='store_true',
+                        help='write logs to a pipe read 512 bytes every 10 ms')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+        os.environ['SSE_NOTIFY_DIR'] = ''
+        from flask import g
+        from app import create_app, db
+        from app.logs import JsonFormatter, log_pipeline
+        from app.oauth_handler import OAuthHandler
+        from app.utils import send_email
+
+        app = create_app()
+        user_data = {'id': '4242', 'email': 'bench@example.com', 'username': 'bench',
+                     'name': 'Bench User', 'token': {'access_token': 'x'}}
+
+        @app.route('/bench/login')
+        def bench_login():
+            user, _ = OAuthHandler.find_or_create_user('github', user_data)
+            send_email(user.email, 'Welcome back', 'Someone signed in to your account.')
+            return 'ok'
+
+        class SyncHandler(logging.StreamHandler):
+            def emit(self, record):
+                record.request_id = g.get('request_id')
+                super().emit(record)
+
+        sync_handler = SyncHandler(sys.stderr)
+        sync_handler.setFormatter(JsonFormatter())
+        root, app_logger = logging.getLogger(), logging.getLogger('app')
+
+        saved_stderr = os.dup(2)
+        if args.slow_sink:
+            read_fd, write_fd = os.pipe()
+            os.dup2(write_fd, 2)
+
+            def drain():
+                while os.read(read_fd, 512):
+                    time.sleep(0.01)
+            threading.Thread(target=drain, daemon=True).start()
+        else:
+            sink = open(os.path.join(tmp, 'log.jsonl'), 'w')
+            os.dup2(sink.fileno(), 2)
+
+        client = app.test_client()
+        client.get('/bench/login')
+        results = {}
+        try:
+            for mode in ('off', 'queue', 'sync'):
+                app_logger.setLevel(logging.WARNING if mode == 'off' else logging.DEBUG)
+                root.handlers = [sync_handler if mode == 'sync' else log_pipeline.handler]
+                samples = []
+                for _ in range(args.requests):
+                    began = time.perf_counter()
+                    client.get('/bench/login')
+                    samples.append(time.perf_counter() - began)
+                # Let the writer catch up before the next mode
+                while not log_pipeline.handler.queue.empty():
+                    time.sleep(0.01)
+                results[mode] = percentiles(samples)
+        finally:
+            sys.stderr.flush()
+            os.dup2(saved_stderr, 2)
+
+        print(f"{args.requests} logins per mode, sink: {'slow pipe' if args.slow_sink else 'file'}")
+        for mode, (p50, p99) in results.items():
+            print(f"  {mode:6} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
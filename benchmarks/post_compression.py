@@ -0,0 +1,147 @@
+"""Database size and get_post cost with post bodies stored raw, zlib or zstd.
+
+Seeds a throwaway SQLite database per codec with the same posts (mostly
+short, some long-form, generated from a fixed word list with light markdown),
+VACUUMs it and reports the file size, then times ``GET /api/posts/<id>``
+through the Flask test client and the bare decompression of the stored
+bodies. Each codec runs in its own process, since the database URL is read
+when ``config`` is imported.
+
+Usage:
+    python benchmarks/post_compression.py [--posts 5000] [--reads 2000]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ('the of and to in is that for it as with was on be by this are from at or an have not '
+         'which one all were we when there can been has more if will would their what about '
+         'database query index request worker cache latency server client python flask model '
+         'schema table column session thread process memory storage network deploy release '
+         'feature review commit branch merge test build config token user post feed tag').split()
+
+
+def body(rng):
+    roll = rng.random()
+    size = (rng.randint(200, 1000) if roll < 0.6 else
+            rng.randint(2000, 8000) if roll < 0.9 else
+            rng.randint(20000, 60000))
+    parts, length = [], 0
+    while length < size:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + '.'
+        if rng.random() < 0.05:
+            sentence = f'\n\n## {sentence[:40]}\n\n'
+        elif rng.random() < 0.05:
+            sentence = f'\n\n```python\nresult = {rng.choice(WORDS)}({rng.randint(0, 999)})\n```\n\n'
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return ' '.join(parts)
+
+
+def percentile_ms(samples, q=0.5):
+    samples = sorted(samples)
+    return (statistics.median(samples) if q == 0.5 else samples[int(len(samples) * q) - 1]) * 1000
+
+
+def run(codec_name, posts, reads, path):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['POST_COMPRESSION'] = codec_name
+    os.environ['POST_COMPRESS_BACKFILL_SECONDS'] = '0'
+    os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+    os.environ['VIEW_COUNTER_FLUSH_SECONDS'] = '0'
+    os.environ['SSE_NOTIFY_DIR'] = ''
+    os.environ['LOG_LEVEL'] = 'WARNING'
+    from app import create_app, db
+    from app.compression import codec
+    from app.models import Post, User
+
+    app = create_app()
+    rng = random.Random(7)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com')
+        db.session.add(user)
+        db.session.flush()
+        db.session.execute(db.insert(Post), [
+            {'title': f'Post {i}', 'content': body(rng), 'published': True, 'user_id': user.id}
+            for i in range(posts)
+        ])
+        db.session.commit()
+        # Read the stored form, bypassing the column type
+        stored = db.session.execute(db.text('SELECT id, content FROM post')).all()
+        sizes = {row.id: len(row.content.encode() if isinstance(row.content, str)
+                             else codec.decompress(row.content).encode()) for row in stored}
+        raw_bytes = sum(sizes.values())
+        long_ids = [post_id for post_id, size in sizes.items() if size >= 20000]
+        db.session.execute(db.text('VACUUM'))
+        db.session.remove()
+
+        blobs = [row.content for row in stored if isinstance(row.content, bytes)]
+        began = time.perf_counter()
+        for blob in blobs:
+            codec.decompress(blob)
+        decode_us = (time.perf_counter() - began) / len(blobs) * 1e6 if blobs else None
+
+    client = app.test_client()
+    ids = [rng.randint(1, posts) for _ in range(reads)]
+    long_ids = [rng.choice(long_ids) for _ in range(reads)] if long_ids else []
+    timings = {}
+    for label, sample in (('all', ids), ('long', long_ids)):
+        samples = []
+        for post_id in sample:
+            began = time.perf_counter()
+            client.get(f'/api/posts/{post_id}')
+            samples.append(time.perf_counter() - began)
+        timings[label] = samples
+    print(json.dumps({
+        'codec': codec.algorithm,
+        'file_mb': os.path.getsize(path) / 2 ** 20,
+        'raw_mb': raw_bytes / 2 ** 20,
+        'compressed_rows': len(blobs),
+        'decode_us': decode_us,
+        'get_p50': percentile_ms(timings['all']),
+        'get_p99': percentile_ms(timings['all'], 0.99),
+        'get_long_p50': percentile_ms(timings['long']) if timings['long'] else None,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=5000)
+    parser.add_argument('--reads', type=int, default=2000)
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        return run(args.run, args.posts, args.reads, args.db)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for codec_name in ('none', 'zlib', 'zstd'):
+            out = subprocess.run(
+                [sys.executable, __file__, '--run', codec_name, '--posts', str(args.posts),
+                 '--reads', str(args.reads), '--db', os.path.join(tmp, f'{codec_name}.db')],
+                cwd=ROOT, check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+
+    print(f"{args.posts} posts ({results[0]['raw_mb']:.1f} MiB of text), {args.reads} reads per codec")
+    base = results[0]['file_mb']
+    for r in results:
+        decode = f"{r['decode_us']:6.1f} us" if r['decode_us'] is not None else '      -  '
+        print(f"  {r['codec']:5} db {r['file_mb']:6.1f} MiB ({r['file_mb'] / base:6.1%})  "
+              f"{r['compressed_rows']:5} compressed, decode {decode}/row  "
+              f"get_post p50 {r['get_p50']:.3f} ms  p99 {r['get_p99']:.3f} ms  "
+              f"20KB+ posts p50 {r['get_long_p50']:.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Revision history size and rebuild time under editor autosave.
+
+Creates one long post on a throwaway SQLite database and edits it the way
+an autosaving editor does - a few words typed or deleted at a time - once
+through ``PATCH`` with ``content_delta`` and once more through full ``PUT``
+bodies on a second post. Reports the request payload per save, the time per
+save, the bytes stored in ``post_revision`` against keeping every version
+whole, and the time to rebuild random versions.
+
+Usage:
+    python benchmarks/post_revisions.py [--edits 500] [--size 20000]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORDS = ('the of and to in is that for it as with was on be by this are from at or an have not '
+         'database query index request worker cache latency server client python flask model').split()
+
+
+def text(rng, size):
+    words = []
+    while sum(map(len, words)) + len(words) < size:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words)
+
+
+def edit(rng, content):
+    """A small autosave-sized edit: ``(delta, new_content)``."""
+    at = rng.randint(0, len(content))
+    removed = min(rng.choice((0, 0, 3, 12)), len(content) - at)
+    typed = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 6)))
+    delta = ([at] if at else []) + ([-removed] if removed else []) + ([typed] if typed else [])
+    return delta, content[:at] + typed + content[at + removed:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--edits', type=int, default=500)
+    parser.add_argument('--size', type=int, default=20000)
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+        os.environ['VIEW_COUNTER_FLUSH_SECONDS'] = '0'
+        os.environ['POST_COMPRESS_BACKFILL_SECONDS'] = '0'
+        os.environ['DUPLICATE_POLICY'] = 'off'
+        os.environ['SSE_NOTIFY_DIR'] = ''
+        os.environ['LOG_LEVEL'] = 'WARNING'
+        from flask_jwt_extended import create_access_token
+        from app import create_app, db
+        from app.models import PostRevision, User
+        from app.revisions import get_revision
+
+        app = create_app()
+        client = app.test_client()
+        rng = random.Random(5)
+        with app.app_context():
+            db.session.add(User(username='bench', email='bench@example.com'))
+            db.session.commit()
+            headers = {'Authorization': f'Bearer {create_access_token(identity=1)}'}
+        body = text(rng, args.size)
+        post_ids = [client.post('/api/posts', json={'title': 'Draft', 'content': body},
+                                headers=headers).get_json()['id'] for _ in range(2)]
+
+        results, whole_bytes = {}, 0
+        for post_id, style in zip(post_ids, ('PATCH', 'PUT')):
+            content, version, sent, timings = body, 1, 0, []
+            edit_rng = random.Random(11)
+            for _ in range(args.edits):
+                delta, content = edit(edit_rng, content)
+                if style == 'PATCH':
+                    payload, send = {'version': version, 'content_delta': delta}, client.patch
+                else:
+                    payload, send = {'content': content}, client.put
+                data = json.dumps(payload)
+                began = time.perf_counter()
+                response = send(f'/api/posts/{post_id}', data=data, headers=headers,
+                                content_type='application/json')
+                timings.append(time.perf_counter() - began)
+                version = response.get_json()['version']
+                sent += len(data)
+                if style == 'PATCH':
+                    whole_bytes += len(content.encode())
+            results[style] = (sent / args.edits, statistics.median(timings) * 1000)
+
+        with app.app_context():
+            stored = db.session.scalar(db.select(db.func.sum(db.func.length(PostRevision.data)))
+                                       .where(PostRevision.post_id == post_ids[0]))
+            versions = [rng.randint(1, args.edits + 1) for _ in range(args.reads)]
+            rebuilds = []
+            for version in versions:
+                began = time.perf_counter()
+                get_revision(post_ids[0], version)
+                rebuilds.append(time.perf_counter() - began)
+                db.session.expunge_all()
+            interval = app.config['POST_REVISION_SNAPSHOT_INTERVAL']
+
+    print(f'{args.edits} autosaves of a {args.size // 1000} KB post, snapshot every {interval} versions')
+    for style, (payload, p50) in results.items():
+        print(f'  {style:5} {payload:9.0f} B sent per save   p50 {p50:.2f} ms per save')
+    print(f'  history: {stored / 1024:.1f} KiB stored vs {whole_bytes / 1024:.1f} KiB as whole versions '
+          f'({stored / whole_bytes:.2%})')
+    rebuilds.sort()
+    print(f'  rebuild a random version: p50 {statistics.median(rebuilds) * 1000:.2f} ms  '
+          f'p99 {rebuilds[int(len(rebuilds) * 0.99) - 1] * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Per-request query-construction overhead: inline queries vs prebuilt statements.
+
+For each hot path, times the query as it used to be written
+(``User.query.filter_by(email=...).first()``, ``Post.query...paginate()``)
+against the prebuilt statement from ``app/statements.py`` that replaced it,
+on a throwaway SQLite database:
+
+* ``build`` - constructing the statement and its compiled-cache key, the
+  Python work done before SQLAlchemy can even look up the compiled SQL
+  (for a prebuilt statement the key is memoised, so this is a lookup);
+* ``call``  - the whole call, database round-trip and ORM loading included.
+
+Also prints the compiled-cache hit/miss counts seen during each style.
+
+Usage:
+    python benchmarks/query_construction.py [--calls 5000] [--posts 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def per_call_us(func, calls):
+    func()
+    began = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter() - began) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+        os.environ['VIEW_COUNTER_FLUSH_SECONDS'] = '0'
+        os.environ['POST_COMPRESS_BACKFILL_SECONDS'] = '0'
+        os.environ['SSE_NOTIFY_DIR'] = ''
+        os.environ['LOG_LEVEL'] = 'WARNING'
+        from app import create_app, db, statements
+        from app.models import Post, Tag, User
+        from app.sharding import paginate_author, paginate_newest, posts_by_ids
+        from app.statements import statement_cache
+
+        app = create_app()
+        rng = random.Random(3)
+        with app.app_context():
+            db.session.execute(db.insert(User), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com'} for i in range(args.users)
+            ])
+            db.session.execute(db.insert(Post), [
+                {'title': f'Post {i}', 'content': 'Body ' * 40, 'published': rng.random() < 0.9,
+                 'user_id': rng.randint(1, args.users)}
+                for i in range(args.posts)
+            ])
+            db.session.execute(db.insert(Tag), [{'name': f'tag{i}'} for i in range(50)])
+            db.session.commit()
+
+            email = f'user{args.users // 2}@example.com'
+            author = args.users // 2
+            ids = rng.sample(range(1, args.posts + 1), 20)
+            paths = [
+                ('user by email',
+                 lambda: User.query.filter_by(email=email).limit(1).statement,
+                 lambda: User.query.filter_by(email=email).first(),
+                 lambda: statements.user_by_email,
+                 lambda: db.session.scalars(statements.user_by_email, {'email': email}).first()),
+                ('tag by name',
+                 lambda: Tag.query.filter_by(name='tag7').limit(1).statement,
+                 lambda: Tag.query.filter_by(name='tag7').first(),
+                 lambda: statements.tag_by_name,
+                 lambda: db.session.scalars(statements.tag_by_name, {'name': 'tag7'}).first()),
+                ('feed page',
+                 lambda: Post.query.filter_by(published=True).order_by(Post.created_at.desc())
+                 .limit(10).offset(10).statement,
+                 lambda: Post.query.filter_by(published=True).order_by(Post.created_at.desc())
+                 .paginate(page=2, per_page=10, error_out=False).items,
+                 lambda: statements.published_feed,
+                 lambda: paginate_newest(page=2, per_page=10).items),
+                ('author page',
+                 lambda: Post.query.filter_by(user_id=author).order_by(Post.created_at.desc())
+                 .limit(10).offset(0).statement,
+                 lambda: Post.query.filter_by(user_id=author).order_by(Post.created_at.desc())
+                 .paginate(page=1, per_page=10, error_out=False).items,
+                 lambda: statements.author_posts,
+                 lambda: paginate_author(author, page=1, per_page=10).items),
+                ('posts by ids',
+                 lambda: Post.query.filter(Post.id.in_(ids)).statement,
+                 lambda: Post.query.filter(Post.id.in_(ids)).all(),
+                 lambda: statements.posts_by_ids,
+                 lambda: posts_by_ids(ids)),
+            ]
+
+            results, cache = [], {}
+            for style in ('inline', 'prebuilt'):
+                statement_cache.reset()
+                for name, inline_build, inline_call, prebuilt_build, prebuilt_call in paths:
+                    build, call = ((inline_build, inline_call) if style == 'inline'
+                                   else (prebuilt_build, prebuilt_call))
+                    build_us = per_call_us(lambda: build()._generate_cache_key(), args.calls)
+                    call_us = per_call_us(lambda: (call(), db.session.expunge_all()), args.calls)
+                    results.append((name, style, build_us, call_us))
+                cache[style] = statement_cache.status()
+
+    print(f'{args.calls} calls per path, {args.posts} posts')
+    print(f"  {'path':14} {'style':9} {'build':>10} {'call':>10}")
+    for name, style, build_us, call_us in sorted(results, key=lambda r: r[0]):
+        print(f'  {name:14} {style:9} {build_us:7.1f} us {call_us:7.1f} us')
+    for style, status in cache.items():
+        print(f"  {style:9} compiled cache: {status['hits']} hits, {status['misses']} misses")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Related-posts index build time.
+
+Seeds a throwaway SQLite database with synthetic posts (Zipf-distributed
+vocabulary, a few hundred words each), then times a full index build split
+into TF-IDF vectorisation, top-k similarity search and the complete
+``index_related_posts`` run including writes. Finishes with an incremental
+run after editing a handful of posts.
+
+Usage:
+    python benchmarks/related_index.py [--posts 100000] [--words 200]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(label, func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    print(f"{label:<32} {time.perf_counter() - start:>8.2f} s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100_000)
+    parser.add_argument('--words', type=int, default=200, help='words per post')
+    parser.add_argument('--vocabulary', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+        from app import create_app, db
+        from app.models import Post, User
+        from app.related import _published_documents, build_matrix, index_related_posts, top_neighbours
+
+        app = create_app()
+        rng = random.Random(42)
+        vocabulary = [f'term{i}' for i in range(args.vocabulary)]
+        weights = [1.0 / (rank + 1) for rank in range(args.vocabulary)]
+        created = datetime.utcnow() - timedelta(days=365)
+
+        with app.app_context():
+            user = User(username='bench', email='bench@example.com')
+            db.session.add(user)
+            db.session.flush()
+            for start in range(0, args.posts, 5000):
+                db.session.execute(db.insert(Post), [{
+                    'title': ' '.join(rng.choices(vocabulary, weights, k=6)),
+                    'content': ' '.join(rng.choices(vocabulary, weights, k=args.words)),
+                    'published': True,
+                    'user_id': user.id,
+                    'created_at': created,
+                    'updated_at': created,
+                } for _ in range(start, min(start + 5000, args.posts))])
+            db.session.commit()
+            print(f"{args.posts} posts, {args.words} words each, vocabulary {args.vocabulary}")
+
+            post_ids, matrix = timed('vectorize (tf-idf)', build_matrix, _published_documents(),
+                                     max_df=app.config['RELATED_POSTS_MAX_DF'],
+                                     max_terms=app.config['RELATED_POSTS_MAX_TERMS'])
+            print(f"  matrix {matrix.shape[0]} x {matrix.shape[1]}, nnz {matrix.nnz}")
+            timed('top-k similarity', lambda: sum(1 for _ in top_neighbours(
+                matrix, range(matrix.shape[0]), app.config['RELATED_POSTS_TOP_K']))
+            )
+            timed('full index build (with writes)', index_related_posts, full=True)
+
+            for post in Post.query.order_by(Post.id).limit(10):
+                post.content += ' edited'
+            db.session.commit()
+            timed('incremental (10 edited posts)', index_related_posts)
+
+
+if __name__ == '__main__':
+    main()
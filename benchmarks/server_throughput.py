@@ -0,0 +1,133 @@
+"""Throughput comparison: Flask development server vs. gunicorn.
+
+Starts each server against a throwaway SQLite database seeded with posts,
+then hammers an endpoint from a pool of client threads and reports
+requests/second and latency percentiles.
+
+Usage:
+    python benchmarks/server_throughput.py [--requests 2000] [--concurrency 32]
+"""
+import argparse
+import http.client
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(env, posts):
+    code = (
+        "from app import create_app, db\n"
+        "from app.models import User, Post\n"
+        "app = create_app()\n"
+        "with app.app_context():\n"
+        "    u = User(username='bench', email='bench@example.com')\n"
+        "    db.session.add(u); db.session.flush()\n"
+        f"    db.session.add_all([Post(title=f'Post {{i}}', content='x' * 500, published=True, user_id=u.id) for i in range({posts})])\n"
+        "    db.session.commit()\n"
+    )
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+
+
+def wait_ready(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/health')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def load(port, path, total, concurrency):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = total // concurrency
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                conn.getresponse().read()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # The dev server does not keep connections alive
+                conn.close()
+                conn.request('GET', path)
+                conn.getresponse().read()
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def run_server(name, cmd, env, port, args):
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_ready(port)
+        load(port, args.path, args.concurrency * 5, args.concurrency)  # warm-up
+        result = load(port, args.path, args.requests, args.concurrency)
+    finally:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait()
+    print(f"{name:<28} {result['rps']:>10.1f} req/s   "
+          f"p50 {result['p50_ms']:>7.2f} ms   p99 {result['p99_ms']:>7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--path', default='/api/posts?per_page=10')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(env, args.posts)
+
+        print(f"GET {args.path}  requests={args.requests} concurrency={args.concurrency}")
+        run_server('flask dev server', [
+            sys.executable, '-c',
+            "from run import app; app.run(host='127.0.0.1', port=5101, threaded=True)"
+        ], env, 5101, args)
+        run_server(f'gunicorn {args.workers}w x {args.threads}t', [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'run:app'
+        ], dict(env, GUNICORN_BIND='127.0.0.1:5102',
+                GUNICORN_WORKERS=str(args.workers),
+                GUNICORN_THREADS=str(args.threads),
+                GUNICORN_PIDFILE=os.path.join(tmp, 'gunicorn.pid'),
+                GUNICORN_ACCESS_LOG=os.devnull), 5102, args)
+
+
+if __name__ == '__main__':
+    main()
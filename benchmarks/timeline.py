@@ -0,0 +1,132 @@
+"""Home timeline read latency and publish fan-out cost.
+
+Seeds a throwaway SQLite database with one author followed by ``--followers``
+users, each of whom also follows a few regular authors with a history of
+posts. Then times:
+
+* publishing one post by the big author with fan-out-on-write (one timeline
+  row per follower) and with fan-out-on-read (no timeline writes);
+* reading first and deeper pages of a follower's timeline in both modes.
+
+Usage:
+    python benchmarks/timeline.py [--followers 10000] [--reads 500]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (statistics.median(samples) * 1000,
+            samples[int(len(samples) * 0.99) - 1] * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--followers', type=int, default=10_000)
+    parser.add_argument('--authors', type=int, default=200, help='regular authors')
+    parser.add_argument('--posts-per-author', type=int, default=20)
+    parser.add_argument('--follows', type=int, default=10, help='regular authors followed per user')
+    parser.add_argument('--publishes', type=int, default=20)
+    parser.add_argument('--reads', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+        os.environ['SSE_NOTIFY_DIR'] = ''
+        os.environ['TIMELINE_FANOUT_MAX_FOLLOWERS'] = str(args.followers)
+        from app import create_app, db
+        from app.models import Follow, Post, TimelineEntry, User
+        from app.timeline import timeline_page
+
+        app = create_app()
+        rng = random.Random(42)
+        start = datetime.utcnow() - timedelta(days=30)
+
+        with app.app_context():
+            total_users = 1 + args.authors + args.followers
+            db.session.execute(db.insert(User), [
+                {'username': f'user{i}', 'email': f'user{i}@example.com'}
+                for i in range(1, total_users + 1)
+            ])
+            big, authors = 1, range(2, 2 + args.authors)
+            followers = range(2 + args.authors, total_users + 1)
+
+            posts = [{
+                'title': f'post {a}-{n}', 'content': 'lorem ipsum', 'published': True,
+                'user_id': a, 'created_at': start + timedelta(seconds=rng.randrange(30 * 86400)),
+            } for a in authors for n in range(args.posts_per_author)]
+            db.session.execute(db.insert(Post), posts)
+            db.session.flush()
+            by_author = {}
+            for post_id, author_id, created_at in db.session.execute(
+                    db.select(Post.id, Post.user_id, Post.created_at)):
+                by_author.setdefault(author_id, []).append((post_id, created_at))
+
+            follows, entries = [], []
+            for user_id in followers:
+                follows.append({'follower_id': user_id, 'followee_id': big})
+                for author_id in rng.sample(list(authors), args.follows):
+                    follows.append({'follower_id': user_id, 'followee_id': author_id})
+                    entries.extend({'user_id': user_id, 'post_id': post_id, 'author_id': author_id,
+                                    'created_at': created_at}
+                                   for post_id, created_at in by_author[author_id])
+            db.session.execute(db.insert(Follow), follows)
+            for i in range(0, len(entries), 50_000):
+                db.session.execute(db.insert(TimelineEntry), entries[i:i + 50_000])
+            db.session.execute(db.update(User).where(User.id == big).values(follower_count=args.followers))
+            db.session.commit()
+            print(f"{args.followers} followers of one author, {args.authors} regular authors, "
+                  f"{len(entries)} timeline rows")
+
+            def publish(n):
+                samples = []
+                for i in range(n):
+                    began = time.perf_counter()
+                    db.session.add(Post(title=f'big {i}', content='news', published=True, user_id=big))
+                    db.session.commit()
+                    samples.append(time.perf_counter() - began)
+                return samples
+
+            def read(user_ids):
+                first, deep = [], []
+                for user_id in user_ids:
+                    began = time.perf_counter()
+                    rows = timeline_page(user_id, None, 20)
+                    first.append(time.perf_counter() - began)
+                    cursor = (rows[-2].created_at, rows[-2].post_id)
+                    for _ in range(4):
+                        rows = timeline_page(user_id, cursor, 20)
+                        cursor = (rows[-2].created_at, rows[-2].post_id)
+                    began = time.perf_counter()
+                    timeline_page(user_id, cursor, 20)
+                    deep.append(time.perf_counter() - began)
+                return first, deep
+
+            readers = rng.sample(list(followers), min(args.reads, args.followers))
+            for mode in ('fan-out-on-write', 'fan-out-on-read'):
+                if mode == 'fan-out-on-read':
+                    db.session.execute(db.delete(TimelineEntry).where(TimelineEntry.author_id == big))
+                    db.session.execute(db.update(User).where(User.id == big).values(fanout_on_read=True))
+                    db.session.commit()
+                p50, p99 = percentiles(publish(args.publishes))
+                print(f"{mode}")
+                print(f"  publish (commit)          p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+                first, deep = read(readers)
+                p50, p99 = percentiles(first)
+                print(f"  timeline page 1           p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+                p50, p99 = percentiles(deep)
+                print(f"  timeline page 6 (cursor)  p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
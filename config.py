@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -8,8 +9,158 @@ class Config:
     """Base configuration class."""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key'
+    # How often each worker pulls new revocations into its in-memory blocklist
+    JWT_BLOCKLIST_REFRESH_SECONDS = float(os.environ.get('JWT_BLOCKLIST_REFRESH_SECONDS', '5'))
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///blog.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Compiled SQL kept per engine; the hot statements in app/statements.py
+    # take their values as parameters, so each needs one entry
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'query_cache_size': int(os.environ.get('SQLALCHEMY_QUERY_CACHE_SIZE', '500')),
+    }
+    # Post shards besides the main database (shard 0), e.g.
+    # "sqlite:///shard1.db,sqlite:///shard2.db"; see app/sharding.py
+    POST_SHARD_URLS = [url for url in os.environ.get('POST_SHARD_URLS', '').split(',') if url]
+    # Cold storage for archived posts: the main database unless set, e.g. to
+    # a separate SQLite file (sqlite:///archive.db)
+    SQLALCHEMY_BINDS = {
+        'archive': os.environ.get('ARCHIVE_DATABASE_URL') or SQLALCHEMY_DATABASE_URI,
+        **{f'post_shard_{n}': url for n, url in enumerate(POST_SHARD_URLS, 1)},
+    }
+    
+    # ASGI mode (asgi.py): async engine for the read endpoints, derived from
+    # SQLALCHEMY_DATABASE_URI when unset, and threads for the WSGI fallback
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+    ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', '10'))
+    
+    # Post view counting: flush buffered views every N seconds or once this
+    # many are waiting, whichever comes first; 0 seconds flushes only when full
+    VIEW_COUNTER_FLUSH_SECONDS = float(os.environ.get('VIEW_COUNTER_FLUSH_SECONDS', '10'))
+    VIEW_COUNTER_MAX_PENDING = int(os.environ.get('VIEW_COUNTER_MAX_PENDING', '1000'))
+    
+    # Trending feed: a post one half-life newer ranks like one with twice the
+    # views; TRENDING_REFRESH_SECONDS=0 leaves rescoring to `flask trending-refresh`
+    TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '12'))
+    TRENDING_REFRESH_SECONDS = float(os.environ.get('TRENDING_REFRESH_SECONDS', '60'))
+    
+    # Related posts index (`flask related-index`): neighbours kept per post,
+    # document-frequency bounds for terms that count towards similarity and
+    # the number of heaviest terms kept per post
+    RELATED_POSTS_TOP_K = int(os.environ.get('RELATED_POSTS_TOP_K', '5'))
+    RELATED_POSTS_MIN_DF = int(os.environ.get('RELATED_POSTS_MIN_DF', '2'))
+    RELATED_POSTS_MAX_DF = float(os.environ.get('RELATED_POSTS_MAX_DF', '0.1'))
+    RELATED_POSTS_MAX_TERMS = int(os.environ.get('RELATED_POSTS_MAX_TERMS', '24'))
+    
+    # Near-duplicate detection on post writes: 'reject' (409), 'flag' (store
+    # and record duplicate_of) or 'off'; similarity is estimated Jaccard
+    DUPLICATE_POLICY = os.environ.get('DUPLICATE_POLICY', 'flag')
+    DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', '0.8'))
+    DUPLICATE_MAX_CANDIDATES = int(os.environ.get('DUPLICATE_MAX_CANDIDATES', '50'))
+    
+    # Delta sync: hold back changes this recent (guards against out-of-order
+    # commits on PostgreSQL; 0 is fine on SQLite) and log retention
+    CHANGE_FEED_SETTLE_SECONDS = float(os.environ.get('CHANGE_FEED_SETTLE_SECONDS', '0'))
+    CHANGE_LOG_RETENTION_DAYS = int(os.environ.get('CHANGE_LOG_RETENTION_DAYS', '30'))
+    
+    # Server-Sent Events: fallback poll interval, per-client buffer (events),
+    # heartbeat and the directory used to wake other workers ('' disables)
+    SSE_POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', '5'))
+    SSE_CLIENT_BUFFER = int(os.environ.get('SSE_CLIENT_BUFFER', '100'))
+    SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+    SSE_NOTIFY_DIR = os.environ.get('SSE_NOTIFY_DIR', os.path.join(tempfile.gettempdir(), 'blog-post-events'))
+    # Open streams per worker (0 for no limit); each holds a thread, so keep
+    # this below GUNICORN_THREADS / ASGI_WSGI_THREADS
+    SSE_MAX_CLIENTS = int(os.environ.get('SSE_MAX_CLIENTS', '2'))
+    
+    # Home timelines: authors with more followers than this are merged in at
+    # read time instead of fanned out; posts copied to a new follower
+    TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.environ.get('TIMELINE_FANOUT_MAX_FOLLOWERS', '10000'))
+    TIMELINE_BACKFILL = int(os.environ.get('TIMELINE_BACKFILL', '50'))
+    
+    # Image uploads: storage folder (default <instance>/uploads), per-file
+    # limit, thumbnail edge sizes, thumbnail worker processes, and an optional
+    # nginx internal location to hand file responses to (X-Accel-Redirect)
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER')
+    UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+    THUMBNAIL_SIZES = tuple(int(s) for s in os.environ.get('THUMBNAIL_SIZES', '128,512').split(','))
+    MEDIA_THUMBNAIL_WORKERS = int(os.environ.get('MEDIA_THUMBNAIL_WORKERS', '2'))
+    MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+    
+    # Public site (post links in feeds and sitemaps), feed length, sitemap
+    # shard size, how often cached documents are checked against the change
+    # log, and the Cache-Control max-age sent with them
+    SITE_URL = os.environ.get('SITE_URL', 'http://localhost:3000')
+    SITE_NAME = os.environ.get('SITE_NAME', 'Flask Blog')
+    FEED_SIZE = int(os.environ.get('FEED_SIZE', '50'))
+    SITEMAP_SHARD_SIZE = int(os.environ.get('SITEMAP_SHARD_SIZE', '10000'))
+    FEED_CHECK_SECONDS = float(os.environ.get('FEED_CHECK_SECONDS', '1'))
+    FEED_MAX_AGE = int(os.environ.get('FEED_MAX_AGE', '300'))
+    
+    # Posts neither created nor updated for this many days are moved to the
+    # archive by `flask archive-posts`, this many per batch
+    ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '365'))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+    
+    # Diagnostics: the token unlocks /api/diagnostics and per-request
+    # profiling (`X-Profile: <token>`); a PROFILE_SAMPLE_RATE fraction of all
+    # requests is profiled too. PROFILE_MODE is 'cprofile' (pstats) or
+    # 'sample' (collapsed stacks, sampled every PROFILE_SAMPLE_INTERVAL
+    # seconds); the newest PROFILE_KEEP results are kept in PROFILE_DIR
+    # (default <instance>/profiles)
+    DIAGNOSTICS_TOKEN = os.environ.get('DIAGNOSTICS_TOKEN')
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+    PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', '0.005'))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', '200'))
+    # Memory diagnostics (also needs DIAGNOSTICS_TOKEN): fraction of requests
+    # whose RSS growth and peak allocation are recorded per endpoint, and how
+    # often a point is added to the RSS timeline
+    MEMORY_SAMPLE_RATE = float(os.environ.get('MEMORY_SAMPLE_RATE', '0'))
+    MEMORY_RSS_INTERVAL = float(os.environ.get('MEMORY_RSS_INTERVAL', '60'))
+    
+    # Logging: JSON lines on stderr, written by a background thread (set
+    # LOG_STRUCTURED=0 for Flask's default handler). LOG_LEVELS sets levels per
+    # logger, e.g. "app.oauth_handler=DEBUG,sqlalchemy.engine=INFO"; only a
+    # LOG_DEBUG_SAMPLE_RATE fraction of requests keeps its debug records
+    LOG_STRUCTURED = os.environ.get('LOG_STRUCTURED', '1') == '1'
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+    LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1'))
+    
+    # Post bodies of at least POST_COMPRESS_MIN_BYTES are stored compressed
+    # (SQLite only): 'zstd' (needs zstandard, else zlib), 'zlib' or 'none'.
+    # Existing rows are converted one batch every POST_COMPRESS_BACKFILL_SECONDS
+    # (0 disables it; see `flask posts-compress`)
+    POST_COMPRESSION = os.environ.get('POST_COMPRESSION', 'zstd')
+    POST_COMPRESS_MIN_BYTES = int(os.environ.get('POST_COMPRESS_MIN_BYTES', '1024'))
+    POST_COMPRESSION_LEVEL = int(os.environ['POST_COMPRESSION_LEVEL']) if os.environ.get('POST_COMPRESSION_LEVEL') else None
+    POST_COMPRESS_BATCH_SIZE = int(os.environ.get('POST_COMPRESS_BATCH_SIZE', '200'))
+    POST_COMPRESS_BACKFILL_SECONDS = float(os.environ.get('POST_COMPRESS_BACKFILL_SECONDS', '30'))
+    
+    # Post edits are kept as deltas (app/revisions.py) with the whole text
+    # stored every POST_REVISION_SNAPSHOT_INTERVAL versions, which bounds the
+    # edits replayed to rebuild one version
+    POST_REVISION_SNAPSHOT_INTERVAL = int(os.environ.get('POST_REVISION_SNAPSHOT_INTERVAL', '20'))
+    
+    # Ids accepted by one multi-get (?ids=1,2,3) and sub-requests by one
+    # POST /api/batch
+    MULTI_GET_MAX_IDS = int(os.environ.get('MULTI_GET_MAX_IDS', '100'))
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+    
+    # /api/health/ready re-runs its dependency checks at most once per
+    # READINESS_CACHE_SECONDS per worker; SMTP is probed with this timeout
+    READINESS_CACHE_SECONDS = float(os.environ.get('READINESS_CACHE_SECONDS', '5'))
+    READINESS_SMTP_TIMEOUT = float(os.environ.get('READINESS_SMTP_TIMEOUT', '3'))
+    
+    # Daily site stats: every STATS_CATCHUP_SECONDS the last STATS_CATCHUP_DAYS
+    # days are recounted from the source tables (0 leaves it to
+    # `flask stats-catchup`). GET /api/admin/stats needs ADMIN_TOKEN in the
+    # X-Admin-Token header and serves at most STATS_MAX_DAYS days per query
+    STATS_CATCHUP_SECONDS = float(os.environ.get('STATS_CATCHUP_SECONDS', '3600'))
+    STATS_CATCHUP_DAYS = int(os.environ.get('STATS_CATCHUP_DAYS', '2'))
+    STATS_MAX_DAYS = int(os.environ.get('STATS_MAX_DAYS', '366'))
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
     
     # CORS Configuration
     CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000').split(',')
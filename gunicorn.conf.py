@@ -0,0 +1,62 @@
+"""Gunicorn configuration for running the API in production.
+
+Usage:
+    gunicorn -c gunicorn.conf.py run:app
+
+Deploy new code without dropping requests (the app is preloaded in the
+master, so HUP would only re-fork workers from the code already loaded):
+    OLD=$(cat gunicorn.pid)
+    kill -USR2 $OLD    # new master re-imports the app and starts its workers
+    kill -WINCH $OLD   # once they answer: old workers drain and exit
+    kill -QUIT $OLD    # old master exits; the new one takes over gunicorn.pid
+
+With GUNICORN_PRELOAD=0, workers import the app themselves and
+``kill -HUP $(cat gunicorn.pid)`` reloads new code gracefully as well.
+
+Every setting can be overridden through the environment (see .env.example).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Import the app once in the master so workers share its memory copy-on-write;
+# deploys then need USR2 rather than HUP (see above)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# Recycle workers after N requests; the jitter keeps them from restarting together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+pidfile = os.environ.get('GUNICORN_PIDFILE', 'gunicorn.pid')
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+
+
+def post_fork(server, worker):
+    """Drop DB connections inherited from the master.
+
+    With ``preload_app`` the master may have opened pooled connections (e.g.
+    during ``db.create_all()``); sharing those sockets across processes
+    corrupts them, so each worker starts with an empty pool.
+    """
+    from app import db
+    from run import app
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    server.log.info('Worker %s: database engines disposed after fork', worker.pid)
+
+
+def on_reload(server):
+    """Warn that HUP cannot pick up a deploy while the app is preloaded."""
+    if server.cfg.preload_app:
+        server.log.warning('HUP re-forks workers from the app loaded in the master; '
+                           'new code needs USR2, then WINCH and QUIT on the old master')
@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+import pytest
+
+# Config reads the environment at import time: point it at a throwaway
+# database and keep background jobs quiet before the app is imported
+_tmp = tempfile.TemporaryDirectory()
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp.name, 'test.db')}"
+# Two more SQLite files as post shards, so every test also goes through the
+# routing in app/sharding.py
+os.environ['POST_SHARD_URLS'] = ','.join(
+    f"sqlite:///{os.path.join(_tmp.name, f'shard{n}.db')}" for n in (1, 2))
+os.environ.pop('ARCHIVE_DATABASE_URL', None)
+os.environ['TRENDING_REFRESH_SECONDS'] = '0'
+os.environ['VIEW_COUNTER_FLUSH_SECONDS'] = '0'
+os.environ['POST_COMPRESS_BACKFILL_SECONDS'] = '0'
+os.environ['STATS_CATCHUP_SECONDS'] = '0'
+os.environ['SSE_NOTIFY_DIR'] = ''
+os.environ['LOG_LEVEL'] = 'WARNING'
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
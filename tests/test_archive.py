@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.archive import archive_posts
+from app.models import ArchivedPost, PostRevision, User
+from app.sharding import get_post
+
+
+@pytest.fixture
+def author(app, client):
+    with app.app_context():
+        user = User(username='archivist', email='archivist@example.com', email_verified=True)
+        user.set_password('Secret123!')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    response = client.post('/api/auth/login', json={'email': 'archivist@example.com',
+                                                    'password': 'Secret123!'})
+    yield {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    with app.app_context():
+        db.session.execute(db.delete(User).where(User.id == user_id))
+        db.session.commit()
+
+
+def test_deleting_an_archived_post_removes_it_and_its_history(app, client, author):
+    response = client.post('/api/posts', headers=author, json={'title': 'Old news',
+                                                                'content': 'Nobody reads this.'})
+    post_id = response.get_json()['id']
+    with app.app_context():
+        post = get_post(post_id)
+        post.created_at = post.updated_at = datetime.utcnow() - timedelta(days=400)
+        db.session.commit()
+        assert archive_posts(365) == 1
+
+    assert client.delete(f'/api/posts/{post_id}', headers=author).status_code == 200
+
+    with app.app_context():
+        assert db.session.get(ArchivedPost, post_id) is None
+        assert not db.session.scalars(db.select(PostRevision).where(PostRevision.post_id == post_id)).all()
@@ -0,0 +1,33 @@
+import pytest
+
+from app import db
+from app.feeds import feed_cache
+from app.models import Post, User
+from app.sharding import get_post
+
+
+@pytest.fixture
+def post_id(app):
+    with app.app_context():
+        user = User(username='mapped', email='mapped@example.com', email_verified=True)
+        db.session.add(user)
+        db.session.flush()
+        post = Post(title='On the map', content='Listed in the sitemap.', published=True, user_id=user.id)
+        db.session.add(post)
+        db.session.commit()
+        yield post.id
+        db.session.delete(get_post(post.id))
+        db.session.execute(db.delete(User).where(User.id == user.id))
+        db.session.commit()
+
+
+def test_sitemap_shards_without_posts_are_404_and_not_cached(app, client, post_id):
+    size = app.config['SITEMAP_SHARD_SIZE']
+    shard = (post_id - 1) // size
+    response = client.get(f'/sitemaps/posts-{shard}.xml')
+    assert response.status_code == 200
+    assert f'/posts/{post_id}<'.encode() in response.data
+
+    for empty in (shard + 1, 10 ** 9):
+        assert client.get(f'/sitemaps/posts-{empty}.xml').status_code == 404
+        assert ('sitemap', empty) not in feed_cache._docs
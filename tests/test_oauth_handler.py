@@ -0,0 +1,47 @@
+from itertools import chain, repeat
+
+import pytest
+
+from app import db
+from app.models import User
+from app.oauth_handler import OAuthHandler, secrets
+
+
+@pytest.fixture
+def taken(app):
+    """Every numbered and provider-id candidate for ``dup`` / provider id 7 is taken."""
+    names = ['dup'] + [f'dup_{n}' for n in range(1, OAuthHandler.USERNAME_CANDIDATES)] + ['dup_7_aaaaaa']
+    with app.app_context():
+        db.session.add_all(User(username=name, email=f'{name}@example.com') for name in names)
+        db.session.commit()
+        yield
+        db.session.execute(db.delete(User).where(User.username.in_(names)))
+        db.session.commit()
+
+
+@pytest.fixture
+def queries(monkeypatch):
+    calls = []
+    first_free = OAuthHandler._first_free_username
+
+    def counted(candidates):
+        calls.append(candidates)
+        return first_free(candidates)
+
+    monkeypatch.setattr(OAuthHandler, '_first_free_username', staticmethod(counted))
+    return calls
+
+
+def test_random_fallback_takes_one_query_per_batch(app, taken, queries, monkeypatch):
+    suffixes = chain(repeat('aaaaaa', OAuthHandler.USERNAME_CANDIDATES), repeat('bbbbbb'))
+    monkeypatch.setattr(secrets, 'token_hex', lambda n: next(suffixes))
+    with app.app_context():
+        assert OAuthHandler.create_unique_username('dup', '7') == 'dup_7_bbbbbb'
+    assert len(queries) == 3
+
+
+def test_username_allocation_gives_up_after_a_fixed_number_of_queries(app, taken, queries, monkeypatch):
+    monkeypatch.setattr(secrets, 'token_hex', lambda n: 'aaaaaa')
+    with app.app_context(), pytest.raises(ValueError):
+        OAuthHandler.create_unique_username('dup', '7')
+    assert len(queries) == 1 + OAuthHandler.USERNAME_RANDOM_BATCHES
@@ -0,0 +1,37 @@
+import pytest
+
+from app import db
+from app.models import Post, User
+from app.revisions import apply_edit, get_revision, list_revisions, record_revision
+from app.sharding import get_post
+
+
+@pytest.fixture
+def post_id(app):
+    with app.app_context():
+        user = User(username='reviser', email='reviser@example.com', email_verified=True)
+        user.set_password('Secret123!')
+        db.session.add(user)
+        db.session.flush()
+        post = Post(title='First draft', content='Some words here.', user_id=user.id)
+        db.session.add(post)
+        db.session.flush()
+        record_revision(post, user_id=user.id)
+        db.session.commit()
+        yield post.id
+        db.session.expire_all()  # the test edited it from another session
+        db.session.delete(get_post(post.id))
+        db.session.execute(db.delete(User).where(User.id == user.id))
+        db.session.commit()
+
+
+def test_apply_edit_bumps_the_version_and_records_it(app, post_id):
+    with app.app_context():
+        post = get_post(post_id)
+        apply_edit(post, 'Second draft', 'Some other words here.', True, post.user_id)
+        db.session.commit()
+
+        assert post.version == 2
+        assert [row.version for row in list_revisions(post_id)] == [2, 1]
+        assert get_revision(post_id, 1)['title'] == 'First draft'
+        assert get_revision(post_id, 2)['content'] == 'Some other words here.'
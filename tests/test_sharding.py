@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, sharding
+from app.models import Post, PostLocator, PostStats, User
+from app.sharding import home_shard, move_author, post_shards
+from app.view_counter import view_counter
+
+
+@pytest.fixture
+def authors(app, client):
+    """Three authors with consecutive ids, so each has a different home shard."""
+    with app.app_context():
+        users = [User(username=f'sharded{n}', email=f'sharded{n}@example.com', email_verified=True)
+                 for n in range(3)]
+        for user in users:
+            user.set_password('Secret123!')
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+    headers = []
+    for n in range(3):
+        response = client.post('/api/auth/login', json={'email': f'sharded{n}@example.com',
+                                                        'password': 'Secret123!'})
+        headers.append({'Authorization': f"Bearer {response.get_json()['access_token']}"})
+    yield list(zip(user_ids, headers))
+    with app.app_context():
+        for user_id in user_ids:
+            with post_shards.using(home_shard(user_id)):
+                for post in db.session.scalars(db.select(Post).where(Post.user_id == user_id)):
+                    db.session.delete(post)
+                db.session.commit()
+        db.session.execute(db.delete(User).where(User.id.in_(user_ids)))
+        db.session.commit()
+
+
+def _posts_on(shard, user_id):
+    with post_shards.using(shard):
+        return sorted(db.session.scalars(db.select(Post.id).where(Post.user_id == user_id)))
+
+
+def _add_posts(authors, count):
+    """``count`` published posts, created a minute apart round-robin over ``authors``."""
+    start = datetime.utcnow() - timedelta(hours=1)
+    ids = []
+    for n in range(count):
+        post = Post(title=f'Post {n}', content=f'Body of post number {n}.', published=True,
+                    user_id=authors[n % len(authors)][0], created_at=start + timedelta(minutes=n))
+        db.session.add(post)
+        db.session.commit()  # a flush writes to a single shard
+        ids.append(post.id)
+    return ids
+
+
+def _feed_ids(client, ours):
+    ids, page = [], 1
+    while True:
+        body = client.get(f'/api/posts?page={page}&per_page=4').get_json()
+        ids += [post['id'] for post in body['posts'] if post['id'] in ours]
+        if not body['pagination']['has_next']:
+            return ids
+        page += 1
+
+
+def test_posts_are_written_to_and_read_from_the_author_home_shard(app, client, authors):
+    assert post_shards.count == 3
+    posted = {}
+    for user_id, headers in authors:
+        response = client.post('/api/posts', headers=headers,
+                               json={'title': f'By {user_id}', 'content': f'Written by user {user_id}.'})
+        assert response.status_code == 201
+        posted[user_id] = response.get_json()['id']
+
+    with app.app_context():
+        shards = {home_shard(user_id) for user_id, _ in authors}
+        assert shards == {0, 1, 2}
+        for user_id, post_id in posted.items():
+            assert _posts_on(home_shard(user_id), user_id) == [post_id]
+            assert db.session.get(PostLocator, post_id).user_id == user_id
+    for user_id, headers in authors:
+        response = client.get(f'/api/posts/{posted[user_id]}', headers=headers)
+        assert response.status_code == 200
+        assert response.get_json()['title'] == f'By {user_id}'
+
+
+def test_feed_merges_shards_newest_first(app, client, authors):
+    with app.app_context():
+        ids = _add_posts(authors, 7)
+    assert _feed_ids(client, set(ids)) == ids[::-1]
+
+
+def test_moving_an_author_keeps_posts_views_and_feed_order(app, client, authors, monkeypatch):
+    user_id, headers = authors[0]
+    with app.app_context():
+        ids = _add_posts(authors, 6)
+        mine = sorted(ids[0::3])
+        source = home_shard(user_id)
+    target = (source + 1) % post_shards.count
+
+    copy_posts = sharding._copy_posts
+
+    def copy_with_views(user_id, source, target, views, since=None):
+        # Views flushed while the move runs: to the old shard before the
+        # switch, to the new one after it
+        for post_id in mine:
+            view_counter.record(post_id)
+        view_counter.flush()
+        return copy_posts(user_id, source, target, views, since)
+
+    monkeypatch.setattr(sharding, '_copy_posts', copy_with_views)
+    with app.app_context():
+        assert move_author(user_id, target) == len(mine)
+        db.session.expire_all()
+        assert home_shard(user_id) == target
+        assert _posts_on(target, user_id) == mine
+        assert _posts_on(source, user_id) == []
+        with post_shards.using(target):
+            views = dict(db.session.execute(
+                db.select(PostStats.post_id, PostStats.views).where(PostStats.post_id.in_(mine))).all())
+        assert views == {post_id: 2 for post_id in mine}
+
+    assert client.get(f'/api/posts/{mine[0]}', headers=headers).status_code == 200
+    assert _feed_ids(client, set(ids)) == ids[::-1]
@@ -0,0 +1,58 @@
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app import db
+from app.models import User
+from app.token_blocklist import TokenBlocklist
+
+
+def _iat(value):
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+@pytest.fixture
+def user(app):
+    with app.app_context():
+        user = User(username='blocklist', email='blocklist@example.com', email_verified=True)
+        user.set_password('Secret123!')
+        db.session.add(user)
+        db.session.commit()
+        yield user.id
+        db.session.execute(db.delete(User).where(User.id == user.id))
+        db.session.commit()
+
+
+def _login(client):
+    response = client.post('/api/auth/login', json={'email': 'blocklist@example.com',
+                                                    'password': 'Secret123!'})
+    assert response.status_code == 200
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_revoke_all_cutoff_orders_tokens_within_the_second():
+    blocklist = TokenBlocklist()
+    blocklist._next_refresh = float('inf')  # no database here
+    revoked_at = datetime(2026, 1, 1, 12, 0, 0, 400000)
+    blocklist._apply(None, 7, revoked_at, None)
+
+    second = _iat(datetime(2026, 1, 1, 12, 0, 0))
+    before, after = (second * 1000 + 399, second * 1000 + 401)
+    assert blocklist.is_revoked({'sub': 7, 'iat': second, 'iat_ms': before})
+    assert not blocklist.is_revoked({'sub': 7, 'iat': second, 'iat_ms': after})
+    # Without the claim a token from that second cannot be told apart: revoked
+    assert blocklist.is_revoked({'sub': 7, 'iat': second})
+    assert not blocklist.is_revoked({'sub': 7, 'iat': second + 1})
+
+
+def test_revoke_all_in_the_same_second_as_logins(client, user):
+    # Start on a fresh second so the logins, the revoke and the re-login share one
+    time.sleep(1 - time.time() % 1 + 0.01)
+    stolen, this_session = _login(client), _login(client)
+    assert client.post('/api/auth/revoke-all', headers=this_session).status_code == 200
+    relogin = _login(client)
+
+    assert client.get('/api/auth/me', headers=relogin).status_code == 200
+    assert client.get('/api/auth/me', headers=stolen).status_code == 401
+    assert client.get('/api/auth/me', headers=this_session).status_code == 401
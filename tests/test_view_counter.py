@@ -0,0 +1,34 @@
+import pytest
+
+from app import db
+from app.models import Post, User
+from app.sharding import get_post
+from app.view_counter import view_counter
+
+
+@pytest.fixture
+def post_id(app):
+    with app.app_context():
+        user = User(username='viewed', email='viewed@example.com', email_verified=True)
+        db.session.add(user)
+        db.session.flush()
+        post = Post(title='Popular', content='Read it again.', published=True, user_id=user.id)
+        db.session.add(post)
+        db.session.commit()
+        yield post.id
+        db.session.delete(get_post(post.id))
+        db.session.execute(db.delete(User).where(User.id == user.id))
+        db.session.commit()
+
+
+def test_full_buffer_is_flushed_inline_without_a_flusher_thread(app, post_id, monkeypatch):
+    assert not app.config['VIEW_COUNTER_FLUSH_SECONDS']
+    monkeypatch.setattr(view_counter, 'max_pending', 3)
+    view_counter.flush()
+
+    for _ in range(3):
+        view_counter.record(post_id)
+
+    assert view_counter.pending(post_id) == 0
+    with app.app_context():
+        assert get_post(post_id).stats.views == 3